@@ -6,6 +6,8 @@ Usage examples:
 - python -m media_downloader rarbg
 - python -m media_downloader porn
 - python -m media_downloader bitmagnet
+- python -m media_downloader bench rarbg
+- python -m media_downloader state summary
 """
 import argparse
 import runpy
@@ -18,6 +20,8 @@ MODULE_MAP: Dict[str, str] = {
     "rarbg": "media_downloader.rarbg",
     "porn": "media_downloader.porn",
     "bitmagnet": "media_downloader.bitmagnet",
+    "bench": "media_downloader.bench",
+    "state": "media_downloader.utils.state.importer",
 }
 
 
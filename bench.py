@@ -0,0 +1,494 @@
+"""Offline throughput benchmark for the downloaders.
+
+Usage examples:
+- python -m media_downloader bench rarbg
+- python -m media_downloader bench yts --latency 0.05 --error-rate 0.1
+- python -m media_downloader bench porn --fixtures fixtures/porn --url https://...
+- python -m media_downloader bench bitmagnet --latency 0.05
+
+Every request goes to a local replay server answering from a fixture archive,
+either one recorded with `record_directory` or a synthetic one generated on the
+fly. The replay server runs in a child process, so the CPU time reported per
+stage is the downloader's own. bitmagnet is measured against a stand-in for
+its GraphQL API (`utils/bitmagnet_api.py`) instead.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import rarbg, yts, porn, images, bitmagnet
+from .utils.request import HttpClient, retry_request
+from .utils.ratelimit import RateLimiter
+from .utils.retry import RetryPolicy
+from .utils.metrics import Metrics
+from .utils.replay import FixtureArchive, Replay, serve, STATS_PATH
+from .utils.magnets import open_store
+from .utils import bitmagnet_api
+from .utils.extract import ENGINES, Extractor, set_default_extractor
+
+MANIFEST_NAME = "bench.json"
+USER_AGENT = "MediaDownloader-Bench/1.0"
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# --- Synthetic fixtures ---
+
+
+def synthesize_rarbg(archive, pages, items):
+    base_url = "https://rarbg.bench/"
+    seeds = []
+    for page in range(1, pages + 1):
+        rows = []
+        for item in range(items):
+            slug = f"torrent/{page}-{item}"
+            rows.append(
+                f'<tr class="table2ta"><td>{item}</td><td><a href="/{slug}">Item {page}-{item}</a></td></tr>'
+            )
+            info_hash = f"{page:020d}{item:020d}"
+            archive.add(
+                urljoin(base_url, slug),
+                "<html><body><table><tr>"
+                f'<td class="tlista"><a href="magnet:?xt=urn:btih:{info_hash}&dn=Item+{page}-{item}">Magnet</a></td>'
+                f'<td class="block"><b><h1 class="black">Item {page}-{item}</h1></b></td>'
+                "</tr></table></body></html>",
+            )
+        url = f"xxx/{page}/"
+        archive.add(
+            urljoin(base_url, url),
+            f"<html><body><table>{''.join(rows)}</table></body></html>",
+        )
+        seeds.append(url)
+    return {"base_urls": [base_url], "seeds": seeds}
+
+
+def synthesize_yts(archive, pages, items):
+    base_url = "https://yts.bench/"
+    seeds = []
+    for page in range(1, pages + 1):
+        links = []
+        for item in range(items):
+            movie_url = f"{base_url}movies/movie-{page}-{item}"
+            download_url = f"{base_url}torrent/download/{page:04d}{item:04d}"
+            links.append(f'<div class="browse-movie-wrap"><a href="{movie_url}">Movie</a></div>')
+            archive.add(
+                movie_url,
+                f'<html><body><div id="movie-info"><p><a href="{download_url}">1080p</a></p></div></body></html>',
+            )
+            archive.add(
+                download_url,
+                b"d8:announce0:e" + os.urandom(2048),
+                headers={
+                    "Content-Type": "application/x-bittorrent",
+                    "Content-Disposition": (
+                        f'attachment; filename="Movie {page}-{item} (2020) [1080p] [BluRay] [YTS.MX].torrent"'
+                    ),
+                },
+            )
+        url = "browse-movies/0/1080p/all/0/featured/0/en"
+        if page != 1:
+            url += f"?page={page}"
+        archive.add(
+            urljoin(base_url, url), f"<html><body>{''.join(links)}</body></html>"
+        )
+        seeds.append(url)
+    return {"base_urls": [base_url], "seeds": seeds}
+
+
+def synthesize_porn(archive, pages, items):
+    base_url = "https://porn.bench/"
+    seeds = []
+    for page in range(1, pages + 1):
+        links = "".join(
+            f'<span class="title"><a href="/view/{page}-{item}">Video</a></span>'
+            for item in range(items)
+        )
+        url = f"{base_url}video?page={page}"
+        archive.add(url, f"<html><body>{links}</body></html>")
+        seeds.append(url)
+    return {"video_location": "span.title a", "seeds": seeds}
+
+
+def synthesize_images(archive, pages, items):
+    base_url = "https://images.bench/babes/"
+    seeds = []
+    image = b"\xff\xd8\xff\xe0" + os.urandom(16 * 1024)
+    for page in range(1, pages + 1):
+        galleries = []
+        for item in range(items):
+            gallery_url = f"{base_url}2024/01/{page:02d}/gallery-{page}-{item}/"
+            galleries.append(f'<h1 class="zag_block"><a href="{gallery_url}">Gallery</a></h1>')
+            image_tags = []
+            for number in range(5):
+                image_url = f"{gallery_url}{number}.jpg"
+                image_tags.append(f'<div class="imgbox"><img src="{image_url}"></div>')
+                archive.add(image_url, image, headers={"Content-Type": "image/jpeg"})
+            archive.add(
+                gallery_url,
+                f'<html><body><h1 class="zag_block">Gallery {page}-{item} (5 PICS)</h1>'
+                f"{''.join(image_tags)}</body></html>",
+            )
+        url = f"{base_url}page/{page}/"
+        archive.add(url, f"<html><body>{''.join(galleries)}</body></html>")
+        seeds.append(url)
+    return {"seeds": seeds}
+
+
+def synthesize_bitmagnet(archive, pages, items):
+    # Served by the GraphQL stand-in, not from the archive
+    return {
+        "seeds": ["http://bitmagnet.bench/graphql"],
+        "torrents": pages * items * 50,
+        "queries": ["synthetic", "vr", "2160p"],
+    }
+
+
+SYNTHESIZERS = {
+    "rarbg": synthesize_rarbg,
+    "yts": synthesize_yts,
+    "porn": synthesize_porn,
+    "images": synthesize_images,
+    "bitmagnet": synthesize_bitmagnet,
+}
+
+
+# --- Stages ---
+# Each stage takes (client, manifest, workdir, concurrency) and returns the
+# number of items it produced.
+
+
+def rarbg_detail_pages(client, manifest, workdir, concurrency):
+    rarbg.http_client = client
+    link_urls = []
+    for seed in manifest["seeds"]:
+        response = retry_request(seed, USER_AGENT, None, 5, 0, manifest["base_urls"], client)
+        if response is not None:
+            soup = BeautifulSoup(response.content, "html.parser")
+            link_urls.extend(
+                link["href"] for link in soup.select("tr.table2ta > td:nth-child(2) > a")
+            )
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = executor.map(
+            lambda link_url: rarbg.fetch_detail_page(
+                link_url, manifest["base_urls"], USER_AGENT
+            ),
+            link_urls,
+        )
+        return sum(1 for _, magnet_link, title in results if magnet_link and title)
+
+
+def rarbg_crawl(client, manifest, workdir, concurrency):
+    rarbg.http_client = client
+    rarbg.concurrency = concurrency
+    magnet_file = os.path.join(workdir, "Magnets.txt")
+    for seed in manifest["seeds"]:
+        rarbg.parse_website(seed, manifest["base_urls"], magnet_file, USER_AGENT)
+    magnet_store = open_store(magnet_file)
+    magnet_store.commit()
+    return magnet_store.stored
+
+
+def yts_crawl(client, manifest, workdir, concurrency):
+    yts.http_client = client
+    yts.total_downloads = 0
+    for page_number, seed in enumerate(manifest["seeds"], 1):
+        yts.parse_website(
+            manifest["base_urls"],
+            seed,
+            "ENGLISH",
+            os.path.join(workdir, "Alternative"),
+            os.path.join(workdir, "Downloads"),
+            page_number,
+            USER_AGENT,
+        )
+    return yts.total_downloads
+
+
+def porn_listing(client, manifest, workdir, concurrency):
+    porn.http_client = client
+
+    def scrape(page):
+        page_number, seed = page
+        response = retry_request(seed, USER_AGENT, None, 3, 0, client=client)
+        if response is None:
+            return 0
+        links = porn.get_video_links(
+            seed, response, page_number, manifest["video_location"], []
+        )
+        return len(links or [])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return sum(executor.map(scrape, enumerate(manifest["seeds"], 1)))
+
+
+def images_overview(client, manifest, workdir, concurrency):
+    manifest["galleries"] = []
+    for seed in manifest["seeds"]:
+        soup, actual_url = images.get_soup(seed, client)
+        if soup is None:
+            continue
+        for element in soup.select(images.GALLERY_LINK_SELECTOR):
+            if element.get("href"):
+                manifest["galleries"].append(urljoin(actual_url, element["href"].strip()))
+    return len(manifest["galleries"])
+
+
+def images_galleries(client, manifest, workdir, concurrency):
+    manifest["images"] = []
+    for gallery_url in manifest.get("galleries", []):
+        soup, actual_url = images.get_soup(gallery_url, client.fork())
+        if soup is None:
+            continue
+        for element in soup.select(images.IMAGE_SELECTOR):
+            if element.get("src"):
+                manifest["images"].append(urljoin(actual_url, element["src"]))
+    return len(manifest["images"])
+
+
+def images_download(client, manifest, workdir, concurrency):
+    def download(numbered):
+        number, img_url = numbered
+        extension = os.path.splitext(urlparse(img_url).path)[1] or ".jpg"
+        save_path = os.path.join(workdir, f"{number:06d}{extension}")
+        return images.download_image(img_url, save_path, client) is not None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return sum(executor.map(download, enumerate(manifest.get("images", []))))
+
+
+def bitmagnet_queries(manifest, workdir, page_size, workers):
+    bitmagnet.api_page_size = page_size
+    bitmagnet.api_workers = workers
+    bitmagnet.api_rate_limit = 0
+    magnet_file = os.path.join(workdir, "Magnets.txt")
+    bitmagnet.parse_api([manifest["api_url"]], magnet_file, 0, manifest["queries"])
+    return open_store(magnet_file).stored
+
+
+def bitmagnet_ui_pages(client, manifest, workdir, concurrency):
+    # Page size and order of the web UI, without the browser
+    return bitmagnet_queries(manifest, workdir, 10, 1)
+
+
+def bitmagnet_api_pages(client, manifest, workdir, concurrency):
+    return bitmagnet_queries(manifest, workdir, 500, concurrency)
+
+
+STAGES = {
+    "rarbg": [("detail_pages", rarbg_detail_pages), ("crawl", rarbg_crawl)],
+    "yts": [("crawl", yts_crawl)],
+    "porn": [("listing", porn_listing)],
+    "bitmagnet": [("ui_pages", bitmagnet_ui_pages), ("api_pages", bitmagnet_api_pages)],
+    "images": [
+        ("overview", images_overview),
+        ("galleries", images_galleries),
+        ("download", images_download),
+    ],
+}
+
+
+# --- Runner ---
+
+
+def served(base_url):
+    stats = requests.get(base_url + STATS_PATH, timeout=5).json()
+    return stats["served"] + stats["missing"] + stats["errors"]
+
+
+def run_stage(name, stage, client, manifest, workdir, concurrency, base_url, verbose):
+    pages_before = served(base_url)
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        items = stage(client, manifest, workdir, concurrency)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    pages = served(base_url) - pages_before
+    return {
+        "stage": name,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "pages": pages,
+        "items": items,
+        "pages_per_second": round(pages / wall, 2) if wall > 0 else None,
+        "items_per_second": round(items / wall, 2) if wall > 0 else None,
+        "peak_rss_bytes": peak_rss(),
+    }
+
+
+def format_report(downloader, results):
+    lines = [
+        f"Benchmark: {downloader}",
+        f"{'stage':<14}{'wall s':>9}{'cpu s':>9}{'pages':>8}{'items':>8}"
+        f"{'pages/s':>10}{'items/s':>10}{'peak RSS MiB':>14}",
+    ]
+    for result in results:
+        rss = result["peak_rss_bytes"]
+        lines.append(
+            f"{result['stage']:<14}{result['wall_seconds']:>9.3f}{result['cpu_seconds']:>9.3f}"
+            f"{result['pages']:>8}{result['items']:>8}"
+            f"{result['pages_per_second'] or 0:>10.2f}{result['items_per_second'] or 0:>10.2f}"
+            f"{(rss / 1024**2 if rss else 0):>14.1f}"
+        )
+    return "\n".join(lines)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="MediaDownloader offline benchmark")
+    parser.add_argument("downloader", choices=STAGES.keys(), help="Which downloader to benchmark")
+    parser.add_argument(
+        "--fixtures",
+        type=str,
+        help="Fixture archive directory (default: generate synthetic fixtures)",
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        help="Seed URL inside the archive, repeatable (default: from bench.json)",
+    )
+    parser.add_argument("--pages", type=int, default=5, help="Synthetic listing pages")
+    parser.add_argument("--items", type=int, default=20, help="Synthetic items per page")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of requests answered with 503"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads")
+    parser.add_argument(
+        "--html-engine", choices=("auto",) + ENGINES, default="auto", help="HTML engine"
+    )
+    parser.add_argument(
+        "--verify", action="store_true", help="Cross-check the engine against html.parser"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show downloader output")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "bench":
+        argv = argv[1:]
+    args = create_parser().parse_args(argv)
+    extractor = Extractor(args.html_engine, verify=args.verify)
+    set_default_extractor(extractor)
+
+    workdir = tempfile.mkdtemp(prefix="media-downloader-bench-")
+    try:
+        fixtures = args.fixtures
+        manifest = {}
+        if fixtures is None:
+            fixtures = os.path.join(workdir, "fixtures")
+            archive = FixtureArchive(fixtures)
+            manifest = SYNTHESIZERS[args.downloader](archive, args.pages, args.items)
+            archive.save()
+        elif os.path.exists(os.path.join(fixtures, MANIFEST_NAME)):
+            with open(os.path.join(fixtures, MANIFEST_NAME), "r", encoding="utf-8") as file:
+                manifest = json.load(file).get(args.downloader, {})
+        if args.url:
+            manifest["seeds"] = args.url
+        if not manifest.get("seeds"):
+            print(f"No seed URLs for {args.downloader}; pass --url or add {MANIFEST_NAME}.")
+            return 1
+        manifest.setdefault(
+            "base_urls",
+            [f"{urlparse(manifest['seeds'][0]).scheme}://{urlparse(manifest['seeds'][0]).netloc}/"],
+        )
+        manifest.setdefault("video_location", "a")
+
+        ready = multiprocessing.Queue()
+        if args.downloader == "bitmagnet":
+            server = multiprocessing.Process(
+                target=bitmagnet_api.serve,
+                args=(manifest["torrents"], 0, args.latency, ready),
+                daemon=True,
+            )
+        else:
+            server = multiprocessing.Process(
+                target=serve,
+                args=(fixtures, 0, args.latency, args.jitter, args.error_rate, ready),
+                daemon=True,
+            )
+        server.start()
+        base_url = ready.get(timeout=30)
+        manifest["api_url"] = base_url
+
+        client = HttpClient(
+            user_agent=USER_AGENT,
+            pool_connections=max(10, args.concurrency),
+            pool_maxsize=max(10, args.concurrency),
+            rate_limiter=RateLimiter(),
+            retry_policy=RetryPolicy(backoff_base=0.05, backoff_max=0.5),
+            metrics=Metrics(),
+            replay=Replay(base_url),
+        )
+        results = []
+        try:
+            for name, stage in STAGES[args.downloader]:
+                stage_dir = os.path.join(workdir, name)
+                os.makedirs(stage_dir, exist_ok=True)
+                results.append(
+                    run_stage(
+                        name,
+                        stage,
+                        client,
+                        manifest,
+                        stage_dir,
+                        args.concurrency,
+                        base_url,
+                        args.verbose,
+                    )
+                )
+        finally:
+            client.close()
+            server.terminate()
+            server.join()
+
+        if args.json:
+            print(
+                json.dumps(
+                    {
+                        "downloader": args.downloader,
+                        "html_engine": extractor.engine,
+                        "html_mismatches": extractor.mismatches,
+                        "stages": results,
+                    },
+                    indent=2,
+                )
+            )
+        else:
+            print(format_report(args.downloader, results))
+            print(f"HTML engine: {extractor.engine}, mismatches: {extractor.mismatches}")
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
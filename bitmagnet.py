@@ -1,21 +1,21 @@
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlparse
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
+import requests
 from bs4 import BeautifulSoup
 
 from .utils.parser import create_parser
 from .utils.config import read_configuration
 from .utils.output import initialize_logs, output, Level
+from .utils.ratelimit import RateLimiter
+from .utils.metrics import get_metrics
+from .utils.magnets import open_store
+from .utils.bitmagnet_api import BitmagnetApi, GraphQLError
 
 # Global config variables
 file_name = "bitmagnet.yml"
@@ -29,11 +29,37 @@ include_one = None
 include_all = None
 exclude_one = None
 exclude_all = None
+rate_limit = 0.2
+rate_burst = 1
+backend = "auto"  # graphql, selenium, or auto (graphql, falling back to selenium)
+api_page_size = 500
+api_workers = 4
+api_rate_limit = 0  # Requests/sec against the API (0: no limit)
 
 # Global variables
-total_downloads = 0
 debug_logger = None
 download_logger = None
+rate_limiter = None
+
+
+def store_magnet(magnet_store, link, search_query):
+    """Add a found magnet link to the store if it passes the filters."""
+    matches_query = (
+        not search_query
+        or (search_query and search_query.lower() in link.lower())
+    )
+    if matches_query and "vr" in link.lower():
+        if magnet_store.add(link):
+            message = f"Added magnet link: {link}"
+            output(message, download_logger, Level.SUCCESS)
+        else:
+            message = (
+                f"Magnet link already exists in the file for this torrent: {link}"
+            )
+            output(message, debug_logger, Level.INFO)
+    elif search_query:
+        message = f"Magnet link does not match search query: {link}"
+        output(message, debug_logger, Level.INFO)
 
 
 # Function to get magnet links from the page
@@ -49,7 +75,12 @@ def get_magnet_links(driver):
 
 
 def await_page_load(driver, tag, seconds, old_content=None):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     # Wait until the page is fully loaded
+    started = time.perf_counter()
     time.sleep(1)
     try:
         if old_content:
@@ -63,6 +94,9 @@ def await_page_load(driver, tag, seconds, old_content=None):
             )
         body_text = driver.find_element(By.TAG_NAME, tag).text
         time.sleep(1)
+        get_metrics().observe(
+            urlparse(driver.current_url).netloc, "page_load", time.perf_counter() - started
+        )
         return body_text
     except Exception as e:
         message = f"Error occurred while waiting for the page to load: {e}"
@@ -76,6 +110,14 @@ def parse_website(
     max_pages,
     search_queries=None,
 ):
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.keys import Keys
+
     # Set up Chrome options to suppress logging
     chrome_options = Options()
     chrome_options.add_argument("--log-level=3")
@@ -105,6 +147,9 @@ def parse_website(
     service = Service(str(driver_path))
     driver = webdriver.Chrome(service=service, options=chrome_options)
 
+    # Infohash-indexed store shared with other downloaders writing this file
+    magnet_store = open_store(magnet_file)
+
     # Normalize search queries so index pages can run without a query list.
     search_query_list = search_queries or [None]
 
@@ -113,20 +158,23 @@ def parse_website(
         output(message, debug_logger, Level.INFO)
 
         # Open the webpage
+        rate_limiter.acquire(base_urls[0])
         driver.get(base_urls[0])
 
         # Wait until the page is fully loaded
         body_text = await_page_load(driver, "tbody", 300)
 
         if search_query:
-            # Find the search field and input the search query, then hit enter
-            time.sleep(10)
-            search_field = driver.find_element(
-                By.CSS_SELECTOR, "input[placeholder='Search']"
+            # Find the search field and input the search query, then hit enter.
+            # The results are awaited below by watching the table change.
+            search_field = WebDriverWait(driver, 300).until(
+                EC.element_to_be_clickable(
+                    (By.CSS_SELECTOR, "input[placeholder='Search']")
+                )
             )
+            rate_limiter.acquire(base_urls[0])
             search_field.send_keys(search_query)
             search_field.send_keys(Keys.RETURN)
-            time.sleep(10)
 
         # Loop through pages to collect magnet links
         page_num = 1
@@ -148,40 +196,12 @@ def parse_website(
 
             attempts = 0
             retry_attempts = 5
-            wait_time = 5
-
-            if not os.path.exists(magnet_file):
-                with open(magnet_file, "w") as file:
-                    message = "Created a new file"
-                    output(message, debug_logger, Level.INFO)
-
-            with open(magnet_file, "r") as file:
-                existing_links = file.readlines()
 
             for link in links:
-                matches_query = (
-                    not search_query
-                    or (search_query and search_query.lower() in link.lower())
-                )
-                if matches_query and "vr" in link.lower():
-                    if link + "\n" not in existing_links:
-                        with open(magnet_file, "a") as file:
-                            file.write(f"{link}\n")
-                        message = f"Added magnet link: {link}"
-                        output(message, download_logger, Level.SUCCESS)
-                        global total_downloads
-                        total_downloads += 1
-                    else:
-                        message = (
-                            f"Magnet link already exists in the file for this torrent: {link}"
-                        )
-                        output(message, debug_logger, Level.INFO)
-                elif search_query:
-                    message = f"Magnet link does not match search query: {link}"
-                    output(message, debug_logger, Level.INFO)
+                store_magnet(magnet_store, link, search_query)
 
             while attempts < retry_attempts:
-                time.sleep(wait_time)
+                rate_limiter.acquire(base_urls[0])
                 next_button = driver.find_element(
                     By.CSS_SELECTOR, "button[mattooltip='Next page']"
                 )
@@ -200,9 +220,77 @@ def parse_website(
 
     # Close the WebDriver after scraping
     driver.quit()
+    magnet_store.commit()
+    return True
+
+
+def parse_api(
+    base_urls,
+    magnet_file,
+    max_pages,
+    search_queries=None,
+):
+    """Collect magnet links through bitmagnet's GraphQL API.
+
+    Queries run concurrently (`api_workers`), each paging through its
+    results `api_page_size` at a time. Returns False, without running any
+    query, when the API doesn't answer a first probe; errors after that are
+    raised.
+    """
+
+    api = BitmagnetApi(
+        base_urls[0],
+        page_size=api_page_size,
+        rate_limiter=RateLimiter(rate=api_rate_limit) if api_rate_limit else None,
+        pool_maxsize=max(1, api_workers),
+    )
+    search_query_list = search_queries or [None]
+
+    def crawl_query(search_query):
+        message = f"Using search query: {search_query or 'index page'} (GraphQL API)"
+        output(message, debug_logger, Level.INFO)
+        found = 0
+        for link in api.magnets(search_query, max_pages):
+            found += 1
+            store_magnet(magnet_store, link, search_query)
+        message = f"{found} results for {search_query or 'index page'}"
+        output(message, debug_logger, Level.INFO)
+
+    try:
+        api.search(limit=1)
+    except (requests.exceptions.RequestException, GraphQLError) as e:
+        api.close()
+        message = f"GraphQL API unavailable: {e}"
+        output(message, debug_logger, Level.WARNING)
+        return False
+
+    magnet_store = open_store(magnet_file)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, api_workers)) as executor:
+            for future in [executor.submit(crawl_query, query) for query in search_query_list]:
+                future.result()
+    finally:
+        magnet_store.commit()
+        api.close()
+    message = f"GraphQL requests: {api.requests}"
+    output(message, debug_logger, Level.INFO)
     return True
 
 
+def collect_magnets(base_urls, magnet_file, max_pages, search_queries=None):
+    """Run the configured backend, falling back to the browser in auto mode."""
+    if backend in ("graphql", "auto"):
+        if parse_api(base_urls, magnet_file, max_pages, search_queries):
+            return True
+        if backend == "graphql":
+            message = "GraphQL backend configured, but the API is unavailable"
+            output(message, debug_logger, Level.ERROR)
+            return False
+        message = "Falling back to the web UI"
+        output(message, debug_logger, Level.WARNING)
+    return parse_website(base_urls, magnet_file, max_pages, search_queries)
+
+
 def bitmagnet_downloader():
     # Start timer
     start_time = datetime.now()
@@ -218,10 +306,18 @@ def bitmagnet_downloader():
     global include_all
     global exclude_one
     global exclude_all
+    global rate_limit
+    global rate_burst
+    global search_queries
+    global backend
+    global api_page_size
+    global api_workers
+    global api_rate_limit
 
     # Import global variables
     global debug_logger
     global download_logger
+    global rate_limiter
 
     # Defaults that can be overridden by config
     logs_directory = "./logs"
@@ -233,6 +329,8 @@ def bitmagnet_downloader():
         logs_directory = config["logs_directory"]
     if "prefix" in config:
         prefix = config["prefix"]
+    if "base_urls" in config:
+        base_urls = config["base_urls"]
     if "use_index_page" in config:
         use_index_page = config["use_index_page"]
     if "use_search_queries" in config:
@@ -251,6 +349,30 @@ def bitmagnet_downloader():
         exclude_one = config["exclude_one"]
     if "exclude_all" in config:
         exclude_all = config["exclude_all"]
+    if "rate_limit" in config:
+        rate_limit = config["rate_limit"]
+    if "rate_burst" in config:
+        rate_burst = config["rate_burst"]
+    if "backend" in config:
+        backend = config["backend"]
+    if "api_page_size" in config:
+        api_page_size = config["api_page_size"]
+    if "api_workers" in config:
+        api_workers = config["api_workers"]
+    if "api_rate_limit" in config:
+        api_rate_limit = config["api_rate_limit"]
+
+    # Periodic JSON/Prometheus snapshots of page-load timings
+    if "metrics_directory" in config:
+        get_metrics().start_exporter(
+            config["metrics_directory"],
+            config.get("metrics_interval", 60),
+            f"{prefix}-",
+        )
+
+    # Page loads against the bitmagnet host share one token bucket
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(rate=rate_limit, burst=rate_burst)
 
     # Loading Parser
     if 1 == 2:
@@ -267,14 +389,14 @@ def bitmagnet_downloader():
     # get_dependencies("chromedriver", user_agent, debug_logger)
 
     if use_index_page:
-        parse_website(
+        collect_magnets(
             base_urls,
             magnet_file,
             max_pages,
         )
 
     if use_search_queries:
-        parse_website(
+        collect_magnets(
             base_urls,
             magnet_file,
             max_pages,
@@ -286,7 +408,7 @@ def bitmagnet_downloader():
 
     # Calculate script running time
     time_difference = str(end_time - start_time)
-    message = f"Script finished. Duration: {time_difference}, Downloads: {str(total_downloads)}"
+    message = f"Script finished. Duration: {time_difference}, Downloads: {open_store(magnet_file).stored}"
     output(message, debug_logger, Level.INFO)
 
 
@@ -1,11 +1,18 @@
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import unquote, urljoin, urlparse
 
 import requests
 import yaml
-from bs4 import BeautifulSoup
+
+from .utils.request import HttpClient, stream_request
+from .utils.extract import parse, Extractor
+from .utils.state import IncrementalCrawl, ItemStatus, open_state
+from .utils.gallery import GalleryIndex
+from .utils.pool import WorkerPool
 
 # --- Configuration (Using values from user log/previous context) ---
 GALLERY_OVERVIEW_BASE_URL_INPUT = "https://izispicy.com/babes/"
@@ -20,8 +27,29 @@ DOWNLOAD_FOLDER = "Z:/Samples/Izispicy"
 REQUEST_TIMEOUT = 30
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tiff"}
 VIDEO_SKIP_PHRASE = "(VIDEO)"  # <<< Phrase to check for skipping
+IMAGE_MAX_BYTES = 50 * 1024 * 1024  # Larger bodies are not images we want
+HTML_ENGINE = "auto"  # selectolax, lxml, bs4-lxml, html.parser or auto
+HTML_ENGINE_VERIFY = False  # Cross-check results against BeautifulSoup/lxml
+STATE_DATABASE = None  # SQLite state store, needed for incremental mode
+INCREMENTAL_STOP_AFTER = 0  # Stop after this many known galleries in a row (0: off)
+FULL_SWEEP_INTERVAL = 0  # Hours between full sweeps in incremental mode
+GALLERY_INDEX_VERIFY = False  # Reconcile the gallery index with the disk at startup
+GALLERY_INDEX_SAVE_EVERY = 20  # Rewrite the gallery index after this many galleries
+IMAGE_WORKERS = 1  # Images downloaded at once, over all galleries
+IMAGE_WORKERS_PER_HOST = 0  # At most this many of them from one host (0: no cap)
+GALLERY_WORKERS = 1  # Galleries of an overview page processed at once
 # --- End Configuration ---
 
+# Some hosts serve images as generic binaries; HTML error pages are rejected
+IMAGE_CONTENT_TYPES = ("image/", "application/octet-stream", "binary/octet-stream")
+
+extractor = None
+gallery_index = None
+image_pool = None
+state = None
+
+STATE_SOURCE = "images"
+
 
 # Helper functions (sanitize_filename, extract_and_format_date, etc.) remain the same...
 def sanitize_filename(name):
@@ -78,50 +106,80 @@ def get_base_overview_url(url_input):
     return url_input
 
 
-def count_image_files(dir_path):
-    """Counts image files in a directory based on defined extensions."""
-    if not os.path.isdir(dir_path):
-        return 0
-    count = 0
-    try:
-        for fname in os.listdir(dir_path):
-            if os.path.isfile(os.path.join(dir_path, fname)):
-                if os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS:
-                    count += 1
-    except OSError as e:
-        print(f"      Warning: Could not count files in {dir_path}: {e}")
-        return 0
-    return count
+def download_image(img_url, save_path, session):
+    """Streams an image to disk using the shared HTTP client.
+
+    Returns the number of bytes written, or None if the download failed.
+    """
+    # Written via a .part file, so a failed transfer never leaves a truncated
+    # image behind that would later be mistaken for a finished download.
+    written = stream_request(
+        img_url,
+        [save_path],
+        None,
+        None,
+        max_retries=1,
+        sleep_time=0,
+        client=session,
+        content_types=IMAGE_CONTENT_TYPES,
+        max_bytes=IMAGE_MAX_BYTES,
+    )
+    return written
 
 
-def download_image(img_url, save_path, session):
-    """Downloads an image using a requests session."""
-    try:
-        # print(f"        Attempting download: {img_url}") # Too verbose?
-        response = session.get(img_url, stream=True, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        with open(save_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        # print(f"        SUCCESS: Saved locally to {save_path}") # Too verbose?
-        return True
-    except requests.exceptions.HTTPError as http_err:
-        print(f"          HTTP ERROR downloading {img_url}: {http_err}")
-    except requests.exceptions.RequestException as e:
-        print(f"          ERROR downloading {img_url}: {e}")
-    except IOError as e:
-        print(f"          ERROR saving file {save_path}: {e}")
-    except Exception as e:
-        print(f"          UNEXPECTED ERROR for {img_url}: {e}")
-    return False
+class GalleryDownloads:
+    """The images of one gallery queued on the shared `image_pool`.
 
+    Jobs are keyed by image host, so the pool's per-key cap limits the
+    downloads per host. `wait` blocks until every queued image is done.
+    """
 
-def get_soup(url, session, timeout=REQUEST_TIMEOUT):
-    """Fetches a URL using requests and returns a BeautifulSoup object."""
+    def __init__(self, folder, session):
+        self.folder = folder
+        self.session = session
+        self.filenames = set()
+        self.queued = 0
+        self.finished = 0
+        self.downloaded = 0
+        self._condition = threading.Condition()
+
+    def has(self, filename):
+        return filename in self.filenames
+
+    def submit(self, img_url, filename):
+        self.filenames.add(filename)
+        image_pool.submit(urlparse(img_url).netloc, self._download, img_url, filename)
+        with self._condition:
+            self.queued += 1
+
+    def _download(self, img_url, filename, attempt=0):
+        try:
+            written = download_image(
+                img_url, os.path.join(self.folder, filename), self.session
+            )
+            if written is not None:
+                gallery_index.add_file(self.folder, filename, written, img_url)
+                with self._condition:
+                    self.downloaded += 1
+        finally:
+            with self._condition:
+                self.finished += 1
+                self._condition.notify_all()
+
+    def wait(self):
+        """Wait for the queued images; returns how many were downloaded."""
+        with self._condition:
+            while self.finished < self.queued:
+                self._condition.wait()
+            return self.downloaded
+
+
+def get_soup(url, session, timeout=REQUEST_TIMEOUT, selectors=None):
+    """Fetches a URL and returns a parsed document supporting select/select_one."""
     try:
         response = session.get(url, timeout=timeout)
         response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        return BeautifulSoup(response.content, "lxml"), response.url
+        return parse(response.content, selectors, extractor), response.url
     except requests.exceptions.RequestException as e:
         print(f"      ERROR fetching {url}: {e}")
         return None, None
@@ -130,6 +188,313 @@ def get_soup(url, session, timeout=REQUEST_TIMEOUT):
         return None, None
 
 
+def process_gallery(gallery_url, number, total):
+    """Check one gallery and queue its missing images on `image_pool`."""
+    gallery_name = "untitled_gallery"
+    gallery_folder_path = None
+    downloads = None
+
+    print(
+        f"\n    ---> Checking Gallery {number}/{total}: {gallery_url}"
+    )
+
+    # Use a new cookie jar for each gallery to simulate isolation/cookie clearing,
+    # while still reusing the pooled connections of the overview client
+    gallery_session = overview_session.fork()
+
+    try:
+        # Step 1: Fetch gallery page, get title, determine potential folder name
+        print(f"      Fetching gallery page: {gallery_url}")
+        soup_gallery, actual_gallery_url = get_soup(
+            gallery_url, gallery_session, selectors=gallery_selectors
+        )
+
+        if soup_gallery is None:
+            print("      Failed to fetch or parse gallery page. Skipping.")
+            processed_or_skipped_urls.add(
+                gallery_url
+            )  # Mark as checked/skipped
+            return
+
+        title_element = soup_gallery.select_one(GALLERY_TITLE_SELECTOR)
+        original_title = (
+            title_element.get_text().strip() if title_element else "Untitled"
+        )
+        print(f"      Original Title: '{original_title}'")
+
+        # <<< Add Check for VIDEO_SKIP_PHRASE >>>
+        if VIDEO_SKIP_PHRASE in original_title:
+            print(f"      SKIPPING: Title contains '{VIDEO_SKIP_PHRASE}'.")
+            processed_or_skipped_urls.add(gallery_url)  # Mark as skipped
+            if state is not None:
+                state.mark(STATE_SOURCE, gallery_url, ItemStatus.SKIPPED)
+            return  # Skip to the next gallery URL
+        # <<< End VIDEO Check >>>
+
+        # Proceed with naming and other checks only if not a video
+        # --- New Naming Logic for Nested Folders ---
+        expected_count = extract_count_from_title(original_title)
+        formatted_date = extract_and_format_date(gallery_url)
+
+        # 1. Get the base title (without video phrase or pic count)
+        title_no_video = original_title.replace(VIDEO_SKIP_PHRASE, "").strip()
+        pics_pattern = re.compile(r"(\s*\(.*\)\s*)$", re.IGNORECASE)
+        base_title = pics_pattern.sub("", title_no_video).strip()
+        if not base_title:  # Handle cases where title was only "(VIDEO) (50 PICS)"
+            base_title = "untitled_gallery"
+
+        # Sanitize for the top-level folder
+        top_level_folder_name = sanitize_filename(base_title)
+
+        # 2. Construct the sub-folder name string
+        sub_folder_parts = [base_title]
+        if formatted_date:
+            sub_folder_parts.append(formatted_date)
+        if expected_count is not None:
+            sub_folder_parts.append(f"({expected_count} PICS)")
+
+        # Join and sanitize for the sub-folder. 'gallery_name' is used for the sub-folder and for logging.
+        sub_folder_name_str = " ".join(sub_folder_parts)
+        gallery_name = sanitize_filename(sub_folder_name_str)
+
+        # 3. Combine for the final path
+        gallery_folder_path = os.path.join(DOWNLOAD_FOLDER, top_level_folder_name, gallery_name)
+
+        print(f"      Base Title (for top folder): '{top_level_folder_name}'")
+        print(f"      Gallery Name (for sub-folder): '{gallery_name}'")
+        print(
+            f"      Expected Image Count from Title: {expected_count if expected_count is not None else 'Unknown'}"
+        )
+        print(f"      Checking Folder Path: '{gallery_folder_path}'")
+
+        # Step 2: Check folder existence and compare counts
+        folder_exists = gallery_index.exists(gallery_folder_path)
+        local_file_count = 0
+        if folder_exists:
+            local_file_count = gallery_index.count(gallery_folder_path)
+            print(
+                f"      Folder exists. Local image file count: {local_file_count}"
+            )
+
+        # Decision Point: Skip only if folder exists AND counts match (or exceed)
+        if (
+            folder_exists
+            and expected_count is not None
+            and expected_count > 0
+            and local_file_count >= expected_count
+        ):
+            print(
+                f"      SKIPPING download/pagination: Local count ({local_file_count}) >= Expected count ({expected_count})."
+            )
+            processed_or_skipped_urls.add(gallery_url)  # Mark as skipped
+            if state is not None:
+                state.mark(STATE_SOURCE, gallery_url, ItemStatus.DONE)
+            return  # Skip to the next gallery URL
+        elif folder_exists:
+            print(
+                f"      PROCESSING: Folder exists but local count ({local_file_count}) < expected count ({expected_count or 'Unknown'}), or expected count unknown. Will check for missing images."
+            )
+        else:  # Folder doesn't exist
+            print(
+                f"      PROCESSING: Folder not found. Proceeding with full download."
+            )
+
+        processed_or_skipped_urls.add(
+            gallery_url
+        )  # Mark as checked/processing now
+        gallery_index.start(
+            gallery_folder_path, gallery_url, original_title, expected_count
+        )
+        folder_created = folder_exists
+
+        # --- Step 3: Process Images & Pagination (Only if not skipped) ---
+        # Images download on the shared pool while this thread already
+        # fetches the next gallery page
+        downloads = GalleryDownloads(gallery_folder_path, gallery_session)
+        current_page_in_gallery = 1
+        current_gallery_page_url = actual_gallery_url  # Start with the first page URL we already fetched
+
+        # Innermost Loop: Handle pagination WITHIN this gallery
+        while True:
+            print(
+                f"\n        Scraping Page {current_page_in_gallery} in gallery '{gallery_name}'..."
+            )
+            print(f"        Current URL: {current_gallery_page_url}")
+
+            # If this isn't the first page, we need to fetch it now
+            if current_page_in_gallery > 1:
+                soup_gallery, actual_gallery_url = get_soup(
+                    current_gallery_page_url,
+                    gallery_session,
+                    selectors=gallery_selectors,
+                )
+                if soup_gallery is None:
+                    print(
+                        f"        Failed to fetch or parse gallery page {current_page_in_gallery}. Assuming end of gallery."
+                    )
+                    break  # Cannot fetch next page, end gallery processing
+
+            image_elements = soup_gallery.select(IMAGE_SELECTOR)
+            print(
+                f"        Found {len(image_elements)} image elements on this page."
+            )
+            page_images_queued = 0
+
+            if not image_elements:
+                print(
+                    f"        No images present on page {current_page_in_gallery} ('{IMAGE_SELECTOR}')."
+                )
+                # Continue to check for next page button, as in original logic
+
+            # --- Image Downloading ---
+            for img_element in image_elements:
+                img_src = img_element.get("src")
+                if not img_src or not img_src.strip():
+                    continue
+                img_src = img_src.strip()
+                # Use the actual URL of the current page for urljoin
+                absolute_img_url = urljoin(actual_gallery_url, img_src)
+
+                try:  # Generate filename
+                    filename_part = unquote(
+                        absolute_img_url.split("/")[-1].split("?")[0]
+                    )
+                    file_ext_lower = os.path.splitext(filename_part)[1].lower()
+                    if file_ext_lower not in IMAGE_EXTENSIONS:
+                        filename = f"{sanitize_filename(filename_part)}.jpg"  # Assume .jpg if no valid extension
+                    else:
+                        filename = sanitize_filename(filename_part)
+                    if not filename or filename.startswith("."):
+                        # Fallback if sanitization results in empty or dot file
+                        raise ValueError("Generated invalid filename")
+                except Exception as e:
+                    # Fallback filename if URL parsing/sanitization fails
+                    file_ext = os.path.splitext(absolute_img_url)[1].lower()
+                    if file_ext not in IMAGE_EXTENSIONS:
+                        file_ext = ".jpg"
+                    img_counter = local_file_count + downloads.queued + 1
+                    filename = f"image_{img_counter:04d}{file_ext}"
+                    print(
+                        f"          Warning: Could not derive filename from URL ({e}). Using: {filename} for {absolute_img_url}"
+                    )
+
+                # Optimization: Skip download if file already exists (or is queued)
+                if gallery_index.has_file(gallery_folder_path, filename) or downloads.has(filename):
+                    # print(f"          File already exists: {save_path}. Skipping.") # Too verbose?
+                    continue
+
+                # Ensure directory exists BEFORE download attempt
+                current_folder_exists_check = folder_created
+                if not current_folder_exists_check:
+                    try:
+                        print(
+                            f"        Creating folder: '{gallery_folder_path}'"
+                        )
+                        os.makedirs(gallery_folder_path, exist_ok=True)
+                        current_folder_exists_check = True  # Update status
+                        folder_created = True
+                    except OSError as oe:
+                        print(
+                            f"        ERROR creating directory {gallery_folder_path}: {oe}. Skipping image {absolute_img_url}."
+                        )
+                        continue  # Skip this image
+
+                # Attempt Download only if folder exists
+                if current_folder_exists_check:
+                    downloads.submit(absolute_img_url, filename)
+                    page_images_queued += 1
+                # --- End Image Downloading ---
+            # End image element loop
+
+            print(
+                f"        Queued {page_images_queued} new images from page {current_page_in_gallery}."
+            )
+
+            # --- Check for GALLERY Next Page ---
+            print(
+                f"        Checking for Gallery 'Next Page' ('{GALLERY_NEXT_PAGE_SELECTOR}')"
+            )
+            next_page_element = soup_gallery.select_one(
+                GALLERY_NEXT_PAGE_SELECTOR
+            )
+
+            if next_page_element:
+                next_page_href = next_page_element.get("href")
+                if next_page_href and next_page_href.strip():
+                    current_gallery_page_url = urljoin(
+                        actual_gallery_url, next_page_href.strip()
+                    )
+                    current_page_in_gallery += 1
+                    print(
+                        f"        Gallery 'Next Page' button found. Will attempt to fetch: {current_gallery_page_url}"
+                    )
+                    # The loop will fetch the new URL in the next iteration
+                else:
+                    print(
+                        "        Gallery 'Next Page' button found, but href is empty. Assuming end of gallery."
+                    )
+                    break  # No valid href, end gallery processing
+            else:
+                print(
+                    "        No 'Next Page' button found. Assuming end of gallery."
+                )
+                break  # No next page element, end gallery processing
+            # --- End GALLERY Next Page Check ---
+        # --- End Innermost Loop (Gallery Pagination) ---
+
+        # --- Final logging for this gallery ---
+        # This block is only reached if the gallery was NOT skipped by VIDEO or Count checks
+        total_images_downloaded_this_run = downloads.wait()
+        final_local_count = gallery_index.count(gallery_folder_path)
+        print(f"\n    ---> Finished PROCESSING gallery '{gallery_name}'.")
+        print(
+            f"      Downloaded {total_images_downloaded_this_run} new images in this run for this gallery."
+        )
+        if folder_created:
+            print(
+                f"      Folder '{gallery_folder_path}' now contains {final_local_count} images."
+            )
+            if (
+                expected_count is not None
+                and final_local_count < expected_count
+            ):
+                print(
+                    f"      WARNING: Final count ({final_local_count}) is less than expected ({expected_count})."
+                )
+        elif total_images_downloaded_this_run > 0:
+            print(
+                f"      WARNING: Images were downloaded but folder '{gallery_folder_path}' cannot be confirmed."
+            )
+        else:
+            print(f"      No new images downloaded for this gallery.")
+        complete = expected_count is None or final_local_count >= expected_count
+        gallery_index.finish(gallery_folder_path, complete)
+        if state is not None:
+            state.mark(
+                STATE_SOURCE,
+                gallery_url,
+                ItemStatus.DONE if complete else ItemStatus.FAILED,
+                error=None if complete else f"{final_local_count}/{expected_count} images",
+            )
+
+    except Exception as gallery_err:
+        # Catch errors during fetching, parsing, or the main processing block for a single gallery
+        print(
+            f"      ERROR processing gallery '{gallery_name or gallery_url}': {gallery_err}"
+        )
+        # The URL is already added to processed_or_skipped_urls at the start of processing
+        if downloads is not None:
+            downloads.wait()
+        if gallery_folder_path is not None:
+            # Keep whatever was downloaded before the error
+            gallery_index.finish(gallery_folder_path, False)
+
+    finally:
+        # The gallery_session will go out of scope and be garbage collected
+        # once its queued images are done, effectively clearing cookies.
+        pass  # No explicit cleanup needed for the session object
+
+
 # --- Main Script Logic ---
 if __name__ == "__main__":
     config_path = Path(__file__).resolve().parent / "configs" / "images.yaml"
@@ -175,9 +540,30 @@ if __name__ == "__main__":
         "GALLERY_NEXT_PAGE_SELECTOR", GALLERY_NEXT_PAGE_SELECTOR
     )
     REQUEST_TIMEOUT = config.get("REQUEST_TIMEOUT", REQUEST_TIMEOUT)
+    IMAGE_MAX_BYTES = config.get("IMAGE_MAX_BYTES", IMAGE_MAX_BYTES)
+    HTML_ENGINE = config.get("HTML_ENGINE", HTML_ENGINE)
+    HTML_ENGINE_VERIFY = config.get("HTML_ENGINE_VERIFY", HTML_ENGINE_VERIFY)
+    STATE_DATABASE = config.get("STATE_DATABASE", STATE_DATABASE)
+    INCREMENTAL_STOP_AFTER = config.get("INCREMENTAL_STOP_AFTER", INCREMENTAL_STOP_AFTER)
+    FULL_SWEEP_INTERVAL = config.get("FULL_SWEEP_INTERVAL", FULL_SWEEP_INTERVAL)
+    GALLERY_INDEX_VERIFY = config.get("GALLERY_INDEX_VERIFY", GALLERY_INDEX_VERIFY)
+    GALLERY_INDEX_SAVE_EVERY = config.get("GALLERY_INDEX_SAVE_EVERY", GALLERY_INDEX_SAVE_EVERY)
+    IMAGE_WORKERS = config.get("IMAGE_WORKERS", IMAGE_WORKERS)
+    IMAGE_WORKERS_PER_HOST = config.get("IMAGE_WORKERS_PER_HOST", IMAGE_WORKERS_PER_HOST)
+    GALLERY_WORKERS = config.get("GALLERY_WORKERS", GALLERY_WORKERS)
     # --- End Applying Configuration ---
 
+    # BeautifulSoup with lxml was the parser used here before engines were pluggable
+    extractor = Extractor(HTML_ENGINE, verify=HTML_ENGINE_VERIFY, reference="bs4-lxml")
+    print(f"Using HTML engine: {extractor.engine}")
+
     os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+
+    # Folder contents come from the gallery index, not from the (network) disk
+    gallery_index = GalleryIndex(DOWNLOAD_FOLDER, IMAGE_EXTENSIONS, GALLERY_INDEX_SAVE_EVERY)
+    print(f"Gallery index: {len(gallery_index)} galleries")
+    if GALLERY_INDEX_VERIFY:
+        print(f"Verified gallery index against disk: {gallery_index.verify()}")
     processed_or_skipped_urls = (
         set()
     )  # To track galleries we've decided *not* to process again
@@ -185,14 +571,45 @@ if __name__ == "__main__":
     base_overview_url = get_base_overview_url(GALLERY_OVERVIEW_BASE_URL_INPUT)
     print(f"Using Base Overview URL for pagination: {base_overview_url}")
 
-    # Use one session for overview pages for potential cookie handling
-    overview_session = requests.Session()
-    overview_session.headers.update(
-        {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+    # Use one pooled client for overview pages for potential cookie handling
+    overview_session = HttpClient(
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        pool_connections=config.get("POOL_CONNECTIONS", 10),
+        # One connection per image worker plus the gallery pages being fetched
+        pool_maxsize=max(config.get("POOL_MAXSIZE", 10), IMAGE_WORKERS + GALLERY_WORKERS),
+        timeout=REQUEST_TIMEOUT,
     )
+    if config.get("METRICS_DIRECTORY"):
+        overview_session.metrics.start_exporter(
+            config["METRICS_DIRECTORY"], config.get("METRICS_INTERVAL", 60), "IMAGES-"
+        )
 
+    # Galleries finished in earlier runs are remembered in the state store, so
+    # an incremental run can stop once the overview only lists known ones
+    state = open_state(STATE_DATABASE) if STATE_DATABASE else None
+    listing_crawl = None
+    if state is not None:
+        listing_crawl = IncrementalCrawl(
+            state,
+            STATE_SOURCE,
+            base_overview_url,
+            INCREMENTAL_STOP_AFTER,
+            FULL_SWEEP_INTERVAL,
+        )
+        print(f"Listing {listing_crawl.describe()}")
+
+    gallery_selectors = [GALLERY_TITLE_SELECTOR, IMAGE_SELECTOR, GALLERY_NEXT_PAGE_SELECTOR]
+
+    # One pool fetches the images of all galleries, keyed by image host
+    image_pool = WorkerPool(
+        IMAGE_WORKERS,
+        default_limit=IMAGE_WORKERS_PER_HOST,
+        on_error=lambda host, e: print(f"          ERROR downloading image from {host}: {e}"),
+        name="image",
+    ).start()
+    print(
+        f"Image workers: {image_pool.workers} (per host: {IMAGE_WORKERS_PER_HOST or 'no cap'}), gallery workers: {GALLERY_WORKERS}"
+    )
     overview_page_num = 1
 
     # --- Outer Loop: Iterate through Overview Pages ---
@@ -203,7 +620,9 @@ if __name__ == "__main__":
         )
 
         soup_overview, actual_overview_url = get_soup(
-            current_overview_page_url, overview_session
+            current_overview_page_url,
+            overview_session,
+            selectors=[GALLERY_LINK_SELECTOR],
         )
 
         if soup_overview is None:
@@ -237,12 +656,23 @@ if __name__ == "__main__":
             print(
                 f"  No gallery links found on overview page {overview_page_num}. Assuming end."
             )
+            if listing_crawl is not None:
+                listing_crawl.end()
             break  # No links means end of overview pages
 
         for element in gallery_elements:
             href = element.get("href")
             if href and href.strip():
                 full_url = urljoin(actual_overview_url, href.strip())
+                if listing_crawl is not None:
+                    known = state.status(STATE_SOURCE, full_url) in (
+                        ItemStatus.DONE,
+                        ItemStatus.SKIPPED,
+                    )
+                    if listing_crawl.observe(known):
+                        break  # The rest of the overview is known
+                    if known and listing_crawl.incremental:
+                        continue  # Finished in an earlier run
                 if full_url not in processed_or_skipped_urls:
                     # Avoid adding duplicates from the same overview page scrape
                     if full_url not in [g["url"] for g in gallery_links_on_this_page]:
@@ -252,309 +682,34 @@ if __name__ == "__main__":
         )
 
         # --- Process Each Gallery Found on THIS Overview Page ---
-        for i, gallery_info in enumerate(gallery_links_on_this_page):
-            gallery_url = gallery_info["url"]
-            gallery_name = "untitled_gallery"
-            gallery_folder_path = None
+        # Up to GALLERY_WORKERS at once; their images share the image pool
+        total = len(gallery_links_on_this_page)
+        with ThreadPoolExecutor(max_workers=max(1, GALLERY_WORKERS)) as executor:
+            futures = [
+                executor.submit(process_gallery, gallery_info["url"], number, total)
+                for number, gallery_info in enumerate(gallery_links_on_this_page, 1)
+            ]
+            for future in futures:
+                future.result()
+
+        # --- End Loop for Galleries on This Overview Page ---
 
+        if listing_crawl is not None and listing_crawl.stopped:
             print(
-                f"\n    ---> Checking Gallery {i + 1}/{len(gallery_links_on_this_page)}: {gallery_url}"
+                f"  {INCREMENTAL_STOP_AFTER} known galleries in a row. Stopping incremental crawl."
             )
-
-            # Use a new session for each gallery to simulate isolation/cookie clearing
-            gallery_session = requests.Session()
-            gallery_session.headers.update(overview_session.headers)  # Use same headers
-
-            try:
-                # Step 1: Fetch gallery page, get title, determine potential folder name
-                print(f"      Fetching gallery page: {gallery_url}")
-                soup_gallery, actual_gallery_url = get_soup(
-                    gallery_url, gallery_session
-                )
-
-                if soup_gallery is None:
-                    print("      Failed to fetch or parse gallery page. Skipping.")
-                    processed_or_skipped_urls.add(
-                        gallery_url
-                    )  # Mark as checked/skipped
-                    continue
-
-                title_element = soup_gallery.select_one(GALLERY_TITLE_SELECTOR)
-                original_title = (
-                    title_element.get_text().strip() if title_element else "Untitled"
-                )
-                print(f"      Original Title: '{original_title}'")
-
-                # <<< Add Check for VIDEO_SKIP_PHRASE >>>
-                if VIDEO_SKIP_PHRASE in original_title:
-                    print(f"      SKIPPING: Title contains '{VIDEO_SKIP_PHRASE}'.")
-                    processed_or_skipped_urls.add(gallery_url)  # Mark as skipped
-                    continue  # Skip to the next gallery URL
-                # <<< End VIDEO Check >>>
-
-                # Proceed with naming and other checks only if not a video
-                # --- New Naming Logic for Nested Folders ---
-                expected_count = extract_count_from_title(original_title)
-                formatted_date = extract_and_format_date(gallery_url)
-
-                # 1. Get the base title (without video phrase or pic count)
-                title_no_video = original_title.replace(VIDEO_SKIP_PHRASE, "").strip()
-                pics_pattern = re.compile(r"(\s*\(.*\)\s*)$", re.IGNORECASE)
-                base_title = pics_pattern.sub("", title_no_video).strip()
-                if not base_title:  # Handle cases where title was only "(VIDEO) (50 PICS)"
-                    base_title = "untitled_gallery"
-
-                # Sanitize for the top-level folder
-                top_level_folder_name = sanitize_filename(base_title)
-
-                # 2. Construct the sub-folder name string
-                sub_folder_parts = [base_title]
-                if formatted_date:
-                    sub_folder_parts.append(formatted_date)
-                if expected_count is not None:
-                    sub_folder_parts.append(f"({expected_count} PICS)")
-
-                # Join and sanitize for the sub-folder. 'gallery_name' is used for the sub-folder and for logging.
-                sub_folder_name_str = " ".join(sub_folder_parts)
-                gallery_name = sanitize_filename(sub_folder_name_str)
-
-                # 3. Combine for the final path
-                gallery_folder_path = os.path.join(DOWNLOAD_FOLDER, top_level_folder_name, gallery_name)
-
-                print(f"      Base Title (for top folder): '{top_level_folder_name}'")
-                print(f"      Gallery Name (for sub-folder): '{gallery_name}'")
-                print(
-                    f"      Expected Image Count from Title: {expected_count if expected_count is not None else 'Unknown'}"
-                )
-                print(f"      Checking Folder Path: '{gallery_folder_path}'")
-
-                # Step 2: Check folder existence and compare counts
-                folder_exists = os.path.exists(gallery_folder_path)
-                local_file_count = 0
-                if folder_exists:
-                    local_file_count = count_image_files(gallery_folder_path)
-                    print(
-                        f"      Folder exists. Local image file count: {local_file_count}"
-                    )
-
-                # Decision Point: Skip only if folder exists AND counts match (or exceed)
-                if (
-                    folder_exists
-                    and expected_count is not None
-                    and expected_count > 0
-                    and local_file_count >= expected_count
-                ):
-                    print(
-                        f"      SKIPPING download/pagination: Local count ({local_file_count}) >= Expected count ({expected_count})."
-                    )
-                    processed_or_skipped_urls.add(gallery_url)  # Mark as skipped
-                    continue  # Skip to the next gallery URL
-                elif folder_exists:
-                    print(
-                        f"      PROCESSING: Folder exists but local count ({local_file_count}) < expected count ({expected_count or 'Unknown'}), or expected count unknown. Will check for missing images."
-                    )
-                else:  # Folder doesn't exist
-                    print(
-                        f"      PROCESSING: Folder not found. Proceeding with full download."
-                    )
-
-                processed_or_skipped_urls.add(
-                    gallery_url
-                )  # Mark as checked/processing now
-
-                # --- Step 3: Process Images & Pagination (Only if not skipped) ---
-                total_images_downloaded_this_run = 0
-                current_page_in_gallery = 1
-                current_gallery_page_url = actual_gallery_url  # Start with the first page URL we already fetched
-
-                # Innermost Loop: Handle pagination WITHIN this gallery
-                while True:
-                    print(
-                        f"\n        Scraping Page {current_page_in_gallery} in gallery '{gallery_name}'..."
-                    )
-                    print(f"        Current URL: {current_gallery_page_url}")
-
-                    # If this isn't the first page, we need to fetch it now
-                    if current_page_in_gallery > 1:
-                        soup_gallery, actual_gallery_url = get_soup(
-                            current_gallery_page_url, gallery_session
-                        )
-                        if soup_gallery is None:
-                            print(
-                                f"        Failed to fetch or parse gallery page {current_page_in_gallery}. Assuming end of gallery."
-                            )
-                            break  # Cannot fetch next page, end gallery processing
-
-                    image_elements = soup_gallery.select(IMAGE_SELECTOR)
-                    print(
-                        f"        Found {len(image_elements)} image elements on this page."
-                    )
-                    page_images_downloaded_this_run = 0
-
-                    if not image_elements:
-                        print(
-                            f"        No images present on page {current_page_in_gallery} ('{IMAGE_SELECTOR}')."
-                        )
-                        # Continue to check for next page button, as in original logic
-
-                    # --- Image Downloading ---
-                    for img_element in image_elements:
-                        img_src = img_element.get("src")
-                        if not img_src or not img_src.strip():
-                            continue
-                        img_src = img_src.strip()
-                        # Use the actual URL of the current page for urljoin
-                        absolute_img_url = urljoin(actual_gallery_url, img_src)
-
-                        try:  # Generate filename
-                            filename_part = unquote(
-                                absolute_img_url.split("/")[-1].split("?")[0]
-                            )
-                            file_ext_lower = os.path.splitext(filename_part)[1].lower()
-                            if file_ext_lower not in IMAGE_EXTENSIONS:
-                                filename = f"{sanitize_filename(filename_part)}.jpg"  # Assume .jpg if no valid extension
-                            else:
-                                filename = sanitize_filename(filename_part)
-                            if not filename or filename.startswith("."):
-                                # Fallback if sanitization results in empty or dot file
-                                raise ValueError("Generated invalid filename")
-                        except Exception as e:
-                            # Fallback filename if URL parsing/sanitization fails
-                            file_ext = os.path.splitext(absolute_img_url)[1].lower()
-                            if file_ext not in IMAGE_EXTENSIONS:
-                                file_ext = ".jpg"
-                            img_counter = (
-                                local_file_count
-                                + total_images_downloaded_this_run
-                                + page_images_downloaded_this_run
-                                + 1
-                            )
-                            filename = f"image_{img_counter:04d}{file_ext}"
-                            print(
-                                f"          Warning: Could not derive filename from URL ({e}). Using: {filename} for {absolute_img_url}"
-                            )
-
-                        save_path = os.path.join(gallery_folder_path, filename)
-
-                        # Optimization: Skip download if file already exists
-                        if os.path.exists(save_path):
-                            # print(f"          File already exists: {save_path}. Skipping.") # Too verbose?
-                            continue
-
-                        # Ensure directory exists BEFORE download attempt
-                        current_folder_exists_check = os.path.exists(
-                            gallery_folder_path
-                        )
-                        if not current_folder_exists_check:
-                            try:
-                                print(
-                                    f"        Creating folder: '{gallery_folder_path}'"
-                                )
-                                os.makedirs(gallery_folder_path, exist_ok=True)
-                                current_folder_exists_check = True  # Update status
-                            except OSError as oe:
-                                print(
-                                    f"        ERROR creating directory {gallery_folder_path}: {oe}. Skipping image {absolute_img_url}."
-                                )
-                                continue  # Skip this image
-
-                        # Attempt Download only if folder exists
-                        if current_folder_exists_check:
-                            # Pass the gallery-specific session to download_image
-                            if download_image(
-                                absolute_img_url,
-                                save_path,
-                                gallery_session,
-                            ):
-                                page_images_downloaded_this_run += 1
-                                total_images_downloaded_this_run += 1
-                        # --- End Image Downloading ---
-                    # End image element loop
-
-                    print(
-                        f"        Downloaded {page_images_downloaded_this_run} new images from page {current_page_in_gallery}."
-                    )
-
-                    # --- Check for GALLERY Next Page ---
-                    print(
-                        f"        Checking for Gallery 'Next Page' ('{GALLERY_NEXT_PAGE_SELECTOR}')"
-                    )
-                    next_page_element = soup_gallery.select_one(
-                        GALLERY_NEXT_PAGE_SELECTOR
-                    )
-
-                    if next_page_element:
-                        next_page_href = next_page_element.get("href")
-                        if next_page_href and next_page_href.strip():
-                            current_gallery_page_url = urljoin(
-                                actual_gallery_url, next_page_href.strip()
-                            )
-                            current_page_in_gallery += 1
-                            print(
-                                f"        Gallery 'Next Page' button found. Will attempt to fetch: {current_gallery_page_url}"
-                            )
-                            # The loop will fetch the new URL in the next iteration
-                        else:
-                            print(
-                                "        Gallery 'Next Page' button found, but href is empty. Assuming end of gallery."
-                            )
-                            break  # No valid href, end gallery processing
-                    else:
-                        print(
-                            "        No 'Next Page' button found. Assuming end of gallery."
-                        )
-                        break  # No next page element, end gallery processing
-                    # --- End GALLERY Next Page Check ---
-                # --- End Innermost Loop (Gallery Pagination) ---
-
-                # --- Final logging for this gallery ---
-                # This block is only reached if the gallery was NOT skipped by VIDEO or Count checks
-                final_local_count = count_image_files(gallery_folder_path)
-                print(f"\n    ---> Finished PROCESSING gallery '{gallery_name}'.")
-                print(
-                    f"      Downloaded {total_images_downloaded_this_run} new images in this run for this gallery."
-                )
-                if os.path.isdir(gallery_folder_path):
-                    print(
-                        f"      Folder '{gallery_folder_path}' now contains {final_local_count} images."
-                    )
-                    if (
-                        expected_count is not None
-                        and final_local_count < expected_count
-                    ):
-                        print(
-                            f"      WARNING: Final count ({final_local_count}) is less than expected ({expected_count})."
-                        )
-                elif total_images_downloaded_this_run > 0:
-                    print(
-                        f"      WARNING: Images were downloaded but folder '{gallery_folder_path}' cannot be confirmed."
-                    )
-                else:
-                    print(f"      No new images downloaded for this gallery.")
-
-            except Exception as gallery_err:
-                # Catch errors during fetching, parsing, or the main processing block for a single gallery
-                print(
-                    f"      ERROR processing gallery '{gallery_name or gallery_url}': {gallery_err}"
-                )
-                # The URL is already added to processed_or_skipped_urls at the start of processing
-
-            finally:
-                # The gallery_session will go out of scope and be garbage collected
-                # when the inner `for` loop finishes, effectively clearing cookies.
-                pass  # No explicit cleanup needed for the session object
-
-            # Add a small delay between galleries to be polite
-            # time.sleep(1) # Optional: import time
-
-        # --- End Loop for Galleries on This Overview Page ---
+            break
 
         # --- Prepare for Next Overview Page ---
         overview_page_num += 1
 
     # --- End Outer Loop (Overview Pages) ---
 
+    image_pool.join()
+    gallery_index.flush()
     overview_session.close()  # Close the session used for overview pages
+    if listing_crawl is not None:
+        listing_crawl.finish()
 
     print(
         f"\n--- Script Finished. Attempted {overview_page_num -1} overview pages. Checked/Processed/Skipped {len(processed_or_skipped_urls)} unique gallery URLs. ---"
@@ -1,12 +1,13 @@
 import os
 import re
-import sys
 import time
 import json
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
 from bs4 import BeautifulSoup
 
@@ -14,8 +15,15 @@ from .utils.generate_url import get_category_number
 from .utils.parser import create_parser
 from .utils.config import read_configuration
 from .utils.output import initialize_logs, output, Level
-from .utils.request import retry_request
+from .utils.request import retry_request, create_client
 from .utils.dependencies import download_tool
+from .utils.metrics import get_metrics
+from .utils.extract import select, create_extractor
+from .utils.archive import open_archive
+from .utils.links import UrlCanonicalizer, open_link_index
+from .utils.state import IncrementalCrawl, open_state
+from .utils.pool import Retry, WorkerPool
+from .utils.browser import BrowserPool
 
 # Global (config) values
 config_file = "porn.yml"
@@ -40,6 +48,17 @@ sort_option = "mv"
 date_filter = "w"
 country_filter = "world"
 max_videos = 1000
+download_workers = 1
+max_downloads_per_site = 0
+download_queue_size = 100
+scrape_workers = 1
+browser_pool_size = 2
+browser_warm = 1
+browser_max_uses = 50
+chromedriver_path = None
+state_database = None
+incremental_stop_after = 0
+full_sweep_interval = 0
 
 default_values = {
     "verbose": verbose,
@@ -58,6 +77,17 @@ default_values = {
     "date_filter": date_filter,
     "country_filter": country_filter,
     "max_videos": max_videos,
+    "download_workers": download_workers,
+    "max_downloads_per_site": max_downloads_per_site,
+    "download_queue_size": download_queue_size,
+    "scrape_workers": scrape_workers,
+    "browser_pool_size": browser_pool_size,
+    "browser_warm": browser_warm,
+    "browser_max_uses": browser_max_uses,
+    "chromedriver_path": chromedriver_path,
+    "state_database": state_database,
+    "incremental_stop_after": incremental_stop_after,
+    "full_sweep_interval": full_sweep_interval,
 }
 
 # Global variables
@@ -70,123 +100,147 @@ total_per_category_link_counter = 0
 videos_saved = 0
 videos_failed = 0
 videos_skipped = 0
+counter_lock = threading.Lock()
+
+http_client = None
+extractor = None
+debug_logger = None
+download_logger = None
+state = None
+listing_crawls = {}
+# Headless Chrome for infinite scroll, pre-click actions and Bellesa
+browser_pool = None
+# Called with (query or category, website, link) for every scraped link
+link_sink = None
+
+STATE_SOURCE = "porn"
+
+
+def get_listing_crawl(website_name, query=None, category=None):
+    """Incremental crawl state of one site's listing, or None without a state store."""
+    if state is None:
+        return None
+    listing = f"{website_name}:{query or category or 'all'}"
+    if listing not in listing_crawls:
+        listing_crawls[listing] = IncrementalCrawl(
+            state, STATE_SOURCE, listing, incremental_stop_after, full_sweep_interval
+        )
+        message = f"Listing {listing_crawls[listing].describe()}"
+        output(message, debug_logger, Level.INFO)
+    return listing_crawls[listing]
+
+
+def finish_listing_crawls():
+    for listing_crawl in listing_crawls.values():
+        listing_crawl.finish()
+    listing_crawls.clear()
+
+
+def count_video(outcome):
+    """Count a finished video (saved, skipped or failed) and log the totals."""
+    global videos_saved
+    global videos_failed
+    global videos_skipped
 
+    with counter_lock:
+        if outcome == "saved":
+            videos_saved += 1
+        elif outcome == "skipped":
+            videos_skipped += 1
+        else:
+            videos_failed += 1
+        remaining = total_link_counter - videos_failed - videos_saved - videos_skipped
+        message = (
+            f"Videos Saved: {videos_saved}, Skipped: {videos_skipped}, Failed: {videos_failed}, "
+            f"Remaining: {remaining}, Total: {total_link_counter}\n"
+        )
+    output(message, debug_logger, Level.INFO)
 
-def download_video(file_path, download_path, video_name, yt_dlp_path, ffmpeg_path, href):
+
+def download_video(
+    file_path, download_path, video_name, yt_dlp_path, ffmpeg_path, href, attempt=0
+):
     """
-    Attempts to download a video with retries using yt-dlp or youtube-dl
-    via subprocess.
+    Runs one yt-dlp download attempt for a video via subprocess.
+
+    Meant to run on a `WorkerPool`: a failed attempt raises `Retry`, so the
+    pool runs it again after a delay without blocking the worker meanwhile.
 
     Args:
-        file_path (str): Path to the file tracking downloaded links.
+        file_path (str): Path to the download archive file (see DownloadArchive).
         download_path (str): The output template for the downloaded file.
         href (str): The URL of the video to download.
-        title (str, optional): The title of the video (currently unused).
+        attempt (int): Number of earlier attempts for this video.
     """
-    global total_link_counter
-    global videos_saved
-    global videos_failed
-    global videos_skipped
     global debug_logger
     global download_logger
 
-    # Check if the link has already been downloaded by reading line by line
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                for line in f:
-                    if line.strip() == href:
-                        message = f"Video already downloaded. Skipping: {href}"
-                        output(message, debug_logger, Level.SKIP)
-                        videos_skipped += 1
-                        # Update remaining count here as we are skipping
-                        remaining = (
-                            total_link_counter
-                            - videos_failed
-                            - videos_saved
-                            - videos_skipped
-                        )
-                        message = (
-                            f"Videos Saved: {videos_saved}, Skipped: {videos_skipped}, Failed: {videos_failed}, "
-                            f"Remaining: {remaining}, Total: {total_link_counter}\n"
-                        )
-                        output(message, debug_logger, Level.INFO)
-                        return  # Exit the function as it's already downloaded
-    except IOError as e:
-        message = f"Error reading file {file_path}: {e}"
-        output(message, debug_logger, Level.ERROR)
-        # Continue attempting download in case reading failed but download might succeed
+    # The archive is loaded once and shared by all download workers; claiming
+    # the link also keeps two workers from downloading the same video
+    archive = open_archive(file_path)
+    if attempt == 0 and not archive.claim(href):
+        message = f"Video already downloaded. Skipping: {href}"
+        output(message, debug_logger, Level.SKIP)
+        count_video("skipped")
+        return  # Exit the function as it's already downloaded
 
     max_retries = 10
-    retry_delay_seconds = 5  # Optional: add a delay between retries
-
-    for retry_count in range(max_retries):
-        message = f"Attempt {retry_count + 1}/{max_retries} - Downloading video: {href}"
-        output(message, debug_logger, Level.INFO)
-        try:
-            subprocess.run(
-                [
-                    yt_dlp_path,
-                    "-P",
-                    download_path,
-                    "--extractor-args",
-                    "generic:impersonate=chrome",
-                    "--ffmpeg-location",
-                    ffmpeg_path,
-                    "-o",
-                    video_name,
-                    href,
-                ],
-                check=True,
-            )
-        except Exception as e:
-            # Catch any other unexpected errors during the subprocess call or handling
-            message = f"An unexpected error occurred during download attempt: {e}"
-            output(message, debug_logger, Level.ERROR)
+    retry_delay_seconds = 5  # Delay before the pool retries a failed attempt
+    metrics = get_metrics()
+    host = urlparse(href).netloc
 
-            if retry_count < max_retries - 1:
-                message = f"Retrying in {retry_delay_seconds} seconds... (attempt {retry_count + 2}/{max_retries})"
-                output(message, debug_logger, Level.WARNING)
-                time.sleep(retry_delay_seconds)  # Wait before retrying
-                continue  # Go to the next retry attempt
-            else:
-                message = "Maximum retries reached. Download failed."
-                output(message, debug_logger, Level.ERROR)
-                videos_failed += 1
-                break  # Exit the retry loop after max retries
-
-        # If we reach here, the download was successful
-        message = "Download successful."
-        output(message, debug_logger, Level.INFO)  # Log success to debug
-        output(message, download_logger, Level.SUCCESS)  # Log success to download log
-
-        # Save the link to the file *after* successful download
-        try:
-            with open(file_path, "a") as f:
-                f.write(f"{href}\n")
-        except IOError as e:
-            message = f"Error writing downloaded link to file {file_path}: {e}"
-            output(message, debug_logger, Level.ERROR)
-            # Decide if this write failure should fail the whole download attempt
-            # For now, we consider the download successful but log the file write issue.
-
-        videos_saved += 1
-        # Update remaining count after successful save
-        remaining = total_link_counter - videos_failed - videos_saved - videos_skipped
-        message = (
-            f"Videos Saved: {videos_saved}, Skipped: {videos_skipped}, Failed: {videos_failed}, "
-            f"Remaining: {remaining}, Total: {total_link_counter}\n"
+    message = f"Attempt {attempt + 1}/{max_retries} - Downloading video: {href}"
+    output(message, debug_logger, Level.INFO)
+    started = time.perf_counter()
+    try:
+        subprocess.run(
+            [
+                yt_dlp_path,
+                "-P",
+                download_path,
+                "--extractor-args",
+                "generic:impersonate=chrome",
+                "--ffmpeg-location",
+                ffmpeg_path,
+                "-o",
+                video_name,
+                href,
+            ],
+            check=True,
         )
-        output(message, debug_logger, Level.INFO)
-        return  # Exit the function on success
+    except Exception as e:
+        # Catch any other unexpected errors during the subprocess call or handling
+        metrics.count(host, "download_errors")
+        message = f"An unexpected error occurred during download attempt: {e}"
+        output(message, debug_logger, Level.ERROR)
 
-    # This part is reached only if the download failed after all retries or if FileNotFoundError occurred
-    remaining = total_link_counter - videos_failed - videos_saved - videos_skipped
-    message = (
-        f"Videos Saved: {videos_saved}, Skipped: {videos_skipped}, Failed: {videos_failed}, "
-        f"Remaining: {remaining}, Total: {total_link_counter}\n"
-    )
-    output(message, debug_logger, Level.INFO)
+        if attempt < max_retries - 1:
+            message = f"Retrying in {retry_delay_seconds} seconds... (attempt {attempt + 2}/{max_retries})"
+            output(message, debug_logger, Level.WARNING)
+            raise Retry(retry_delay_seconds)
+        message = "Maximum retries reached. Download failed."
+        output(message, debug_logger, Level.ERROR)
+        archive.release(href)
+        count_video("failed")
+        return
+
+    # If we reach here, the download was successful
+    metrics.observe(host, "download", time.perf_counter() - started)
+    metrics.count(host, "downloads")
+    message = "Download successful."
+    output(message, debug_logger, Level.INFO)  # Log success to debug
+    output(message, download_logger, Level.SUCCESS)  # Log success to download log
+
+    # Save the link to the archive *after* successful download
+    try:
+        archive.complete(href)
+    except IOError as e:
+        message = f"Error writing downloaded link to file {file_path}: {e}"
+        output(message, debug_logger, Level.ERROR)
+        # Decide if this write failure should fail the whole download attempt
+        # For now, we consider the download successful but log the file write issue.
+
+    count_video("saved")
 
 
 def get_video_links(full_url, response, page_number, video_location, site_properties):
@@ -195,43 +249,38 @@ def get_video_links(full_url, response, page_number, video_location, site_proper
     message = f"Parsing page {page_number}: {full_url}"
     output(message, debug_logger, Level.INFO)
     if "has_infinite_scroll" in site_properties:
-        from selenium import webdriver
-        from selenium.webdriver.chrome.options import Options
+        with browser_pool.lease() as driver:
+            driver.get(full_url)
 
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
+            last_height = driver.execute_script("return document.body.scrollHeight")
 
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.get(full_url)
+            while True:
+                # Scroll to the bottom of the page
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
 
-        last_height = driver.execute_script("return document.body.scrollHeight")
+                # Wait for new content to load
+                time.sleep(2)
 
-        while True:
-            # Scroll to the bottom of the page
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-
-            # Wait for new content to load
-            time.sleep(2)
-
-            # Calculate new scroll height and compare with the last scroll height
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                # If no more content is loaded, exit the loop
-                soup = BeautifulSoup(response.content, "html.parser")
-                try:
-                    raw_links = soup.select(video_location)
-                except Exception:
-                    message = f"Couldn't found video links on site {full_url}\n"
-                    output(message, debug_logger, Level.ERROR)
-                    return None
-                break
+                # Calculate new scroll height and compare with the last scroll height
+                new_height = driver.execute_script("return document.body.scrollHeight")
+                if new_height == last_height:
+                    # If no more content is loaded, exit the loop
+                    page_source = driver.page_source
+                    break
 
-            last_height = new_height
+                last_height = new_height
+
+        try:
+            # The scrolled page, not the initial response, has every link
+            raw_links = select(page_source, video_location, extractor)
+        except Exception:
+            message = f"Couldn't found video links on site {full_url}\n"
+            output(message, debug_logger, Level.ERROR)
+            return None
 
     else:
-        soup = BeautifulSoup(response, "html.parser")
         try:
-            raw_links = soup.select(video_location)
+            raw_links = select(response.content, video_location, extractor)
         except Exception:
             message = f"Couldn't found video links on site {full_url}\n"
             output(message, debug_logger, Level.ERROR)
@@ -253,19 +302,21 @@ def pre_pre_get_links(
     **kwargs,
 ):
     page = 1
-    while True:
-        all_links, result = pre_get_links(
-            query,
-            category,
-            page,
-            **kwargs,
-        )
-
-        if result:
-            page += 1
-        else:
-            break
+    try:
+        while True:
+            all_links, result = pre_get_links(
+                query,
+                category,
+                page,
+                **kwargs,
+            )
 
+            if result:
+                page += 1
+            else:
+                break
+    finally:
+        finish_listing_crawls()
     return all_links
 
 
@@ -273,22 +324,30 @@ def pre_get_links(
     query,
     category,
     page,
+    sites=None,
     **kwargs,
 ):
     global debug_logger
     result = True
-    # Assuming max_pages is defined somewhere
-    website_count = range(len(kwargs["names"]))
+    # Whether any site still had pages to fetch in this round
+    active = False
+    # All sites unless `sites` (indexes into kwargs["names"]) picks some
+    website_count = range(len(kwargs["names"])) if sites is None else sites
     for i in website_count:
         website_name = kwargs["names"][i]
         kwargs["max_page_site"].setdefault(website_name, None)
         message = f"Current website: {website_name}"
         output(message, debug_logger, Level.INFO)
+        listing_crawl = get_listing_crawl(website_name, query, category)
+        if listing_crawl is not None and listing_crawl.stopped:
+            continue
         if kwargs["max_page_site"][website_name] is not None:
             if (
                 page >= kwargs["max_page_site"][website_name]
                 and kwargs["max_page_site"][website_name] != 0
             ):
+                if listing_crawl is not None:
+                    listing_crawl.end()
                 message = f"Max page reached for {website_name}: {kwargs['max_page_site'][website_name]}"
                 output(message, debug_logger, Level.INFO)
                 continue
@@ -372,65 +431,48 @@ def pre_get_links(
             **category_params,
         )
 
-        response = retry_request(full_url.replace(" ", "+"), user_agent, debug_logger)
+        active = True
+        response = retry_request(
+            full_url.replace(" ", "+"), user_agent, debug_logger, client=http_client
+        )
         if response:
             if page == 1 and kwargs["pre_click_actions"][i]:
-                from selenium import webdriver
                 from selenium.webdriver.common.by import By
-                from selenium.webdriver.chrome.service import Service as ChromeService
                 from selenium.webdriver.support.ui import WebDriverWait
                 from selenium.webdriver.support import expected_conditions as EC
                 from selenium.common.exceptions import TimeoutException
-                from webdriver_manager.chrome import ChromeDriverManager
-
-                # Set Chrome options for headless mode
-                options = webdriver.ChromeOptions()
-                options.add_argument(
-                    "--headless=new"
-                )  # Use "--headless" for older versions if needed
-                options.add_argument("--disable-gpu")
-                options.add_argument("--window-size=1920,1080")
-                options.add_argument("--no-sandbox")
-                options.add_argument("--disable-dev-shm-usage")
-
-                # Setup the Chrome driver with headless options
-                driver = webdriver.Chrome(
-                    service=ChromeService(ChromeDriverManager().install()),
-                    options=options,
-                )
 
-                try:
-                    message = f"Opening {kwargs['base_urls'][i]} in browser and doing click on {kwargs['pre_click_actions'][i]}"
-                    output(message, debug_logger, Level.INFO)
+                with browser_pool.lease() as driver:
+                    try:
+                        message = f"Opening {kwargs['base_urls'][i]} in browser and doing click on {kwargs['pre_click_actions'][i]}"
+                        output(message, debug_logger, Level.INFO)
 
-                    driver.get(kwargs["base_urls"][i])
-
-                    # Wait until the page is fully loaded
-                    WebDriverWait(driver, 30).until(
-                        lambda d: d.execute_script("return document.readyState")
-                        == "complete"
-                    )
-
-                    # Find and click the element
-                    element_locator = (
-                        By.CSS_SELECTOR,
-                        kwargs["pre_click_actions"][i],
-                    )
-                    element_to_click = driver.find_element(*element_locator)
-                    element_to_click.click()
-                    print("Element clicked successfully!")
-
-                    # Optionally, wait for the page to change after click
-                    WebDriverWait(driver, 30).until(EC.staleness_of(element_to_click))
-
-                except TimeoutException:
-                    print(
-                        "Timed out waiting for the page to load or the element to update."
-                    )
-                except Exception as e:
-                    print(f"An error occurred: {e}")
-                finally:
-                    driver.quit()
+                        driver.get(kwargs["base_urls"][i])
+
+                        # Wait until the page is fully loaded
+                        WebDriverWait(driver, 30).until(
+                            lambda d: d.execute_script("return document.readyState")
+                            == "complete"
+                        )
+
+                        # Find and click the element
+                        element_locator = (
+                            By.CSS_SELECTOR,
+                            kwargs["pre_click_actions"][i],
+                        )
+                        element_to_click = driver.find_element(*element_locator)
+                        element_to_click.click()
+                        print("Element clicked successfully!")
+
+                        # Optionally, wait for the page to change after click
+                        WebDriverWait(driver, 30).until(EC.staleness_of(element_to_click))
+
+                    except TimeoutException:
+                        print(
+                            "Timed out waiting for the page to load or the element to update."
+                        )
+                    except Exception as e:
+                        print(f"An error occurred: {e}")
 
             links = get_video_links(
                 full_url,
@@ -454,33 +496,44 @@ def pre_get_links(
                     all_links[category][website_name].extend(links)
                 else:
                     all_links[website_name].extend(links)
-                scrape_count = 0
-                with open(kwargs["scraped_file_path"], "a+") as f:
-                    f.seek(0)
+                if link_sink is not None:
                     for link in links:
-                        if link not in f.read():
-                            f.write(link + "\n")
-                            global total_link_counter
+                        link_sink(query or category, website_name, link)
+                scrape_count = 0
+                scraped_index = open_link_index(kwargs["scraped_file_path"])
+                global total_link_counter
+                for link in links:
+                    new = scraped_index.add(link)
+                    if listing_crawl is not None:
+                        listing_crawl.observe(not new)
+                    if new:
+                        with counter_lock:
                             total_link_counter += 1
-                            if total_link_counter >= max_videos:
-                                message = f"Max videos reached: {max_videos}"
-                                output(message, debug_logger, Level.INFO)
-                                result = False
-                                break
-                        else:
-                            scrape_count += 1
-                    if scrape_count != 0:
-                        message = f"{scrape_count} link(s) already in scraped list file. Skipping...\n"
-                        output(message, debug_logger, Level.SKIP)
+                            reached = total_link_counter >= max_videos
+                        if reached:
+                            message = f"Max videos reached: {max_videos}"
+                            output(message, debug_logger, Level.INFO)
+                            result = False
+                            break
                     else:
-                        print("\n")
+                        scrape_count += 1
+                if scrape_count != 0:
+                    message = f"{scrape_count} link(s) already in scraped list file. Skipping...\n"
+                    output(message, debug_logger, Level.SKIP)
+                else:
+                    print("\n")
+                if listing_crawl is not None and listing_crawl.stopped:
+                    message = f"{listing_crawl.stop_after} known links in a row, stopping incremental crawl of {listing_crawl.listing}"
+                    output(message, debug_logger, Level.INFO)
 
-                    if result is False:
-                        continue
+                if result is False:
+                    continue
                 message = f"Total links found: {total_link_counter}"
                 output(message, debug_logger, Level.INFO)
             else:
                 # del all_links
+                if listing_crawl is not None:
+                    listing_crawl.end()
                 kwargs["max_page_site"][website_name] = page - 1
                 message = f"No links found from {full_url}"
                 output(message, debug_logger, Level.WARNING)
@@ -489,6 +542,9 @@ def pre_get_links(
             kwargs["max_page_site"][website_name] = page - 1
             message = f"No response from {full_url}"
             output(message, debug_logger, Level.WARNING)
+    if not active:
+        # Every site is done with this listing
+        result = False
     return all_links, result
 
 
@@ -510,39 +566,25 @@ def bellesa_links_filter(links):
 
 
 def get_bellesa_url(url):
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
     from selenium.webdriver.common.by import By
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
 
-    # Set up Chrome options to suppress logging
-    chrome_options = Options()
-    chrome_options.add_argument("--log-level=3")
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("window-size=1280,720")
+    with browser_pool.lease() as driver:
+        # Open the URL
+        driver.get(url)
 
-    # Set up Selenium with Chrome WebDriver
-    sys.stderr = open(os.devnull, "w")
-    driver_path = "C:/Programs/chromedriver_win32/chromedriver.exe"
-    service = Service(driver_path)
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-
-    # Open the URL
-    driver.get(url)
-
-    # Wait until the page is fully loaded
-    try:
-        # Adjust the timeout and the condition as needed
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-    except Exception as e:
-        print(f"Error occurred while waiting for the page to load: {e}")
+        # Wait until the page is fully loaded
+        try:
+            # Adjust the timeout and the condition as needed
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+        except Exception as e:
+            print(f"Error occurred while waiting for the page to load: {e}")
 
-    # Get page content and parse with BeautifulSoup
-    html = driver.page_source
+        # Get page content and parse with BeautifulSoup
+        html = driver.page_source
     soup = BeautifulSoup(html, "html.parser")
 
     # Extract the title from the <h2> tag
@@ -575,9 +617,6 @@ def get_bellesa_url(url):
         message = "Link not found."
         output(message, debug_logger, Level.ERROR)
 
-    # Close the browser
-    driver.quit()
-
     return link, title
 
 
@@ -618,6 +657,26 @@ def start_porn_downloader():
     message = "Script started."
     output(message, debug_logger, Level.INFO)
 
+    # Shared HTTP client, unless one was injected before the run
+    global http_client
+    if http_client is None:
+        http_client = create_client(config, user_agent)
+    global extractor
+    if extractor is None:
+        extractor = create_extractor(config, debug_logger)
+    # Browsers start on first use (or are warmed up below) and are reused
+    global browser_pool
+    if browser_pool is None:
+        browser_pool = BrowserPool(
+            browser_pool_size,
+            max_uses=browser_max_uses,
+            driver_path=chromedriver_path,
+            debug_logger=debug_logger,
+        )
+    global state
+    if state is None and state_database:
+        state = open_state(state_database)
+
     yt_dlp_path = download_tool("yt-dlp", os.getcwd())
     ffmpeg_path = download_tool("ffmpeg", os.getcwd())
     message = f"YT-DLP Path: {yt_dlp_path}"
@@ -685,6 +744,18 @@ def start_porn_downloader():
     with open(WEBSITES_JSON_PATH, "r", encoding="utf-8") as file:
         data = json.load(file)
 
+    # Scraped and downloaded links are deduplicated by canonical key, using
+    # the per-site video ids defined in websites.json. Both are loaded once.
+    canonicalizer = UrlCanonicalizer(data)
+    scraped_index = open_link_index(scraped_file_path, canonicalizer)
+    archive = open_archive(
+        downloaded_file_path,
+        bloom_threshold=config.get("archive_bloom_threshold", 1_000_000),
+        key=canonicalizer.key,
+    )
+    message = f"Scraped links: {len(scraped_index)}, downloaded links: {len(archive)}"
+    output(message, debug_logger, Level.INFO)
+
     global websites
     for website in websites:
         if website == "all" and len(websites) == 1:
@@ -711,6 +782,22 @@ def start_porn_downloader():
     message = f"Downloaded filename: {downloaded_filename}\n"
     output(message, debug_logger, Level.INFO)
 
+    needs_browser = any(pre_click_actions) or any(
+        "has_infinite_scroll" in (properties or "") for properties in site_properties
+    )
+    if needs_browser and browser_warm:
+        browser_pool.warm_up(browser_warm)
+
+    # Sites are scraped in parallel; rate_limit (requests/sec) and rate_burst
+    # in websites.json throttle a single site
+    for entry in data:
+        if entry.get("rate_limit") and entry.get("name") in names:
+            http_client.rate_limiter.configure(
+                urlparse(entry["base_url"]).netloc,
+                entry["rate_limit"],
+                entry.get("rate_burst", 1),
+            )
+
     params = {
         "max_videos": max_videos,
         "names": names,
@@ -735,41 +822,8 @@ def start_porn_downloader():
     }
 
     global all_links, total_per_query_link_counter, total_per_category_link_counter
+    global link_sink
 
-    def fetch_links(query=None, category=None):
-        global all_links
-        page = 1
-        total_before = len(all_links)
-        while True:
-            all_links, result = pre_get_links(
-                query=query,
-                category=category,
-                page=page,
-                **params,
-            )
-            if not result:
-                break
-            page += 1
-        return len(all_links) - total_before
-
-    # Handle search queries
-    if search_queries:
-        for query in search_queries:
-            formatted_query = query.replace(" ", "+")
-            all_links.setdefault(query, {})
-            total_per_query_link_counter += fetch_links(query=formatted_query)
-
-    # Handle categories
-    if categories:
-        for category in categories:
-            all_links.setdefault(category, {})
-            total_per_category_link_counter += fetch_links(category=category)
-
-    # Fallback: no search queries or categories
-    if not search_queries and not categories:
-        fetch_links()
-
-    # Download the videos
     def build_video_name(website, tag=None):
         base = f"[{website}]"
         if tag:
@@ -781,7 +835,33 @@ def start_porn_downloader():
 
     base_download_root = download_path
 
-    for key, websites in all_links.items():
+    # Downloads run on a worker pool: download_workers in total and at most
+    # max_concurrent_downloads (websites.json) or max_downloads_per_site per site
+    site_limits = {
+        entry["name"]: entry["max_concurrent_downloads"]
+        for entry in data
+        if entry.get("max_concurrent_downloads")
+    }
+
+    def report_error(website, error):
+        message = f"Download job for {website} failed: {error}"
+        output(message, debug_logger, Level.ERROR)
+
+    # Links are downloaded while scraping continues. At most
+    # download_queue_size links wait for a worker; beyond that the scraper
+    # pauses until the downloads catch up.
+    pool = WorkerPool(
+        download_workers,
+        site_limits,
+        max_downloads_per_site,
+        on_error=report_error,
+        name="download",
+        max_pending=download_queue_size,
+    ).start()
+    message = f"Download workers: {pool.workers}, per-site limits: {site_limits or 'none'}, queue size: {download_queue_size or 'unbounded'}"
+    output(message, debug_logger, Level.INFO)
+
+    def enqueue_download(key, website, link):
         # Determine the tag to include in video name
         if is_query_mode:
             tag = key  # query string
@@ -790,21 +870,91 @@ def start_porn_downloader():
         else:
             tag = None  # fallback mode
 
-        for website, links in websites.items():
-            for link in links:
-                destination_dir = os.path.join(
-                    base_download_root, f"{tag} - {website}" if tag else website
-                )
-                os.makedirs(destination_dir, exist_ok=True)
-                video_name = build_video_name(website, tag)
-                download_video(
-                    file_path,
-                    destination_dir,
-                    video_name,
-                    yt_dlp_path,
-                    ffmpeg_path,
-                    link,
+        destination_dir = os.path.join(
+            base_download_root, f"{tag} - {website}" if tag else website
+        )
+        os.makedirs(destination_dir, exist_ok=True)
+        pool.submit(
+            website,
+            download_video,
+            file_path,
+            destination_dir,
+            build_video_name(website, tag),
+            yt_dlp_path,
+            ffmpeg_path,
+            link,
+        )
+
+    def fetch_links(query=None, category=None):
+        # Every site paginates on its own, up to scrape_workers at once, so
+        # a slow or hanging site only holds up itself
+        total_before = len(all_links)
+        stop = threading.Event()
+
+        def crawl_site(i):
+            page = 1
+            while not stop.is_set():
+                _, result = pre_get_links(
+                    query=query,
+                    category=category,
+                    page=page,
+                    sites=[i],
+                    **params,
                 )
+                if total_link_counter >= max_videos:
+                    stop.set()
+                if not result:
+                    break
+                page += 1
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, scrape_workers), thread_name_prefix="scrape"
+        )
+        try:
+            futures = [executor.submit(crawl_site, i) for i in range(len(names))]
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Sites still waiting for a worker return at once
+            stop.set()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            finish_listing_crawls()
+        return len(all_links) - total_before
+
+    link_sink = enqueue_download
+    try:
+        # Handle search queries
+        if search_queries:
+            for query in search_queries:
+                formatted_query = query.replace(" ", "+")
+                all_links.setdefault(query, {})
+                total_per_query_link_counter += fetch_links(query=formatted_query)
+
+        # Handle categories
+        if categories:
+            for category in categories:
+                all_links.setdefault(category, {})
+                total_per_category_link_counter += fetch_links(category=category)
+
+        # Fallback: no search queries or categories
+        if not search_queries and not categories:
+            fetch_links()
+    except KeyboardInterrupt:
+        dropped = pool.cancel()
+        message = f"Interrupted, dropped {dropped} queued download(s); waiting for running downloads"
+        output(message, debug_logger, Level.WARNING)
+        raise
+    finally:
+        # Scraping is done: stop feeding the pool, then let it drain
+        link_sink = None
+        pool.join()
+        if browser_pool.started:
+            message = f"Browsers started: {browser_pool.started}, recycled: {browser_pool.recycled}"
+            output(message, debug_logger, Level.INFO)
+        browser_pool.close()
+        browser_pool = None
 
     # Stop timer
     end_time = datetime.now()
@@ -1,12 +1,15 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from bs4 import BeautifulSoup
 
 from .utils.parser import create_parser
 from .utils.config import read_configuration
-from .utils.request import retry_request
+from .utils.request import retry_request, create_client
 from .utils.output import initialize_logs, output, Level
+from .utils.extract import parse, select, create_extractor
+from .utils.magnets import open_store
+from .utils.state import IncrementalCrawl, ItemStatus, open_state
 
 # Global config variables
 file_name = "rarbg.yml"
@@ -22,23 +25,136 @@ use_search_queries = False
 magnet_file = os.path.join(os.getcwd(), "Magnets.txt")
 search_queries = []
 delay = 5
+concurrency = 1
+state_database = None
+incremental_stop_after = 0
+full_sweep_interval = 0
 user_agent = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:124.0) Gecko/20100101 Firefox/124.0"
 )
 
 # Global variables
-total_downloads = 0
 debug_logger = None
 download_logger = None
+http_client = None
+extractor = None
+detail_pages_fetched = 0
+detail_fetch_seconds = 0.0
+state = None
+listing_crawl = None
 
+STATE_SOURCE = "rarbg"
 
-def parse_website(url, base_urls, magnet_file, user_agent, delay):
-    """Parse listing/search pages and enqueue magnet links."""
+
+def fetch_detail_page(link_url, base_urls, user_agent):
+    """Fetch a torrent detail page and extract its magnet link and title.
+
+    Runs on a worker thread, so it only reads the page and never touches the
+    magnet file. Returns a `(link_url, magnet_link, title)` tuple where the last
+    two items are None when they could not be found.
+    """
+
+    global debug_logger
+
+    response_followed = retry_request(
+        link_url, user_agent, debug_logger, 5, 0, base_urls, http_client
+    )
+
+    if response_followed is None:
+        message = f"Failed to retrieve the movie page: {link_url}"
+        output(message, debug_logger, Level.WARNING)
+        return link_url, None, None
+
+    message = f"Parsing movie page: {response_followed.url}"
+    output(message, debug_logger, Level.INFO)
+    document = parse(
+        response_followed.content,
+        ["td.tlista a", "td.block b h1.black"],
+        extractor,
+    )
+
+    link_element = document.select_one("td.tlista a")
+    magnet_link = link_element["href"] if link_element else None
+    if magnet_link is None:
+        message = f"No magnet link found on page {link_url}"
+        output(message, debug_logger, Level.WARNING)
+
+    title_element = document.select_one("td.block b h1.black")
+    title = title_element.text.strip() if title_element else None
+    if title is None:
+        message = f"No title found on page {link_url}"
+        output(message, debug_logger, Level.WARNING)
+
+    return link_url, magnet_link, title
+
+
+def skip_known_links(link_urls):
+    """Drop detail pages handled in earlier runs from an incremental crawl.
+
+    Known links still count towards the stop rule of the current listing; in
+    a full sweep they are fetched again as before.
+    """
+
+    if listing_crawl is None:
+        return link_urls
+    new_links = []
+    for link_url in link_urls:
+        known = state.seen(STATE_SOURCE, link_url)
+        if listing_crawl.observe(known):
+            break
+        if not known or listing_crawl.full_sweep:
+            new_links.append(link_url)
+    return new_links
+
+
+def crawl_listing(listing, url_template, base_urls, magnet_file, user_agent):
+    """Walk the pages of one listing until it ends or only shows known items."""
+    global listing_crawl
+
+    if state is not None:
+        listing_crawl = IncrementalCrawl(
+            state, STATE_SOURCE, listing, incremental_stop_after, full_sweep_interval
+        )
+        message = f"Listing {listing_crawl.describe()}"
+        output(message, debug_logger, Level.INFO)
+
+    # Set page_number to 1
+    page_number = 1
+    while True:
+        # Generate url
+        url = url_template.format(page=page_number)
+
+        # Call the parse_website function
+        result = parse_website(
+            url,
+            base_urls,
+            magnet_file,
+            user_agent,
+        )
+
+        # Increase page_number if result succeeded or exit loop if False
+        if result is True:
+            page_number += 1
+        else:
+            break
+
+    if listing_crawl is not None:
+        listing_crawl.finish()
+        listing_crawl = None
+
+
+def parse_website(url, base_urls, magnet_file, user_agent):
+    """Parse listing/search pages and enqueue magnet links.
+
+    Politeness towards the mirror is enforced by the HTTP client's per-host
+    rate limiter, which is shared by all detail-page workers.
+    """
 
     global debug_logger
+    global detail_pages_fetched
+    global detail_fetch_seconds
 
-    time.sleep(delay)
-    response = retry_request(url, user_agent, debug_logger, 5, 0, base_urls)
+    response = retry_request(url, user_agent, debug_logger, 5, 0, base_urls, http_client)
     if response is None:
         message = f"Failed to retrieve the page: {url}"
         output(message, debug_logger, Level.ERROR)
@@ -46,82 +162,70 @@ def parse_website(url, base_urls, magnet_file, user_agent, delay):
 
     message = f"Parsing page: {response.url}"
     output(message, debug_logger, Level.INFO)
-    soup = BeautifulSoup(response.content, "html.parser")
-    links = soup.select("tr.table2ta > td:nth-child(2) > a")
+    links = select(response.content, "tr.table2ta > td:nth-child(2) > a", extractor)
     message = f"Found {len(links)} links on the page."
     output(message, debug_logger, Level.INFO)
     if links:
-        for link in links:
-            time.sleep(delay)
-            link_url = link["href"]
-            response_followed = retry_request(
-                link_url, user_agent, debug_logger, 5, 0, base_urls
+        link_urls = skip_known_links([link["href"] for link in links])
+        started = time.monotonic()
+
+        # Detail pages are fetched in parallel, but results are consumed in page
+        # order on this thread so magnet dedup behaves exactly as before.
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = executor.map(
+                lambda link_url: fetch_detail_page(link_url, base_urls, user_agent),
+                link_urls,
+            )
+            for link_url, magnet_link, title in results:
+                if magnet_link and title:
+                    message = f"Magnet found for: {title}"
+                    output(message, debug_logger, Level.INFO)
+                    parse_magnet(
+                        magnet_file,
+                        magnet_link,
+                        title,
+                    )
+                    if state is not None:
+                        state.mark(STATE_SOURCE, link_url, ItemStatus.DONE, url=magnet_link)
+                else:
+                    message = "No magnet link and/or title found on the page."
+                    output(message, debug_logger, Level.ERROR)
+
+        elapsed = time.monotonic() - started
+        detail_pages_fetched += len(link_urls)
+        detail_fetch_seconds += elapsed
+        pages_per_second = len(link_urls) / elapsed if elapsed > 0 else 0.0
+        message = (
+            f"Fetched {len(link_urls)} detail pages in {elapsed:.1f}s "
+            f"({pages_per_second:.2f} pages/sec, concurrency {concurrency})."
+        )
+        output(message, debug_logger, Level.INFO)
+        if listing_crawl is not None and listing_crawl.stopped:
+            message = (
+                f"{listing_crawl.stop_after} known items in a row, "
+                f"stopping incremental crawl of {listing_crawl.listing}."
             )
-
-            if response_followed is None:
-                message = f"Failed to retrieve the movie page: {link_url}"
-                output(message, debug_logger, Level.WARNING)
-                continue
-
-            message = f"Parsing movie page: {response_followed.url}"
             output(message, debug_logger, Level.INFO)
-            soup_followed = BeautifulSoup(response_followed.content, "html.parser")
-
-            link_element = soup_followed.select_one("td.tlista a")
-            magnet_link = link_element["href"] if link_element else None
-            if magnet_link is None:
-                message = f"No magnet link found on page {link_url}"
-                output(message, debug_logger, Level.WARNING)
-
-            title_element = soup_followed.select_one("td.block b h1.black")
-            title = title_element.text.strip() if title_element else None
-            if title is None:
-                message = f"No title found on page {link_url}"
-                output(message, debug_logger, Level.WARNING)
-
-            if magnet_link and title:
-                message = f"Magnet found for: {title}"
-                output(message, debug_logger, Level.INFO)
-                parse_magnet(
-                    magnet_file,
-                    magnet_link,
-                    title,
-                )
-            else:
-                message = "No magnet link and/or title found on the page."
-                output(message, debug_logger, Level.ERROR)
+            return False
         return True
 
+    if listing_crawl is not None:
+        listing_crawl.end()
     message = "No links found on page, exiting script."
     output(message, debug_logger, Level.WARNING)
     return False
 
 
 def parse_magnet(magnet_file, magnet_link, title):
-    """Persist a magnet link if it is new."""
+    """Persist a magnet link if its torrent is new."""
 
     global debug_logger
     global download_logger
-    global total_downloads
-
-    if not os.path.exists(magnet_file):
-        with open(magnet_file, "w") as file:
-            file.write(f"{magnet_link}\n")
-
-        message = f"Created a new file and added magnet link for this torrent: {title}"
-        output(message, debug_logger, Level.INFO)
-        total_downloads += 1
-        return
-
-    with open(magnet_file, "r") as file:
-        existing_links = file.readlines()
 
-    if magnet_link + "\n" not in existing_links:
-        with open(magnet_file, "a") as file:
-            file.write(f"{magnet_link}\n")
+    # Dedup by infohash against the store's index instead of rereading the file
+    if open_store(magnet_file).add(magnet_link):
         message = f"Added magnet link: {title}"
         output(message, download_logger, Level.SUCCESS)
-        total_downloads += 1
     else:
         message = f"Magnet link already exists in the file for this torrent: {title}"
         output(message, debug_logger, Level.INFO)
@@ -138,11 +242,18 @@ def rarbg_downloader():
     global use_search_queries
     global magnet_file
     global delay
+    global concurrency
     global user_agent
+    global state_database
+    global incremental_stop_after
+    global full_sweep_interval
 
     # Import global variables
     global debug_logger
     global download_logger
+    global http_client
+    global extractor
+    global state
 
     # Loading config
     config = read_configuration(file_name)
@@ -162,6 +273,18 @@ def rarbg_downloader():
         user_agent = config["user_agent"]
     if "delay" in config:
         delay = config["delay"]
+    if "concurrency" in config:
+        concurrency = config["concurrency"]
+    if "state_database" in config:
+        state_database = config["state_database"]
+    if "incremental_stop_after" in config:
+        incremental_stop_after = config["incremental_stop_after"]
+    if "full_sweep_interval" in config:
+        full_sweep_interval = config["full_sweep_interval"]  # In hours
+
+    # Shared HTTP client, unless one was injected before the run
+    if http_client is None:
+        http_client = create_client(config, user_agent, delay)
 
     # Loading Parser
     if 1 == 2:
@@ -172,60 +295,47 @@ def rarbg_downloader():
     message = "Script started."
     output(message, debug_logger, Level.INFO)
 
+    if extractor is None:
+        extractor = create_extractor(config, debug_logger)
+    message = f"HTML engine: {extractor.engine}"
+    output(message, debug_logger, Level.INFO)
+
+    if state is None and state_database:
+        state = open_state(state_database)
+
     # Query index page
     if use_index_page:
-        # Set page_number to 1
-        page_number = 1
-        while True:
-            # Generate url
-            url = f"xxx/{page_number}/"
-
-            # Call the parse_website function
-            result = parse_website(
-                url,
+        crawl_listing("index", "xxx/{page}/", base_urls, magnet_file, user_agent)
+
+    # Query search queries
+    if use_search_queries:
+        for query in search_queries:
+            crawl_listing(
+                f"search:{query}",
+                "search/{page}/?search=" + query + "&category=xxx",
                 base_urls,
                 magnet_file,
                 user_agent,
-                delay,
             )
 
-            # Increase page_number if result succeeded or exit loop if False
-            if result is True:
-                page_number += 1
-            else:
-                break
-
-    # Query search queries
-    if use_search_queries:
-        for query in search_queries:
-            # Set page_number to 1
-            page_number = 1
-            while True:
-                # Generate url
-                url = f"search/{page_number}/?search={query}&category=xxx"
-
-                # Call the parse_website function
-                result = parse_website(
-                    url,
-                    base_urls,
-                    magnet_file,
-                    user_agent,
-                    delay,
-                )
-
-                # Increase page_number if result succeeded or exit loop if False
-                if result is True:
-                    page_number += 1
-                else:
-                    break
+    magnet_store = open_store(magnet_file)
+    magnet_store.commit()
 
     # Stop timer
     end_time = datetime.now()
 
     # Calculate script running time
     time_difference = str(end_time - start_time)
-    message = f"Script finished. Duration: {time_difference}, Downloads: {str(total_downloads)}"
+    message = f"Script finished. Duration: {time_difference}, Downloads: {magnet_store.stored}"
     output(message, debug_logger, Level.INFO)
+    message = f"Request outcomes: {http_client.retry_policy.summary()}"
+    output(message, debug_logger, Level.INFO)
+    if detail_fetch_seconds > 0:
+        message = (
+            f"Detail pages: {detail_pages_fetched}, "
+            f"average {detail_pages_fetched / detail_fetch_seconds:.2f} pages/sec."
+        )
+        output(message, debug_logger, Level.INFO)
 
 
 if __name__ == "__main__":
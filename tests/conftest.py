@@ -0,0 +1,16 @@
+import os
+import sys
+import importlib.util
+
+# The repository root is the `media_downloader` package itself
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "media_downloader" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "media_downloader",
+        os.path.join(ROOT, "__init__.py"),
+        submodule_search_locations=[ROOT],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["media_downloader"] = module
+    spec.loader.exec_module(module)
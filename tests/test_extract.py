@@ -0,0 +1,22 @@
+import pytest
+
+from media_downloader.utils.extract import ENGINES, Extractor, engine_available
+
+ROWS = (
+    '<table>'
+    '<tr class="table2ta x"><td>1</td><td><a href="/multi">a</a></td></tr>'
+    '<tr class="table2ta"><td>1</td><td><a href="/single">b</a></td></tr>'
+    '<tr class="table2tax"><td>1</td><td><a href="/other">c</a></td></tr>'
+    '</table>'
+)
+SELECTOR = "tr.table2ta > td:nth-child(2) > a"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("partial", [True, False])
+def test_multi_class_rows_match_on_every_engine(engine, partial):
+    if not engine_available(engine):
+        pytest.skip(f"{engine} is not installed")
+    extractor = Extractor(engine, partial=partial)
+    links = [node.get("href") for node in extractor.select(ROWS, SELECTOR)]
+    assert links == ["/multi", "/single"]
@@ -0,0 +1,38 @@
+from media_downloader.utils.magnets import MagnetStore
+
+
+def magnet(character):
+    return f"magnet:?xt=urn:btih:{character * 40}&dn=Release+{character}"
+
+
+def test_rewritten_magnet_file_rebuilds_the_index(tmp_path):
+    path = str(tmp_path / "Magnets.txt")
+    store = MagnetStore(path)
+    assert store.add(magnet("a"))
+    store.commit()
+
+    # Rewritten in place with more content than the index covers
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("".join(f"{magnet(character)}\n" for character in "bcd"))
+
+    reopened = MagnetStore(path)
+    assert magnet("a") not in reopened
+    for character in "bcd":
+        assert magnet(character) in reopened
+    assert len(reopened) == 3
+    assert reopened.add(magnet("a"))
+
+
+def test_appended_lines_are_picked_up(tmp_path):
+    path = str(tmp_path / "Magnets.txt")
+    store = MagnetStore(path)
+    store.add(magnet("a"))
+    store.commit()
+
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(f"{magnet('b')}\n")
+
+    reopened = MagnetStore(path)
+    assert magnet("a") in reopened
+    assert magnet("b") in reopened
+    assert not reopened.add(magnet("a"))
@@ -0,0 +1,159 @@
+import os
+import math
+import bisect
+import hashlib
+import threading
+from array import array
+
+
+def _digest(key):
+    """64-bit digest of `key`, used by the Bloom filter and compact mode."""
+    return int.from_bytes(
+        hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `error_rate`."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: derive all k positions from two 32-bit halves
+        first, second = digest >> 32, (digest & 0xFFFFFFFF) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+
+class DownloadArchive:
+    """Links that were downloaded, loaded once from an append-only text file.
+
+    Archives up to `bloom_threshold` entries are held in a plain set. Larger
+    ones switch to a compact mode: a Bloom filter answers most lookups for new
+    links without touching anything else, and a sorted array of 64-bit
+    digests confirms hits (8 bytes per entry instead of a Python string).
+
+    `key` maps a link to its dedup key (e.g. `UrlCanonicalizer.key`); by
+    default links are compared as written.
+
+    Links being downloaded can be claimed so that concurrent workers never
+    fetch the same video twice; `complete` appends the link to the file and
+    releases the claim.
+    """
+
+    def __init__(self, path, bloom_threshold=1_000_000, error_rate=0.001, key=None):
+        self.path = path
+        self.key = key or str.strip
+        self.bloom_threshold = bloom_threshold
+        self.error_rate = error_rate
+        self.keys = None
+        self.bloom = None
+        self.digests = None
+        self.new_digests = set()
+        self.in_flight = set()
+        self._lock = threading.Lock()
+        self.load()
+
+    def _lines(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8", errors="replace") as file:
+            for line in file:
+                if line.strip():
+                    yield self.key(line)
+
+    def load(self):
+        keys = set()
+        for key in self._lines():
+            keys.add(key)
+            if len(keys) > self.bloom_threshold:
+                break
+        else:
+            self.keys = keys
+            return
+
+        # Too large for a set: switch to the Bloom filter + digest array
+        digests = array("Q", sorted({_digest(key) for key in self._lines()}))
+        self.keys = None
+        self.bloom = BloomFilter(len(digests) * 2, self.error_rate)
+        for digest in digests:
+            self.bloom.add(digest)
+        self.digests = digests
+
+    def __len__(self):
+        with self._lock:
+            if self.keys is not None:
+                return len(self.keys)
+            return len(self.digests) + len(self.new_digests)
+
+    def _contains(self, key):
+        # Caller holds the lock
+        if self.keys is not None:
+            return key in self.keys
+        digest = _digest(key)
+        if digest not in self.bloom:
+            return False
+        if digest in self.new_digests:
+            return True
+        index = bisect.bisect_left(self.digests, digest)
+        return index < len(self.digests) and self.digests[index] == digest
+
+    def __contains__(self, href):
+        with self._lock:
+            return self._contains(self.key(href))
+
+    def claim(self, href):
+        """Reserve `href` for download; False if it is archived or in flight."""
+        key = self.key(href)
+        with self._lock:
+            if key in self.in_flight or self._contains(key):
+                return False
+            self.in_flight.add(key)
+            return True
+
+    def release(self, href):
+        """Drop the claim on `href` after a failed download."""
+        with self._lock:
+            self.in_flight.discard(self.key(href))
+
+    def complete(self, href):
+        """Record `href` as downloaded, in memory and in the archive file."""
+        key = self.key(href)
+        with self._lock:
+            self.in_flight.discard(key)
+            if self._contains(key):
+                return
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(f"{href.strip()}\n")
+            if self.keys is not None:
+                self.keys.add(key)
+            else:
+                digest = _digest(key)
+                self.bloom.add(digest)
+                self.new_digests.add(digest)
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path, **kwargs):
+    """Return the process-wide `DownloadArchive` for `path`, loading it once."""
+    key = os.path.abspath(path)
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = DownloadArchive(path, **kwargs)
+        return _archives[key]
@@ -0,0 +1,256 @@
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote_plus
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .retry import Outcome, RetryPolicy
+from .replay import STATS_PATH
+
+GRAPHQL_PATH = "/graphql"
+SEARCH_QUERY = """
+query TorrentContentSearch($input: TorrentContentSearchQueryInput!) {
+  torrentContent {
+    search(input: $input) {
+      items {
+        infoHash
+        title
+        torrent {
+          magnetUri
+        }
+      }
+      totalCount
+      hasNextPage
+    }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    """The endpoint answered, but not with search results."""
+
+
+class BitmagnetApi:
+    """Client for the GraphQL API that bitmagnet's web UI is built on.
+
+    `search` fetches one page of `torrentContent.search` results; `magnets`
+    pages through a whole query with `limit`/`offset`. Requests go through
+    `rate_limiter` (if given) and are retried with `retry_policy` backoff.
+    The session is thread-safe for the concurrent queries of `bitmagnet.py`.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        page_size=500,
+        timeout=30,
+        rate_limiter=None,
+        retry_policy=None,
+        max_retries=3,
+        pool_maxsize=10,
+        path=GRAPHQL_PATH,
+    ):
+        self.url = base_url.rstrip("/") + path
+        self.page_size = page_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _post(self, payload):
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self.url)
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                outcome = self.retry_policy.classify(e)
+                self.retry_policy.record(outcome)
+                if outcome == Outcome.PERMANENT or attempt > self.max_retries:
+                    raise
+                response = getattr(e, "response", None)
+                time.sleep(
+                    self.retry_policy.backoff(
+                        attempt, self.retry_policy.retry_after(response)
+                    )
+                )
+
+    def search(self, query_string=None, limit=None, offset=0):
+        """One page of results: `(items, has_next_page, total_count)`."""
+        search_input = {
+            "limit": limit or self.page_size,
+            "offset": offset,
+            "totalCount": True,
+            "hasNextPage": True,
+        }
+        if query_string:
+            search_input["queryString"] = query_string
+        data = self._post({"query": SEARCH_QUERY, "variables": {"input": search_input}})
+        if data.get("errors"):
+            raise GraphQLError("; ".join(error.get("message", "") for error in data["errors"]))
+        try:
+            result = data["data"]["torrentContent"]["search"]
+        except (KeyError, TypeError):
+            raise GraphQLError(f"Unexpected response from {self.url}")
+        return result["items"] or [], result.get("hasNextPage"), result.get("totalCount")
+
+    def magnets(self, query_string=None, max_pages=0):
+        """Yield the magnet URIs of every result page of `query_string`."""
+        page = 0
+        offset = 0
+        while max_pages == 0 or page < max_pages:
+            items, has_next_page, _ = self.search(query_string, offset=offset)
+            page += 1
+            offset += len(items)
+            for item in items:
+                magnet_uri = (item.get("torrent") or {}).get("magnetUri")
+                if magnet_uri:
+                    yield magnet_uri
+            # Older servers don't report hasNextPage; a short page is the last one
+            if not items or has_next_page is False or (
+                has_next_page is None and len(items) < self.page_size
+            ):
+                break
+
+    def close(self):
+        self.session.close()
+
+
+def synthetic_torrents(count, seed="bitmagnet"):
+    """Made-up search results for the stand-in server, every third one a VR release."""
+    torrents = []
+    for number in range(count):
+        info_hash = hashlib.sha1(f"{seed}-{number}".encode("utf-8")).hexdigest()
+        title = f"Synthetic Release {number} {'VR ' if number % 3 == 0 else ''}2160p"
+        torrents.append(
+            {
+                "infoHash": info_hash,
+                "title": title,
+                "torrent": {
+                    "magnetUri": f"magnet:?xt=urn:btih:{info_hash}&dn={quote_plus(title)}"
+                },
+            }
+        )
+    return torrents
+
+
+class StandInServer:
+    """Local stand-in for bitmagnet's GraphQL endpoint.
+
+    Answers `torrentContent.search` from a fixed list of torrents: every word
+    of `queryString` has to appear in the title, and `limit` (capped at
+    `max_limit`) and `offset` page through the matches. Each answer is
+    delayed by `latency` seconds. `GET /__replay__/stats` returns the number
+    of answered queries, like the replay server does.
+    """
+
+    def __init__(self, torrents, host="127.0.0.1", port=0, latency=0.0, max_limit=1000):
+        self.torrents = torrents
+        self.latency = latency
+        self.max_limit = max_limit
+        self.stats = {"served": 0, "missing": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def search(self, search_input):
+        words = (search_input.get("queryString") or "").lower().split()
+        matches = [
+            torrent
+            for torrent in self.torrents
+            if all(word in torrent["title"].lower() for word in words)
+        ]
+        limit = min(search_input.get("limit") or 10, self.max_limit)
+        offset = search_input.get("offset") or 0
+        items = matches[offset:offset + limit]
+        return {
+            "items": items,
+            "totalCount": len(matches),
+            "hasNextPage": offset + len(items) < len(matches),
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if self.path == STATS_PATH:
+                    with server._lock:
+                        body = json.dumps(server.stats).encode("utf-8")
+                    self._send(200, body)
+                else:
+                    self._send(404, b"{}")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length))
+                    search_input = payload["variables"]["input"]
+                except (ValueError, KeyError, TypeError):
+                    server._count("errors")
+                    body = {"errors": [{"message": "expected a torrentContent.search query"}]}
+                    self._send(400, json.dumps(body).encode("utf-8"))
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                server._count("served")
+                result = server.search(search_input)
+                body = {"data": {"torrentContent": {"search": result}}}
+                self._send(200, json.dumps(body).encode("utf-8"))
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="bitmagnet-stand-in", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def serve(count, port=0, latency=0.0, ready=None):
+    """Run a stand-in server with `count` synthetic torrents until terminated."""
+    server = StandInServer(synthetic_torrents(count), port=port, latency=latency)
+    if ready is not None:
+        ready.put(server.base_url)
+    server.httpd.serve_forever()
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .output import output, Level
+
+DEFAULT_ARGUMENTS = (
+    "--headless=new",
+    "--disable-gpu",
+    "--window-size=1920,1080",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--log-level=3",
+)
+DRIVER_CACHE = os.path.join("dependencies", "chromedriver", "driver.json")
+DRIVER_CACHE_MAX_AGE = 7 * 24 * 3600  # Ask webdriver_manager again after a week
+
+_driver_path = None
+_driver_resolved = False
+_driver_lock = threading.Lock()
+
+
+def _local_driver():
+    """A chromedriver placed in dependencies/chromedriver or on the PATH."""
+    for name in ("chromedriver.exe", "chromedriver"):
+        path = os.path.join(os.getcwd(), "dependencies", "chromedriver", name)
+        if os.path.isfile(path):
+            return path
+    return shutil.which("chromedriver")
+
+
+def _read_driver_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    path = data.get("path")
+    if not path or not os.path.isfile(path):
+        return None
+    if time.time() - data.get("resolved_at", 0) > DRIVER_CACHE_MAX_AGE:
+        return None
+    return path
+
+
+def resolve_driver(explicit_path=None, cache_path=DRIVER_CACHE, debug_logger=None):
+    """Path of the chromedriver to use, resolved once per process.
+
+    Tries `explicit_path`, the path cached in `cache_path` by an earlier run,
+    a local driver and finally `ChromeDriverManager().install()`, whose result
+    is cached on disk so the next run skips its version lookup. Returns None
+    when nothing is found; Selenium then picks a driver itself.
+    """
+
+    global _driver_path, _driver_resolved
+    with _driver_lock:
+        if _driver_resolved:
+            return _driver_path
+        path = explicit_path if explicit_path and os.path.isfile(explicit_path) else None
+        if path is None and cache_path:
+            path = _read_driver_cache(cache_path)
+        if path is None:
+            path = _local_driver()
+        if path is None:
+            try:
+                from webdriver_manager.chrome import ChromeDriverManager
+
+                path = ChromeDriverManager().install()
+            except Exception as e:
+                message = f"Could not resolve chromedriver with webdriver_manager: {e}"
+                output(message, debug_logger, Level.WARNING)
+            if path and cache_path:
+                os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+                with open(cache_path, "w", encoding="utf-8") as file:
+                    json.dump({"path": path, "resolved_at": time.time()}, file)
+        _driver_path = path
+        _driver_resolved = True
+        return path
+
+
+class _Browser:
+    __slots__ = ("driver", "started_at", "uses")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.started_at = time.monotonic()
+        self.uses = 0
+
+
+class BrowserPool:
+    """Headless Chrome instances shared by the Selenium call sites.
+
+    `lease()` hands out a running browser (starting one only when none is
+    idle) and takes it back afterwards, so the seconds of Chrome startup are
+    paid once per instance instead of once per page. At most `size` browsers
+    exist at a time; further leases wait.
+
+    Each lease starts from a clean state: extra windows are closed, and the
+    cookies, HTTP cache and the site storage of the origins the previous task
+    had open are cleared over CDP. A browser that can't be reset is
+    replaced, as is one that fails a health check, reaches `max_uses` leases
+    or `max_age` seconds, or whose task raised an error.
+    """
+
+    def __init__(
+        self,
+        size=2,
+        warm=0,
+        max_uses=50,
+        max_age=1800,
+        arguments=DEFAULT_ARGUMENTS,
+        driver_path=None,
+        driver_cache=DRIVER_CACHE,
+        page_load_timeout=60,
+        debug_logger=None,
+    ):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.arguments = arguments
+        self.driver_path = driver_path
+        self.driver_cache = driver_cache
+        self.page_load_timeout = page_load_timeout
+        self.debug_logger = debug_logger
+        self.idle = []
+        self.started = 0
+        self.recycled = 0
+        self.closed = False
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        if warm:
+            self.warm_up(warm)
+
+    def _start(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        options = webdriver.ChromeOptions()
+        for argument in self.arguments:
+            options.add_argument(argument)
+        path = resolve_driver(self.driver_path, self.driver_cache, self.debug_logger)
+        service = Service(path) if path else Service()
+        driver = webdriver.Chrome(service=service, options=options)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        with self._lock:
+            self.started += 1
+        return _Browser(driver)
+
+    def warm_up(self, count):
+        """Start up to `count` browsers in the background so the first leases don't wait."""
+
+        def start():
+            # Counts against `size` like a lease; skip if all slots are taken
+            if not self._slots.acquire(blocking=False):
+                return
+            try:
+                try:
+                    browser = self._start()
+                except Exception as e:
+                    message = f"Could not start browser: {e}"
+                    output(message, self.debug_logger, Level.ERROR)
+                    return
+                with self._lock:
+                    if self.closed or len(self.idle) >= self.size:
+                        browser.driver.quit()
+                    else:
+                        self.idle.append(browser)
+            finally:
+                self._slots.release()
+
+        for _ in range(min(count, self.size)):
+            threading.Thread(target=start, name="browser-warm-up", daemon=True).start()
+
+    def _healthy(self, browser):
+        if self.max_uses and browser.uses >= self.max_uses:
+            return False
+        if self.max_age and time.monotonic() - browser.started_at > self.max_age:
+            return False
+        try:
+            return browser.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reset(self, browser):
+        """Close extra windows and forget the previous task's cookies and storage.
+
+        Raises if the browser can't be cleaned, so it is replaced instead.
+        """
+        driver = browser.driver
+        handles = driver.window_handles
+        origins = set()
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            url = urlparse(driver.current_url)
+            if url.scheme in ("http", "https"):
+                origins.add(f"{url.scheme}://{url.netloc}")
+            if handle != handles[0]:
+                driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+        # WebDriver's delete_all_cookies only covers the current document, so
+        # go through the browser-wide DevTools commands instead
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        for origin in origins:
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+            )
+
+    def _retire(self, browser):
+        with self._lock:
+            self.recycled += 1
+        try:
+            browser.driver.quit()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self.closed:
+                    raise RuntimeError("Browser pool is closed")
+                browser = self.idle.pop() if self.idle else None
+            if browser is None:
+                return self._start()
+            if self._healthy(browser):
+                try:
+                    self._reset(browser)
+                    return browser
+                except Exception as e:
+                    message = f"Could not reset browser, replacing it: {e}"
+                    output(message, self.debug_logger, Level.WARNING)
+            self._retire(browser)
+
+    @contextmanager
+    def lease(self):
+        """Yield a WebDriver for one task and return it to the pool afterwards."""
+        self._slots.acquire()
+        try:
+            browser = self._acquire()
+            browser.uses += 1
+            failed = False
+            try:
+                yield browser.driver
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    keep = not failed and not self.closed
+                    if keep:
+                        self.idle.append(browser)
+                if not keep:
+                    self._retire(browser)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for browser in idle:
+            try:
+                browser.driver.quit()
+            except Exception:
+                pass
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Headers describing the transfer rather than the stored (decoded) body
+SKIPPED_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "keep-alive",
+    "set-cookie",
+    "transfer-encoding",
+}
+
+
+class HttpCache:
+    """Persistent HTTP cache with conditional revalidation and LRU eviction.
+
+    Bodies are stored as files under `directory`, metadata (validators, stored
+    headers, timestamps and sizes) in a SQLite index next to them.
+
+    Freshness is decided per URL by `rules`, a list of `{"pattern": regex,
+    "ttl": seconds}` dictionaries matched in order against the URL as passed to
+    `retry_request` (a relative path when mirrors are used). The first match
+    wins, otherwise `default_ttl` applies. A fresh entry is served without any
+    network traffic; a stale one is revalidated with If-None-Match /
+    If-Modified-Since. A negative TTL disables caching for matching URLs.
+
+    When the stored bodies exceed `max_bytes`, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, directory, max_bytes=1024**3, default_ttl=0, rules=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.rules = [
+            (re.compile(rule["pattern"]), rule["ttl"]) for rule in (rules or [])
+        ]
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"), check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)"
+        )
+        self._db.commit()
+        self.total_size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def ttl(self, key):
+        for pattern, ttl in self.rules:
+            if pattern.search(key):
+                return ttl
+        return self.default_ttl
+
+    def _body_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.body")
+
+    def lookup(self, key):
+        """Return `(entry, fresh)` for `key`, or `(None, False)` when not cached."""
+        if self.ttl(key) < 0:
+            return None, False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, headers, etag, last_modified, stored_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or not os.path.exists(self._body_path(key)):
+            return None, False
+        entry = {
+            "key": key,
+            "url": row[0],
+            "headers": json.loads(row[1]),
+            "etag": row[2],
+            "last_modified": row[3],
+            "stored_at": row[4],
+        }
+        fresh = time.time() - entry["stored_at"] < self.ttl(key)
+        return entry, fresh
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def response(self, entry):
+        """Rebuild a `requests.Response` from a cached entry."""
+        with open(self._body_path(entry["key"]), "rb") as file:
+            body = file.read()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                (time.time(), entry["key"]),
+            )
+            self._db.commit()
+        response = requests.models.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response._content = body
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = entry["url"]
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def store(self, key, response):
+        """Save a successful response under `key` and evict if over budget."""
+        if self.ttl(key) < 0:
+            return
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in SKIPPED_HEADERS
+        }
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(body)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self.total_size += len(body) - (row[0] if row else 0)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.url,
+                    json.dumps(headers),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    now,
+                    now,
+                    len(body),
+                ),
+            )
+            self._db.commit()
+            self._evict()
+
+    def refresh(self, key, response):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            self._db.execute(
+                """UPDATE entries SET stored_at = ?, accessed_at = ?,
+                    etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                WHERE key = ?""",
+                (
+                    time.time(),
+                    time.time(),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    key,
+                ),
+            )
+            self._db.commit()
+
+    def _evict(self):
+        # Caller holds the lock
+        if self.total_size <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at"
+        ).fetchall()
+        for key, size in rows:
+            if self.total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_size -= size
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,317 @@
+import re
+import threading
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+from .output import output, Level
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    import cssselect  # noqa: F401 (needed by lxml's cssselect())
+except ImportError:
+    cssselect = None
+
+# Engines from fastest to slowest; "html.parser" is the reference the others
+# are verified against.
+ENGINES = ("selectolax", "lxml", "bs4-lxml", "html.parser")
+
+# A compound selector made only of a tag name, an id and classes, e.g.
+# "tr.table2ta" or "div#movie-info". Only such selectors drive partial parsing.
+SIMPLE_COMPOUND = re.compile(r"^([a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)$")
+
+
+def engine_available(engine):
+    if engine == "selectolax":
+        return LexborHTMLParser is not None
+    if engine == "lxml":
+        return lxml is not None and cssselect is not None
+    if engine == "bs4-lxml":
+        return lxml is not None
+    return engine == "html.parser"
+
+
+def _decode(markup):
+    if isinstance(markup, str):
+        return markup
+    try:
+        return markup.decode("utf-8")
+    except UnicodeDecodeError:
+        return UnicodeDammit(markup).unicode_markup
+
+
+def _split_groups(selector):
+    """Split a selector list on top-level commas."""
+    groups, depth, current = [], 0, []
+    for char in selector:
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        if char == "," and depth == 0:
+            groups.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    groups.append("".join(current).strip())
+    return groups
+
+
+def _has_class(name):
+    """SoupStrainer matcher for one class token of a (multi-class) attribute."""
+
+    def match(value):
+        if not value:
+            return False
+        tokens = value.split() if isinstance(value, str) else value
+        return name in tokens
+
+    return match
+
+
+def strainer_for(selectors):
+    """Build a `SoupStrainer` that keeps every subtree `selectors` can match.
+
+    Returns None when the selectors don't allow partial parsing: the first
+    compound of every selector must be a plain tag/id/class selector, and
+    sibling combinators (`+`, `~`) would need elements outside the kept
+    subtrees.
+    """
+
+    groups = [group for selector in selectors for group in _split_groups(selector)]
+    compounds = []
+    for group in groups:
+        if re.search(r"[+~]", re.sub(r"\[[^\]]*\]|\([^)]*\)", "", group)):
+            return None
+        first = group.replace(">", " ").split()[0] if group.strip() else ""
+        match = SIMPLE_COMPOUND.match(first)
+        if not first or not match:
+            return None
+        name = match.group(1)
+        attrs = {}
+        for part in re.findall(r"[.#][\w-]+", match.group(2)):
+            if part[0] == "#":
+                attrs["id"] = part[1:]
+            else:
+                # A single class is enough to keep a superset of the matches;
+                # it is matched as a token, so multi-class elements are kept
+                attrs.setdefault("class", _has_class(part[1:]))
+        compounds.append((name.lower() if name else None, attrs))
+
+    if len(compounds) == 1:
+        name, attrs = compounds[0]
+        return SoupStrainer(name, attrs=attrs)
+    # Several selectors: keep every element with one of their tag names
+    names = {name for name, _ in compounds}
+    if None in names:
+        return None
+    return SoupStrainer(sorted(names))
+
+
+class Node:
+    """Engine-independent view of a matched element."""
+
+    __slots__ = ("element",)
+
+    def __init__(self, element):
+        self.element = element
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    @property
+    def text(self):
+        return self.get_text()
+
+
+class SoupNode(Node):
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        value = self.element.get(key)
+        if value is None:
+            return default
+        return " ".join(value) if isinstance(value, list) else value
+
+    def get_text(self):
+        return self.element.get_text()
+
+
+class LxmlNode(Node):
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        return self.element.get(key, default)
+
+    def get_text(self):
+        return self.element.text_content()
+
+
+class LexborNode(Node):
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        value = self.element.attributes.get(key)
+        return default if value is None else value
+
+    def get_text(self):
+        return self.element.text(deep=True)
+
+
+def _fingerprint(nodes):
+    return [(node.get("href"), node.get("src"), " ".join(node.get_text().split())) for node in nodes]
+
+
+class Document:
+    """A page parsed once by one engine, queried with CSS selectors."""
+
+    def __init__(self, extractor, markup, selectors=None):
+        self.extractor = extractor
+        self.markup = markup
+        self.engine = extractor.engine
+        self._reference = None
+        strainer = None
+        if extractor.partial and selectors and self.engine in ("bs4-lxml", "html.parser"):
+            strainer = strainer_for(selectors)
+
+        if self.engine == "selectolax":
+            self.tree = LexborHTMLParser(_decode(markup))
+        elif self.engine == "lxml":
+            text = _decode(markup)
+            # lxml refuses to build a document from an empty page
+            self.tree = lxml.html.document_fromstring(text) if text.strip() else None
+        else:
+            parser = "lxml" if self.engine == "bs4-lxml" else "html.parser"
+            self.tree = BeautifulSoup(markup, parser, parse_only=strainer)
+
+    def _select(self, selector):
+        if self.engine == "selectolax":
+            return [LexborNode(element) for element in self.tree.css(selector)]
+        if self.engine == "lxml":
+            if self.tree is None:
+                return []
+            return [LxmlNode(element) for element in self.tree.cssselect(selector)]
+        return [SoupNode(element) for element in self.tree.select(selector)]
+
+    def select(self, selector):
+        nodes = self._select(selector)
+        if self.extractor.verify and self.engine != self.extractor.reference:
+            if self._reference is None:
+                self._reference = Document(
+                    Extractor(self.extractor.reference, partial=False), self.markup
+                )
+            expected = self._reference.select(selector)
+            if _fingerprint(nodes) != _fingerprint(expected):
+                self.extractor.mismatch(selector, len(nodes), len(expected))
+                return expected
+        return nodes
+
+    def select_one(self, selector):
+        nodes = self.select(selector)
+        return nodes[0] if nodes else None
+
+
+class Extractor:
+    """CSS selector extraction with a pluggable HTML engine.
+
+    `engine` is one of `ENGINES` or "auto" for the fastest one installed
+    (selectolax, then lxml with cssselect, then BeautifulSoup). With `partial`,
+    the BeautifulSoup engines only build the subtrees the selectors can match
+    (see `strainer_for`). With `verify`, every selection is also run through the
+    `reference` engine; on a difference the reference result is returned and
+    the mismatch is logged, so a faster engine can be tried out safely.
+    """
+
+    def __init__(self, engine="auto", partial=True, verify=False, reference="html.parser", debug_logger=None):
+        if engine == "auto":
+            engine = next(name for name in ENGINES if engine_available(name))
+        elif engine not in ENGINES:
+            raise ValueError(f"Unknown HTML engine: {engine}")
+        elif not engine_available(engine):
+            message = f"HTML engine {engine} is not installed, using html.parser."
+            output(message, debug_logger, Level.WARNING)
+            engine = "html.parser"
+        self.engine = engine
+        self.partial = partial
+        self.verify = verify
+        self.reference = reference
+        self.debug_logger = debug_logger
+        self.mismatches = 0
+        self._lock = threading.Lock()
+
+    def parse(self, markup, selectors=None):
+        """Parse `markup` (bytes or str) for the given `selectors`."""
+        return Document(self, markup, selectors)
+
+    def select(self, markup, selector):
+        return self.parse(markup, [selector]).select(selector)
+
+    def select_one(self, markup, selector):
+        return self.parse(markup, [selector]).select_one(selector)
+
+    def mismatch(self, selector, found, expected):
+        with self._lock:
+            self.mismatches += 1
+        message = (
+            f"HTML engine {self.engine} found {found} elements for '{selector}', "
+            f"{self.reference} found {expected}; using the {self.reference} result."
+        )
+        output(message, self.debug_logger, Level.WARNING)
+
+
+_default_extractor = None
+_default_extractor_lock = threading.Lock()
+
+
+def get_default_extractor():
+    """Return the process-wide extractor, creating it on first use."""
+    global _default_extractor
+    with _default_extractor_lock:
+        if _default_extractor is None:
+            _default_extractor = Extractor()
+        return _default_extractor
+
+
+def set_default_extractor(extractor):
+    """Replace the process-wide extractor used when callers don't pass one."""
+    global _default_extractor
+    with _default_extractor_lock:
+        _default_extractor = extractor
+
+
+def create_extractor(config, debug_logger=None):
+    """Build an `Extractor` from a downloader config dictionary.
+
+    Recognised keys: `html_engine` (one of `ENGINES` or "auto"),
+    `html_partial_parse` and `html_engine_verify`.
+    """
+
+    return Extractor(
+        engine=config.get("html_engine", "auto"),
+        partial=config.get("html_partial_parse", True),
+        verify=config.get("html_engine_verify", False),
+        debug_logger=debug_logger,
+    )
+
+
+def parse(markup, selectors=None, extractor=None):
+    return (extractor or get_default_extractor()).parse(markup, selectors)
+
+
+def select(markup, selector, extractor=None):
+    return (extractor or get_default_extractor()).select(markup, selector)
+
+
+def select_one(markup, selector, extractor=None):
+    return (extractor or get_default_extractor()).select_one(markup, selector)
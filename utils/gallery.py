@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+MANIFEST_NAME = ".gallery.json"
+INDEX_NAME = ".gallery_index.json"
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class GalleryIndex:
+    """What `images.py` has stored below its download folder, kept in memory.
+
+    Every gallery folder gets a manifest (`.gallery.json`: source URL, title,
+    expected count, files with sizes, completion flag), and the download
+    folder holds an index of all of them (`.gallery_index.json`) that is read
+    once at startup. Skip decisions then never touch the disk, which matters
+    on network mounts where each `listdir`/`exists` is a round trip.
+
+    Without an index the download folder is scanned once to build it, reading
+    existing manifests where present. `verify` reconciles the index with the
+    disk, e.g. after files were deleted by hand.
+
+    Manifests are written as each gallery finishes; the index is rewritten
+    every `save_every` finished galleries and by `flush` (also run at exit).
+    """
+
+    def __init__(self, root, extensions, save_every=20):
+        self.root = root
+        self.extensions = {extension.lower() for extension in extensions}
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.save_every = max(1, save_every)
+        self.galleries = {}
+        self.unsaved = 0
+        self._lock = threading.RLock()
+        self.load()
+        atexit.register(self.flush)
+
+    def _relative(self, folder):
+        return os.path.relpath(folder, self.root).replace(os.sep, "/")
+
+    def _is_image(self, filename):
+        return os.path.splitext(filename)[1].lower() in self.extensions
+
+    # --- Loading and saving ---
+
+    def load(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as file:
+                    self.galleries = json.load(file).get("galleries", {})
+                return
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read gallery index {self.index_path}: {e}. Rebuilding.")
+        self.galleries = self._scan()
+        self.save()
+
+    def _scan(self):
+        """Read every gallery folder (<title>/<gallery>) below the root."""
+        galleries = {}
+        try:
+            top_levels = [entry for entry in os.scandir(self.root) if entry.is_dir()]
+        except OSError:
+            return galleries
+        for top_level in top_levels:
+            try:
+                folders = [entry for entry in os.scandir(top_level.path) if entry.is_dir()]
+            except OSError:
+                continue
+            for folder in folders:
+                galleries[self._relative(folder.path)] = self._read_folder(folder.path)
+        return galleries
+
+    def _read_folder(self, folder):
+        entry = {
+            "source_url": None,
+            "title": None,
+            "expected_count": None,
+            "files": {},
+            "complete": False,
+        }
+        manifest_path = os.path.join(folder, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as file:
+                    entry.update(json.load(file))
+            except (OSError, ValueError):
+                pass
+        files = {}
+        with os.scandir(folder) as entries:
+            for file_entry in entries:
+                if file_entry.is_file() and self._is_image(file_entry.name):
+                    known = entry["files"].get(file_entry.name) or {}
+                    files[file_entry.name] = {
+                        "size": file_entry.stat().st_size,
+                        "url": known.get("url"),
+                    }
+        entry["files"] = files
+        if entry["expected_count"] is not None and len(files) < entry["expected_count"]:
+            entry["complete"] = False
+        return entry
+
+    def save(self):
+        with self._lock:
+            data = {"updated_at": time.time(), "galleries": self.galleries}
+            os.makedirs(self.root, exist_ok=True)
+            _write_json(self.index_path, data)
+            self.unsaved = 0
+
+    def flush(self):
+        """Save the index if galleries finished since the last save."""
+        with self._lock:
+            if self.unsaved:
+                self.save()
+
+    def verify(self):
+        """Reconcile the index with the disk; returns a summary of changes."""
+        with self._lock:
+            scanned = self._scan()
+            added = [folder for folder in scanned if folder not in self.galleries]
+            removed = [folder for folder in self.galleries if folder not in scanned]
+            changed = [
+                folder
+                for folder, entry in scanned.items()
+                if folder in self.galleries
+                and set(entry["files"]) != set(self.galleries[folder]["files"])
+            ]
+            self.galleries = scanned
+            for folder in added + changed:
+                self._write_manifest(folder)
+            self.save()
+        return {"added": len(added), "removed": len(removed), "changed": len(changed)}
+
+    # --- Lookups ---
+
+    def exists(self, folder):
+        with self._lock:
+            return self._relative(folder) in self.galleries
+
+    def count(self, folder):
+        with self._lock:
+            entry = self.galleries.get(self._relative(folder))
+            return len(entry["files"]) if entry else 0
+
+    def has_file(self, folder, filename):
+        with self._lock:
+            entry = self.galleries.get(self._relative(folder))
+            return entry is not None and filename in entry["files"]
+
+    def is_complete(self, folder):
+        with self._lock:
+            entry = self.galleries.get(self._relative(folder))
+            return bool(entry and entry["complete"])
+
+    # --- Updates ---
+
+    def start(self, folder, source_url, title=None, expected_count=None):
+        """Record a gallery about to be downloaded."""
+        with self._lock:
+            entry = self.galleries.setdefault(
+                self._relative(folder),
+                {"files": {}, "complete": False},
+            )
+            entry.update(
+                {"source_url": source_url, "title": title, "expected_count": expected_count}
+            )
+
+    def add_file(self, folder, filename, size, url=None):
+        with self._lock:
+            entry = self.galleries.setdefault(
+                self._relative(folder),
+                {
+                    "source_url": None,
+                    "title": None,
+                    "expected_count": None,
+                    "files": {},
+                    "complete": False,
+                },
+            )
+            entry["files"][filename] = {"size": size, "url": url}
+
+    def finish(self, folder, complete):
+        """Store the gallery manifest after a gallery is done."""
+        with self._lock:
+            relative = self._relative(folder)
+            if relative not in self.galleries:
+                return
+            if not self.galleries[relative]["files"] and not os.path.isdir(folder):
+                # Nothing was downloaded, so the folder was never created
+                del self.galleries[relative]
+            else:
+                self.galleries[relative]["complete"] = complete
+                self._write_manifest(relative)
+            self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self.save()
+
+    def _write_manifest(self, relative):
+        # Caller holds the lock
+        folder = os.path.join(self.root, relative)
+        if os.path.isdir(folder):
+            entry = dict(self.galleries[relative], updated_at=time.time())
+            _write_json(os.path.join(folder, MANIFEST_NAME), entry)
+
+    def __len__(self):
+        with self._lock:
+            return len(self.galleries)
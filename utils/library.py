@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+RESOLUTION_PRIORITY = {
+    "2160p.x265": 6,
+    "2160p": 5,
+    "1080p.x265": 4,
+    "1080p": 3,
+    "720p.x265": 2,
+    "720p": 1,
+    "None": 0,
+}
+RESOLUTION_PATTERN = re.compile(r"\[(2160p|1080p|720p)\]")
+QUALITY_PATTERN = re.compile(r"\b(BluRay|WEBRip)\b")
+COMPRESSION_PATTERN = re.compile(r"\[(x265)\]")
+
+
+def release_resolution(filename):
+    """Resolution of a YTS release name, e.g. "1080p.x265"; "None" if unknown."""
+    match = RESOLUTION_PATTERN.search(filename)
+    if not match:
+        return "None"
+    resolution = match.group(1)
+    if COMPRESSION_PATTERN.search(filename):
+        resolution += ".x265"
+    return resolution
+
+
+def release_quality(filename):
+    match = QUALITY_PATTERN.search(filename)
+    return match.group(1) if match else None
+
+
+def title_key(filename):
+    """Cleaned "Title (Year)" of a release name, shared by all its versions."""
+    return re.sub(r"\((\d{4})\).*", r"(\1)", filename)
+
+
+def _scan_tree(root, relative):
+    """List the files of `relative` and everything below it.
+
+    Returns `{relative_dir: (mtime_ns, [filenames])}`.
+    """
+
+    directories = {}
+    stack = [relative]
+    while stack:
+        current = stack.pop()
+        path = os.path.join(root, current)
+        filenames = []
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(os.path.join(current, entry.name) if current else entry.name)
+                    elif entry.is_file():
+                        filenames.append(entry.name)
+        except OSError:
+            continue
+        directories[current] = (mtime, filenames)
+    return directories
+
+
+class LibraryIndex:
+    """Which releases of each title exist below a yts download directory.
+
+    Files are grouped by language (the first directory level, e.g. "English")
+    and by `title_key`, so deciding whether a new release is an upgrade is a
+    dict lookup instead of a walk over the whole tree.
+
+    The tree is scanned once, with the top-level directories listed in
+    parallel. With `cache_path` the listing is saved between runs together
+    with every directory's mtime; the next run only rescans directories that
+    changed. Call `add` and `remove` when files are written or deleted.
+    """
+
+    def __init__(self, root, cache_path=None, workers=8):
+        self.root = root
+        self.cache_path = cache_path
+        self.workers = workers
+        self.directories = {}
+        self.titles = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    # --- Building ---
+
+    def load(self):
+        directories = self._load_cache()
+        if directories is None:
+            directories = self._scan(self._top_level())
+        else:
+            directories = self._refresh(directories)
+        with self._lock:
+            self.directories = directories
+            self.titles = {}
+            for relative, (_, filenames) in directories.items():
+                for filename in filenames:
+                    self._index(relative, filename)
+
+    def _top_level(self):
+        top_level = [""]
+        try:
+            with os.scandir(self.root) as entries:
+                top_level += [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+        return top_level
+
+    def _scan(self, relatives):
+        """Scan the given directories (the root non-recursively) in parallel."""
+        directories = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for result in executor.map(self._scan_one, relatives):
+                directories.update(result)
+        return directories
+
+    def _scan_one(self, relative):
+        if relative:
+            return _scan_tree(self.root, relative)
+        # Root only: its subdirectories are scanned by their own workers
+        path = self.root
+        try:
+            with os.scandir(path) as entries:
+                filenames = [entry.name for entry in entries if entry.is_file()]
+            return {"": (os.stat(path).st_mtime_ns, filenames)}
+        except OSError:
+            return {}
+
+    def _refresh(self, cached):
+        """Rescan directories whose mtime differs from the cached listing."""
+        directories = {}
+        changed = []
+        for relative, (mtime, filenames) in cached.items():
+            try:
+                current = os.stat(os.path.join(self.root, relative)).st_mtime_ns
+            except OSError:
+                continue  # Removed
+            if current == mtime:
+                directories[relative] = (mtime, filenames)
+            else:
+                changed.append(relative)
+        if "" in changed:
+            # New top-level directories, e.g. a language downloaded for the first time
+            changed += [
+                relative
+                for relative in self._top_level()
+                if relative and relative not in directories and relative not in changed
+            ]
+        # A changed directory may have new subdirectories, so rescan its tree
+        for relative, listing in self._scan(changed).items():
+            if relative not in directories:
+                directories[relative] = listing
+        return directories
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get("root") != os.path.abspath(self.root):
+            return None
+        return {
+            relative: (listing["mtime"], listing["files"])
+            for relative, listing in data.get("directories", {}).items()
+        }
+
+    def save(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {
+                "root": os.path.abspath(self.root),
+                "directories": {
+                    relative: {"mtime": mtime, "files": filenames}
+                    for relative, (mtime, filenames) in self.directories.items()
+                },
+            }
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.cache_path)
+
+    # --- Index ---
+
+    @staticmethod
+    def _language(relative):
+        return relative.replace(os.sep, "/").split("/", 1)[0]
+
+    def _index(self, relative, filename):
+        # Caller holds the lock
+        key = (self._language(relative), title_key(filename))
+        self.titles.setdefault(key, {})[os.path.join(relative, filename)] = (
+            release_resolution(filename),
+            release_quality(filename),
+        )
+
+    def _touch(self, relative, filenames):
+        # Caller holds the lock; keep the cached mtime in step with our own writes
+        try:
+            mtime = os.stat(os.path.join(self.root, relative)).st_mtime_ns
+        except OSError:
+            mtime = 0
+        self.directories[relative] = (mtime, filenames)
+
+    def add(self, path):
+        relative, filename = os.path.split(os.path.relpath(path, self.root))
+        with self._lock:
+            filenames = self.directories.get(relative, (0, []))[1]
+            if filename not in filenames:
+                filenames = filenames + [filename]
+            self._touch(relative, filenames)
+            self._index(relative, filename)
+
+    def remove(self, path):
+        relative, filename = os.path.split(os.path.relpath(path, self.root))
+        with self._lock:
+            filenames = self.directories.get(relative, (0, []))[1]
+            self._touch(relative, [name for name in filenames if name != filename])
+            key = (self._language(relative), title_key(filename))
+            releases = self.titles.get(key, {})
+            releases.pop(os.path.join(relative, filename), None)
+            if not releases:
+                self.titles.pop(key, None)
+
+    def releases(self, language, filename):
+        """`{path: (resolution, quality)}` of the stored versions of a title."""
+        with self._lock:
+            releases = self.titles.get((language, title_key(filename)), {})
+            return {
+                os.path.join(self.root, relative): release
+                for relative, release in releases.items()
+            }
+
+    def check(self, language, filename):
+        """Decide whether `filename` should be stored.
+
+        Returns `(wanted, replaced)`: False when a better release exists (a
+        higher resolution, or a BluRay of the same resolution), otherwise True
+        and the paths of the releases it supersedes. A stored file of the same
+        name is left alone.
+        """
+
+        priority = RESOLUTION_PRIORITY.get(release_resolution(filename), 0)
+        replaced = []
+        for path, (resolution, quality) in self.releases(language, filename).items():
+            if resolution == "None":
+                continue
+            old_priority = RESOLUTION_PRIORITY.get(resolution, 0)
+            if old_priority > priority:
+                return False, []
+            if old_priority == priority and quality == "BluRay":
+                return False, []
+            if os.path.basename(path) != filename:
+                replaced.append(path)
+        return True, replaced
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(releases) for releases in self.titles.values())
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def open_library(root, **kwargs):
+    """Return the process-wide `LibraryIndex` for `root`, scanning it on first use."""
+    key = os.path.abspath(root)
+    with _libraries_lock:
+        if key not in _libraries:
+            _libraries[key] = LibraryIndex(root, **kwargs)
+        return _libraries[key]
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that identify a visitor or campaign, never the video
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "msclkid",
+    "ref",
+    "ref_src",
+    "source",
+    "yclid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_")
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def normalize_url(url):
+    """Return a canonical form of `url` for deduplication.
+
+    Lowercases scheme and host, drops default ports, fragments, tracking
+    parameters and trailing slashes, collapses repeated slashes and sorts the
+    remaining query parameters.
+    """
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path)
+    if path != "/":
+        path = path.rstrip("/")
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS
+        and not name.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def _site_host(url):
+    host = (urlsplit(url).hostname or "").lower()
+    return re.sub(r"^(www|m)\.", "", host)
+
+
+class UrlCanonicalizer:
+    """Map video URLs to dedup keys using the sites in `websites.json`.
+
+    Sites with a `video_id_pattern` (a regex whose first group is the video id,
+    matched against the normalized URL) get keys like `PornHub:ph5f1a2b3c`, so
+    the same video reached through different paths, mirrors or subdomains is
+    recognised. Other URLs are keyed by `normalize_url`.
+    """
+
+    def __init__(self, entries=None):
+        self.sites = {}
+        for entry in entries or []:
+            pattern = entry.get("video_id_pattern")
+            if pattern and entry.get("base_url"):
+                self.sites[_site_host(entry["base_url"])] = (
+                    entry["name"],
+                    re.compile(pattern),
+                )
+
+    def site(self, url):
+        host = _site_host(url)
+        # Also match subdomains, e.g. de.xhamster.com
+        while host:
+            if host in self.sites:
+                return self.sites[host]
+            host = host.partition(".")[2]
+        return None
+
+    def key(self, url):
+        normalized = normalize_url(url)
+        site = self.site(normalized)
+        if site is not None:
+            name, pattern = site
+            match = pattern.search(normalized)
+            if match:
+                return f"{name}:{match.group(1)}"
+        return normalized
+
+
+class LinkIndex:
+    """Append-only link file with O(1) membership by canonical key.
+
+    The file keeps the original URLs, one per line; the index holds their
+    keys and is built once when the file is opened. `add` appends new links
+    immediately, so the file is always up to date if the run stops.
+    """
+
+    def __init__(self, path, canonicalizer=None):
+        self.path = path
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.keys = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", errors="replace") as file:
+                self.keys = {
+                    self.canonicalizer.key(line) for line in file if line.strip()
+                }
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, url):
+        key = self.canonicalizer.key(url)
+        with self._lock:
+            return key in self.keys
+
+    def __len__(self):
+        with self._lock:
+            return len(self.keys)
+
+    def add(self, url):
+        """Append `url` unless an equivalent link is known; True if it was new."""
+        key = self.canonicalizer.key(url)
+        with self._lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+            self._file.write(f"{url.strip()}\n")
+            self._file.flush()
+            return True
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def open_link_index(path, canonicalizer=None):
+    """Return the process-wide `LinkIndex` for `path`, loading it on first use."""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LinkIndex(path, canonicalizer)
+        return _indexes[key]
@@ -0,0 +1,255 @@
+import os
+import re
+import json
+import time
+import atexit
+import base64
+import hashlib
+import threading
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BTIH_PREFIX = "urn:btih:"
+BTMH_PREFIX = "urn:btmh:"
+FINGERPRINT_BYTES = 256
+
+
+def infohash(magnet_link):
+    """Return the normalized infohash of a magnet link, or None.
+
+    BitTorrent v1 hashes are accepted in hex and base32 and returned as
+    lowercase hex; v2 multihashes (`btmh`) are returned lowercased. Tracker
+    lists, display names and parameter order don't affect the result.
+    """
+
+    link = magnet_link.strip()
+    if not link.lower().startswith("magnet:"):
+        return None
+    query = urlparse(link).query
+    for xt in parse_qs(query).get("xt", []):
+        lowered = xt.lower()
+        if lowered.startswith(BTIH_PREFIX):
+            value = xt[len(BTIH_PREFIX):]
+            if re.fullmatch(r"[0-9a-fA-F]{40}", value):
+                return value.lower()
+            if re.fullmatch(r"[a-zA-Z2-7]{32}", value):
+                return base64.b32decode(value.upper()).hex()
+        elif lowered.startswith(BTMH_PREFIX):
+            return lowered[len(BTMH_PREFIX):]
+    return None
+
+
+def magnet_key(line):
+    """Index key of a stored line: its infohash, else the line itself."""
+    line = line.strip()
+    return infohash(line) or line
+
+
+class _FileLock:
+    """Exclusive advisory lock on a sidecar file, shared between processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+class MagnetStore:
+    """Append-only magnet file with a persistent infohash index.
+
+    The magnet file itself keeps its one-link-per-line format. Next to it,
+    `<file>.idx` lists the infohash of every stored line and `<file>.idx.json`
+    records how many bytes of the magnet file the index covers (with a hash
+    of their first and last bytes), so a restart only reads the index plus
+    whatever other writers appended since.
+
+    New links are buffered and written in groups (every `commit_size` links
+    or `commit_interval` seconds, and at exit). Each commit holds a lock on
+    `<file>.lock`, so several downloaders can share one magnet file; a link
+    another writer stored in the meantime is dropped then. `stored` counts
+    the links this store actually wrote.
+    """
+
+    def __init__(self, path, commit_size=100, commit_interval=5.0):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.meta_path = f"{path}.idx.json"
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.keys = set()
+        self.pending = []
+        self.pending_keys = set()
+        self.offset = 0
+        self.stored = 0
+        self.last_commit = time.monotonic()
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(f"{path}.lock")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._file_lock:
+            self._load()
+        atexit.register(self.close)
+
+    def _load(self):
+        # Caller holds the file lock
+        if os.path.exists(self.meta_path) and os.path.exists(self.index_path):
+            with open(self.meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            self.offset = meta.get("offset", 0)
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size >= self.offset and meta.get("fingerprint") == self._fingerprint():
+                with open(self.index_path, "r", encoding="utf-8") as file:
+                    self.keys = {line.strip() for line in file if line.strip()}
+                self._catch_up()
+                return
+        # No index yet, or the magnet file was rewritten: rebuild it
+        self.keys = set()
+        self.offset = 0
+        with open(self.index_path, "w", encoding="utf-8"):
+            pass
+        self._catch_up()
+
+    def _catch_up(self):
+        """Index lines appended to the magnet file by other writers."""
+        # Caller holds the file lock
+        if not os.path.exists(self.path):
+            return
+        new_keys = []
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # Partial line of a writer without the lock; pick up later
+                    break
+                self.offset += len(line)
+                key = magnet_key(line.decode("utf-8", errors="replace"))
+                if key and key not in self.keys:
+                    self.keys.add(key)
+                    new_keys.append(key)
+        if new_keys:
+            with open(self.index_path, "a", encoding="utf-8") as file:
+                file.write("".join(f"{key}\n" for key in new_keys))
+        self._save_meta()
+
+    def _fingerprint(self):
+        """Hash of the first and last bytes the index covers.
+
+        A magnet file rewritten in place (same or larger size) no longer
+        matches it, so the index is rebuilt instead of trusted.
+        """
+        digest = hashlib.sha1(str(self.offset).encode("ascii"))
+        if self.offset and os.path.exists(self.path):
+            with open(self.path, "rb") as file:
+                digest.update(file.read(min(self.offset, FINGERPRINT_BYTES)))
+                file.seek(max(0, self.offset - FINGERPRINT_BYTES))
+                digest.update(file.read(min(self.offset, FINGERPRINT_BYTES)))
+        return digest.hexdigest()
+
+    def _save_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"offset": self.offset, "fingerprint": self._fingerprint()}, file)
+        os.replace(tmp_path, self.meta_path)
+
+    def __contains__(self, magnet_link):
+        key = magnet_key(magnet_link)
+        with self._lock:
+            return key in self.keys or key in self.pending_keys
+
+    def __len__(self):
+        with self._lock:
+            return len(self.keys) + len(self.pending_keys)
+
+    def add(self, magnet_link):
+        """Queue `magnet_link` unless its infohash is known; True if it was new.
+
+        New to this store only: the commit still skips the link if another
+        writer stored the same torrent first, so count `stored` instead.
+        """
+        key = magnet_key(magnet_link)
+        if not key:
+            return False
+        with self._lock:
+            if key in self.keys or key in self.pending_keys:
+                return False
+            self.pending.append((key, magnet_link.strip()))
+            self.pending_keys.add(key)
+            due = (
+                len(self.pending) >= self.commit_size
+                or time.monotonic() - self.last_commit >= self.commit_interval
+            )
+        if due:
+            self.commit()
+        return True
+
+    def commit(self):
+        """Write all queued links to the magnet file and the index.
+
+        Returns the number of links written.
+        """
+        with self._lock:
+            pending, self.pending, self.pending_keys = self.pending, [], set()
+            self.last_commit = time.monotonic()
+            if not pending:
+                return 0
+            with self._file_lock:
+                self._catch_up()
+                # Another writer may have stored the same torrent meanwhile
+                new = [link for key, link in pending if key not in self.keys]
+                if new:
+                    data = "".join(f"{link}\n" for link in new).encode("utf-8")
+                    with open(self.path, "ab+") as file:
+                        # Never glue a link onto an unterminated last line
+                        file.seek(0, os.SEEK_END)
+                        if file.tell() > 0:
+                            file.seek(-1, os.SEEK_END)
+                            if file.read(1) != b"\n":
+                                data = b"\n" + data
+                        file.write(data)
+                    self._catch_up()
+                self.stored += len(new)
+            return len(new)
+
+    def close(self):
+        self.commit()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, **kwargs):
+    """Return the process-wide `MagnetStore` for `path`, opening it on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = MagnetStore(path, **kwargs)
+        return _stores[key]
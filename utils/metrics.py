@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import atexit
+import socket
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connection setup timings of the current thread, collected by the timed
+# connection classes and picked up by HttpClient.get for the same request.
+_setup = threading.local()
+
+
+def take_connection_setup():
+    """Return and clear the `{phase: seconds}` recorded on this thread."""
+    phases = getattr(_setup, "phases", None) or {}
+    _setup.phases = {}
+    return phases
+
+
+def _record_setup(phase, seconds):
+    if getattr(_setup, "phases", None) is None:
+        _setup.phases = {}
+    _setup.phases[phase] = _setup.phases.get(phase, 0.0) + seconds
+
+
+class _TimedConnectionMixin:
+    """Split new-connection setup into DNS, TCP connect and TLS handshake."""
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            # Let urllib3 raise its usual NameResolutionError
+            return super()._new_conn()
+        _record_setup("dns", time.perf_counter() - started)
+
+        last_error = None
+        for _, _, _, _, sockaddr in addresses:
+            self._dns_host = sockaddr[0]
+            started = time.perf_counter()
+            try:
+                conn = super()._new_conn()
+                _record_setup("connect", time.perf_counter() - started)
+                return conn
+            except Exception as e:
+                last_error = e
+            finally:
+                self._dns_host = host
+        raise last_error
+
+    def connect(self):
+        before = dict(getattr(_setup, "phases", None) or {})
+        started = time.perf_counter()
+        super().connect()
+        total = time.perf_counter() - started
+        phases = getattr(_setup, "phases", None) or {}
+        socket_setup = sum(phases.get(p, 0.0) - before.get(p, 0.0) for p in ("dns", "connect"))
+        if isinstance(self, HTTPSConnection):
+            _record_setup("tls", max(total - socket_setup, 0.0))
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report DNS/connect/TLS timings."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class Metrics:
+    """Per-host request counters and phase timings.
+
+    Counters (`requests`, `bytes`, `retries`, `status_<code>`, ...) only grow.
+    Timings keep count, sum and max per phase (`dns`, `connect`, `tls`,
+    `ttfb`, `transfer`, `download`, ...). Snapshots can be written as JSON and
+    in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def _host(self, host):
+        return self.hosts.setdefault(host or "unknown", {"counters": {}, "timings": {}})
+
+    def count(self, host, name, value=1):
+        with self._lock:
+            counters = self._host(host)["counters"]
+            counters[name] = counters.get(name, 0) + value
+
+    def observe(self, host, phase, seconds):
+        with self._lock:
+            timings = self._host(host)["timings"]
+            timing = timings.setdefault(phase, {"count": 0, "sum": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "timestamp": time.time(),
+                "hosts": json.loads(json.dumps(self.hosts)),
+            }
+
+    def to_prometheus(self, namespace="media_downloader"):
+        snapshot = self.snapshot()
+        lines = []
+        counter_lines = {}
+        timing_lines = {}
+        for host, data in sorted(snapshot["hosts"].items()):
+            for name, value in sorted(data["counters"].items()):
+                if name.startswith("status_"):
+                    metric = f"{namespace}_responses_total"
+                    labels = f'host="{host}",status="{name[len("status_"):]}"'
+                else:
+                    metric = f"{namespace}_{name}_total"
+                    labels = f'host="{host}"'
+                counter_lines.setdefault(metric, []).append(f"{metric}{{{labels}}} {value}")
+            for phase, timing in sorted(data["timings"].items()):
+                labels = f'host="{host}",phase="{phase}"'
+                for suffix in ("count", "sum", "max"):
+                    metric = f"{namespace}_phase_seconds_{suffix}"
+                    timing_lines.setdefault(metric, []).append(
+                        f"{metric}{{{labels}}} {timing[suffix]}"
+                    )
+        for metric, metric_lines in counter_lines.items():
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(metric_lines)
+        for metric, metric_lines in timing_lines.items():
+            metric_type = "gauge" if metric.endswith("_max") else "counter"
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.extend(metric_lines)
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory, prefix=""):
+        """Write `<prefix>metrics.json` and `<prefix>metrics.prom` atomically."""
+        os.makedirs(directory, exist_ok=True)
+        outputs = {
+            f"{prefix}metrics.json": json.dumps(self.snapshot(), indent=2),
+            f"{prefix}metrics.prom": self.to_prometheus(),
+        }
+        for name, content in outputs.items():
+            path = os.path.join(directory, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(content)
+            os.replace(tmp_path, path)
+
+    def start_exporter(self, directory, interval=60, prefix=""):
+        """Write snapshots every `interval` seconds and once more at exit."""
+        if self._exporter is not None:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.write(directory, prefix)
+                except OSError:
+                    pass
+
+        def final_write():
+            stop.set()
+            try:
+                self.write(directory, prefix)
+            except OSError:
+                pass
+
+        self._exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+        self._exporter.start()
+        atexit.register(final_write)
+
+
+_default_metrics = Metrics()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    return _default_metrics
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+
+class MirrorHealth:
+    """Track per-mirror health and order `base_urls` fallbacks accordingly.
+
+    Every mirror keeps a success/failure count, an exponentially weighted
+    latency and its run of consecutive failures. Once a mirror fails
+    `failure_threshold` times in a row its circuit opens and it is skipped for
+    `cooldown` seconds. After the cool-down it is tried again: a success closes
+    the circuit, another failure opens it for a new window.
+
+    When `path` is given the state is loaded from and saved to that JSON file,
+    so a new process starts on the mirror that worked last time.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        failure_threshold=3,
+        cooldown=300,
+        latency_alpha=0.3,
+        save_interval=30,
+    ):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_alpha = latency_alpha
+        self.save_interval = save_interval
+        self.mirrors = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def _entry(self, base_url):
+        return self.mirrors.setdefault(
+            base_url,
+            {
+                "successes": 0,
+                "failures": 0,
+                "consecutive_failures": 0,
+                "latency": None,
+                "open_until": 0.0,
+            },
+        )
+
+    def is_open(self, base_url, now=None):
+        """Return True while the circuit breaker of `base_url` is open."""
+        entry = self.mirrors.get(base_url)
+        if entry is None:
+            return False
+        return entry["open_until"] > (now or time.time())
+
+    def score(self, base_url):
+        """Expected seconds per successful request; lower is better."""
+        entry = self.mirrors.get(base_url)
+        if entry is None or entry["latency"] is None:
+            return None
+        # Laplace-smoothed success rate so one lucky request does not dominate
+        success_rate = (entry["successes"] + 1) / (
+            entry["successes"] + entry["failures"] + 2
+        )
+        return entry["latency"] / success_rate
+
+    def order(self, base_urls):
+        """Return `base_urls` with the fastest healthy mirror first.
+
+        Mirrors with an open circuit are left out. Mirrors without any data keep
+        their configured order behind the measured ones. If every circuit is
+        open, all mirrors are returned, soonest to recover first, so a request
+        is never dropped without trying.
+        """
+
+        now = time.time()
+        with self._lock:
+            closed = [url for url in base_urls if not self.is_open(url, now)]
+            if not closed:
+                return sorted(base_urls, key=lambda url: self.mirrors[url]["open_until"])
+
+            measured = [url for url in closed if self.score(url) is not None]
+            unmeasured = [url for url in closed if self.score(url) is None]
+            measured.sort(key=self.score)
+            return measured + unmeasured
+
+    def record_success(self, base_url, latency):
+        with self._lock:
+            entry = self._entry(base_url)
+            entry["successes"] += 1
+            entry["consecutive_failures"] = 0
+            entry["open_until"] = 0.0
+            if entry["latency"] is None:
+                entry["latency"] = latency
+            else:
+                entry["latency"] += self.latency_alpha * (latency - entry["latency"])
+            self._dirty = True
+        self._maybe_save()
+
+    def record_failure(self, base_url):
+        """Count a failure and open the circuit once the threshold is reached.
+
+        Returns True when this failure opened (or re-opened) the circuit.
+        """
+
+        with self._lock:
+            entry = self._entry(base_url)
+            entry["failures"] += 1
+            entry["consecutive_failures"] += 1
+            opened = entry["consecutive_failures"] >= self.failure_threshold
+            if opened:
+                entry["open_until"] = time.time() + self.cooldown
+            self._dirty = True
+        self._maybe_save()
+        return opened
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for base_url, entry in data.get("mirrors", {}).items():
+                self._entry(base_url).update(entry)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"mirrors": self.mirrors}
+            # Unique per process, so two writers never share a half-written file
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as file:
+                    json.dump(data, file, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                return
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def _maybe_save(self):
+        if self.path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
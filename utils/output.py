@@ -65,4 +65,6 @@ def output_message(message, level=Level.INFO):
 
 def output(message, log_file, level=Level.INFO):
     output_message(message, level)
-    log_message(message, log_file, level)
+    # Callers without a log file (e.g. images.py) only print to the console
+    if log_file:
+        log_message(message, log_file, level)
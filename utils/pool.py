@@ -0,0 +1,169 @@
+import time
+import threading
+from collections import deque
+
+
+class Retry(Exception):
+    """Raised by a job to run it again after `delay` seconds.
+
+    The worker is free for other jobs in the meantime.
+    """
+
+    def __init__(self, delay=0.0):
+        super().__init__(delay)
+        self.delay = delay
+
+
+class _Job:
+    __slots__ = ("key", "function", "args", "attempt", "ready_at")
+
+    def __init__(self, key, function, args):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.attempt = 0
+        self.ready_at = 0.0
+
+
+class WorkerPool:
+    """Thread pool with a global and a per-key concurrency cap.
+
+    `submit(key, function, *args)` queues `function(*args, attempt=n)`. At
+    most `workers` jobs run at once, and at most `limits.get(key,
+    default_limit)` of them share a key (e.g. a website). Jobs start in
+    submission order, except that a job whose key is at its cap waits
+    while jobs for other keys go ahead.
+
+    A job that raises `Retry` is queued again and becomes ready after the
+    delay, so backoff never ties up a worker. Any other exception is logged
+    by `on_error` (if given) and the job is dropped.
+
+    With `max_pending`, `submit` blocks while that many jobs are waiting, so
+    a fast producer is slowed down to the pace of the workers instead of
+    piling up work in memory.
+    """
+
+    def __init__(
+        self,
+        workers,
+        limits=None,
+        default_limit=None,
+        on_error=None,
+        name="worker",
+        max_pending=None,
+    ):
+        self.workers = max(1, workers)
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.on_error = on_error
+        self.name = name
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.active = {}
+        self.running = 0
+        self.closed = False
+        self.cancelled = False
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def limit(self, key):
+        limit = self.limits.get(key, self.default_limit)
+        return limit if limit and limit > 0 else self.workers
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{number + 1}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, key, function, *args):
+        with self._condition:
+            while (
+                self.max_pending
+                and len(self.pending) >= self.max_pending
+                and not self.closed
+            ):
+                self._condition.wait()
+            if self.closed:
+                raise RuntimeError("Pool is closed")
+            self.pending.append(_Job(key, function, args))
+            self._condition.notify_all()
+
+    def __len__(self):
+        """Jobs queued or running."""
+        with self._condition:
+            return len(self.pending) + self.running
+
+    def _next_job(self, now):
+        # Caller holds the condition; returns (job, seconds until one may be ready)
+        wait = None
+        for job in self.pending:
+            if self.active.get(job.key, 0) >= self.limit(job.key):
+                continue
+            if job.ready_at > now:
+                delay = job.ready_at - now
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            self.pending.remove(job)
+            # Room in the queue again for a blocked producer
+            self._condition.notify_all()
+            return job, None
+        return None, wait
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    job, wait = self._next_job(time.monotonic())
+                    if job is not None:
+                        break
+                    if self.closed and not self.pending and self.running == 0:
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(wait)
+                self.active[job.key] = self.active.get(job.key, 0) + 1
+                self.running += 1
+
+            retry = None
+            try:
+                job.function(*job.args, attempt=job.attempt)
+            except Retry as e:
+                retry = e.delay
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(job.key, e)
+
+            with self._condition:
+                self.active[job.key] -= 1
+                self.running -= 1
+                if retry is not None and not self.cancelled:
+                    job.attempt += 1
+                    job.ready_at = time.monotonic() + retry
+                    self.pending.append(job)
+                self._condition.notify_all()
+
+    def cancel(self):
+        """Drop all waiting jobs; returns how many were dropped.
+
+        Running jobs finish normally (retries they request are dropped too).
+        """
+
+        with self._condition:
+            self.closed = True
+            dropped = len(self.pending)
+            self.pending.clear()
+            self.cancelled = True
+            self._condition.notify_all()
+            return dropped
+
+    def join(self):
+        """Wait until every submitted job (and its retries) is finished."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
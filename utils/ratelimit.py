@@ -0,0 +1,84 @@
+import time
+import threading
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests/sec with `burst` capacity.
+
+    Callers reserve a token up front; when the bucket is empty the token is
+    borrowed from the future and the caller sleeps until it is due. Waiting
+    threads are therefore served in arrival order and the long-run rate never
+    exceeds `rate`.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Token buckets keyed by host.
+
+    `rate` and `burst` are the defaults for every host; `host_limits` maps a
+    host name to a `{"rate": ..., "burst": ...}` override. A rate of None or 0
+    means the host is not limited.
+    """
+
+    def __init__(self, rate=None, burst=1, host_limits=None):
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = {}
+        self.buckets = {}
+        self._lock = threading.Lock()
+        for host, limit in (host_limits or {}).items():
+            self.configure(host, limit.get("rate"), limit.get("burst", 1))
+
+    def configure(self, host, rate, burst=1):
+        """Set the limit for one host, replacing its current bucket."""
+        host = host.lower()
+        with self._lock:
+            self.host_limits[host] = (rate, burst)
+            self.buckets.pop(host, None)
+
+    def bucket(self, host):
+        host = host.lower()
+        with self._lock:
+            if host not in self.buckets:
+                rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+                self.buckets[host] = TokenBucket(rate, burst) if rate else None
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """Block until a request to the host of `url` is allowed.
+
+        Accepts a full URL or a bare host name and returns the seconds waited.
+        """
+
+        host = urlparse(url).netloc if "//" in url else url
+        bucket = self.bucket(host)
+        if bucket is None:
+            return 0.0
+        return bucket.acquire()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import random
+import atexit
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, urlunparse, quote
+
+# Headers that describe the original transfer and must not be replayed as-is
+SKIPPED_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+STATS_PATH = "/__replay__/stats"
+
+
+def _path_key(url):
+    """Host-independent key, so fixtures recorded on one mirror serve all mirrors."""
+    parsed = urlparse(url)
+    return urlunparse(("", "", parsed.path or "/", "", parsed.query, ""))
+
+
+def rewrite_url(base_url, url):
+    """Map a real URL onto the replay server at `base_url`."""
+    if url.startswith(base_url):
+        return url
+    parsed = urlparse(url)
+    path = quote(parsed.path or "/", safe="/%:@!$&'()*+,;=-._~")
+    rewritten = f"{base_url}/{parsed.scheme}/{parsed.netloc}{path}"
+    if parsed.query:
+        rewritten += f"?{parsed.query}"
+    return rewritten
+
+
+def original_url(base_url, path):
+    """Map a replay server URL or request path back to the real URL."""
+    if path.startswith(base_url):
+        path = path[len(base_url):]
+    parts = path.lstrip("/").split("/", 2)
+    if len(parts) < 2 or not parts[1]:
+        return None
+    rest = parts[2] if len(parts) == 3 else ""
+    return f"{parts[0]}://{parts[1]}/{rest}"
+
+
+class FixtureArchive:
+    """Directory of recorded responses used by record and replay modes.
+
+    `index.json` maps each requested URL to its status, final URL, headers and
+    the name of the file holding the body. Bodies live next to it, named by
+    the SHA-256 of their content.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}
+        self.by_path = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+        for url, entry in self.entries.items():
+            self.by_path.setdefault(_path_key(url), entry)
+
+    def record(self, url, response):
+        """Store `response` (fetched for `url`) in the archive."""
+        body = response.content
+        body_name = f"{hashlib.sha256(body).hexdigest()}.body"
+        body_path = os.path.join(self.directory, body_name)
+        if not os.path.exists(body_path):
+            with open(body_path, "wb") as file:
+                file.write(body)
+        entry = {
+            "status": response.status_code,
+            "url": response.url,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in SKIPPED_HEADERS
+            },
+            "body": body_name,
+        }
+        with self._lock:
+            self.entries[url] = entry
+            self.by_path[_path_key(url)] = entry
+            self._dirty = True
+
+    def add(self, url, body, status=200, headers=None):
+        """Add a synthetic entry, e.g. when generating benchmark fixtures."""
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        body_name = f"{hashlib.sha256(body).hexdigest()}.body"
+        with open(os.path.join(self.directory, body_name), "wb") as file:
+            file.write(body)
+        entry = {
+            "status": status,
+            "url": url,
+            "headers": headers or {"Content-Type": "text/html; charset=utf-8"},
+            "body": body_name,
+        }
+        with self._lock:
+            self.entries[url] = entry
+            self.by_path[_path_key(url)] = entry
+            self._dirty = True
+
+    def lookup(self, url):
+        """Return `(entry, body)` for `url`, falling back to a path-only match."""
+        entry = self.entries.get(url) or self.by_path.get(_path_key(url))
+        if entry is None:
+            return None, None
+        with open(os.path.join(self.directory, entry["body"]), "rb") as file:
+            return entry, file.read()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            index_path = os.path.join(self.directory, "index.json")
+            tmp_path = f"{index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file, indent=2)
+            os.replace(tmp_path, index_path)
+            self._dirty = False
+
+
+class ReplayServer:
+    """Local stand-in HTTP server answering from a `FixtureArchive`.
+
+    A request for `https://host/path?q` is sent to
+    `http://127.0.0.1:<port>/https/host/path?q` (see `rewrite`). Every answer is
+    delayed by `latency` seconds (plus up to `jitter`), and a share of
+    `error_rate` requests fail with `error_status` to exercise retry paths.
+    Unknown URLs get a 404. `GET /__replay__/stats` returns served/error
+    counters as JSON.
+    """
+
+    def __init__(
+        self,
+        archive,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=None,
+    ):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.stats = {"served": 0, "missing": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if self.path == STATS_PATH:
+                    with server._lock:
+                        body = json.dumps(server.stats).encode("utf-8")
+                    self._send(200, {"Content-Type": "application/json"}, body)
+                    return
+
+                delay = server.latency + server.random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                with server._lock:
+                    fail = server.error_rate and server.random.random() < server.error_rate
+                if fail:
+                    server._count("errors")
+                    self._send(server.error_status, {"Retry-After": "0"}, b"injected error")
+                    return
+
+                original = original_url(server.base_url, self.path)
+                entry, body = server.archive.lookup(original) if original else (None, None)
+                if entry is None:
+                    server._count("missing")
+                    self._send(404, {}, b"not recorded")
+                    return
+                server._count("served")
+                headers = dict(entry["headers"])
+                headers["X-Replay-Url"] = entry["url"]
+                self._send(entry["status"], headers, body)
+
+            def _send(self, status, headers, body):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def rewrite(self, url):
+        return rewrite_url(self.base_url, url)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="replay-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Replay:
+    """Client-side half of replay mode, installed as `HttpClient.replay`."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def rewrite(self, url):
+        return rewrite_url(self.base_url, url)
+
+    def original_url(self, response):
+        return response.headers.get("X-Replay-Url") or original_url(
+            self.base_url, response.url
+        )
+
+
+def start_recording(directory):
+    """Return an archive that saves itself at exit, for `HttpClient.recorder`."""
+    archive = FixtureArchive(directory)
+    atexit.register(archive.save)
+    return archive
+
+
+def start_replay(directory, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+    """Start an in-process replay server and return the client-side `Replay`."""
+    server = ReplayServer(
+        FixtureArchive(directory),
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        seed=seed,
+    ).start()
+    replay = Replay(server.base_url)
+    replay.server = server
+    return replay
+
+
+def serve(directory, port, latency=0.0, jitter=0.0, error_rate=0.0, ready=None):
+    """Run a replay server until the process is terminated.
+
+    Used as a `multiprocessing` target so the server's CPU time is kept out of
+    the measurements of the process being benchmarked. The bound base URL is
+    put on the `ready` queue once the server listens.
+    """
+
+    server = ReplayServer(
+        FixtureArchive(directory),
+        port=port,
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+    )
+    if ready is not None:
+        ready.put(server.base_url)
+    server.httpd.serve_forever()
@@ -1,60 +1,609 @@
+import os
 import time
-from urllib.parse import urljoin
+import threading
+from urllib.parse import urljoin, urlparse
 
 import requests
 from requests.exceptions import HTTPError, ConnectionError, ReadTimeout, ChunkedEncodingError
 
 from .output import output, Level
+from .mirrors import MirrorHealth
+from .ratelimit import RateLimiter
+from .cache import HttpCache
+from .retry import Outcome, RetryPolicy
+from .metrics import TimedHTTPAdapter, get_metrics, take_connection_setup
+from .replay import start_recording, start_replay
+
+
+def _accept_encoding():
+    """Advertise brotli only when urllib3 can actually decode it."""
+    encodings = ["gzip", "deflate"]
+    try:
+        import brotli  # noqa: F401
+
+        encodings.append("br")
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+
+            encodings.append("br")
+        except ImportError:
+            pass
+    return ", ".join(encodings)
+
+
+DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": _accept_encoding(),
+    "Connection": "keep-alive",
+    "Referer": "https://www.google.com/",
+}
+
+# Statuses that say something about the mirror rather than about the page
+MIRROR_FAILURE_STATUSES = {403, 429}
+
+
+class HttpClient:
+    """Shared HTTP client with keep-alive connection pools per host.
+
+    One instance is meant to live for the whole run so that listing pages,
+    detail pages and downloads against the same mirror reuse connections
+    instead of paying a new TCP/TLS handshake per request.
+    """
+
+    def __init__(
+        self,
+        user_agent=None,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        timeout=20,
+        headers=None,
+        mirror_health=None,
+        rate_limiter=None,
+        cache=None,
+        retry_policy=None,
+        metrics=None,
+        recorder=None,
+        replay=None,
+    ):
+        self.timeout = timeout
+        self.recorder = recorder
+        self.replay = replay
+        self.metrics = metrics or get_metrics()
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.mirror_health = mirror_health or MirrorHealth()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.adapter = TimedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+
+    def get(self, url, user_agent=None, timeout=None, **kwargs):
+        """GET `url` through the pooled session, honouring the host rate limit.
+
+        Records per-host request counts, status codes, connection setup, TTFB,
+        transfer time and body size in `self.metrics`. For streamed responses
+        the transfer is recorded by `write_stream` instead.
+
+        With `self.replay` set, the request goes to the local replay server and
+        the response carries the original URL again; with `self.recorder` set,
+        every response is saved into its fixture archive.
+        """
+
+        host = urlparse(url).netloc
+        waited = self.rate_limiter.acquire(url)
+        if waited:
+            self.metrics.observe(host, "rate_limit_wait", waited)
+        headers = kwargs.pop("headers", None) or {}
+        if user_agent:
+            headers.setdefault("User-Agent", user_agent)
+
+        take_connection_setup()
+        started = time.perf_counter()
+        try:
+            response = self.session.get(
+                self.replay.rewrite(url) if self.replay else url,
+                headers=headers,
+                timeout=timeout if timeout is not None else self.timeout,
+                **kwargs,
+            )
+        except Exception:
+            self.metrics.count(host, "errors")
+            raise
+        finally:
+            setup = take_connection_setup()
+            for phase, seconds in setup.items():
+                self.metrics.observe(host, phase, seconds)
+
+        self.metrics.count(host, "requests")
+        self.metrics.count(host, f"status_{response.status_code}")
+        elapsed = response.elapsed.total_seconds()
+        self.metrics.observe(host, "ttfb", max(elapsed - sum(setup.values()), 0.0))
+        if not kwargs.get("stream"):
+            self.metrics.observe(
+                host, "transfer", max(time.perf_counter() - started - elapsed, 0.0)
+            )
+            self.metrics.count(host, "bytes", len(response.content))
+        if self.replay:
+            response.url = self.replay.original_url(response)
+        if self.recorder:
+            self.recorder.record(url, response)
+        response.http_client = self
+        return response
+
+    def fork(self):
+        """Return a client with its own cookies that shares this connection pool."""
+        forked = HttpClient.__new__(HttpClient)
+        forked.__dict__.update(self.__dict__)
+        forked.session = requests.Session()
+        forked.session.mount("http://", self.adapter)
+        forked.session.mount("https://", self.adapter)
+        forked.session.headers.update(self.session.headers)
+        return forked
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Return the process-wide client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+def set_default_client(client):
+    """Replace the process-wide client used when callers don't pass one."""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
+
+def create_client(config, user_agent=None, delay=None):
+    """Build an `HttpClient` from a downloader config dictionary.
+
+    Recognised keys: `pool_connections`, `pool_maxsize`, `pool_block`,
+    `request_timeout`, `mirror_health_file`, `mirror_failure_threshold`,
+    `mirror_cooldown`, `rate_limit` (requests/sec per host), `rate_burst` and
+    `rate_limits` (per-host overrides). Without `rate_limit`, a legacy `delay`
+    of N seconds (from the config, else the `delay` argument) becomes a limit
+    of one request every N seconds per host. `cache_directory` enables the
+    on-disk HTTP cache, tuned by `cache_max_bytes`, `cache_default_ttl` and
+    `cache_rules`. `retry_backoff_base`, `retry_backoff_max`, `retry_jitter`
+    and `retry_time_budget` tune the retry policy. `metrics_directory` enables
+    periodic JSON/Prometheus metric snapshots every `metrics_interval` seconds.
+    `record_directory` saves every response into a fixture archive;
+    `replay_directory` serves responses from one instead of the network, with
+    `replay_latency` seconds of delay and `replay_error_rate` injected errors.
+    Missing keys fall back to the client defaults.
+    """
+
+    rate = config.get("rate_limit")
+    delay = config.get("delay", delay)
+    if rate is None and delay:
+        rate = 1 / float(delay)
+    rate_limiter = RateLimiter(
+        rate=rate,
+        burst=config.get("rate_burst", 1),
+        host_limits=config.get("rate_limits"),
+    )
+    cache = None
+    if config.get("cache_directory"):
+        cache = HttpCache(
+            config["cache_directory"],
+            max_bytes=config.get("cache_max_bytes", 1024**3),
+            default_ttl=config.get("cache_default_ttl", 0),
+            rules=config.get("cache_rules"),
+        )
+
+    mirror_health = MirrorHealth(
+        path=config.get("mirror_health_file"),
+        failure_threshold=config.get("mirror_failure_threshold", 3),
+        cooldown=config.get("mirror_cooldown", 300),
+    )
+    retry_policy = RetryPolicy(
+        backoff_base=config.get("retry_backoff_base", 1.0),
+        backoff_max=config.get("retry_backoff_max", 60.0),
+        jitter=config.get("retry_jitter", 0.5),
+        time_budget=config.get("retry_time_budget"),
+    )
+    metrics = get_metrics()
+    if config.get("metrics_directory"):
+        prefix = config.get("prefix")
+        metrics.start_exporter(
+            config["metrics_directory"],
+            config.get("metrics_interval", 60),
+            f"{prefix}-" if prefix else "",
+        )
+    recorder = None
+    if config.get("record_directory"):
+        recorder = start_recording(config["record_directory"])
+    replay = None
+    if config.get("replay_directory"):
+        replay = start_replay(
+            config["replay_directory"],
+            latency=config.get("replay_latency", 0.0),
+            error_rate=config.get("replay_error_rate", 0.0),
+        )
+    return HttpClient(
+        user_agent=user_agent or config.get("user_agent"),
+        pool_connections=config.get("pool_connections", 10),
+        pool_maxsize=config.get("pool_maxsize", 10),
+        pool_block=config.get("pool_block", False),
+        timeout=config.get("request_timeout", 20),
+        mirror_health=mirror_health,
+        rate_limiter=rate_limiter,
+        cache=cache,
+        retry_policy=retry_policy,
+        metrics=metrics,
+        recorder=recorder,
+        replay=replay,
+    )
 
 
 def retry_request(
-    url, user_agent, debug_logger, max_retries=3, sleep_time=5, base_urls=None
+    url,
+    user_agent,
+    debug_logger,
+    max_retries=3,
+    sleep_time=5,
+    base_urls=None,
+    client=None,
+    policy=None,
 ):
     """Perform a GET request with retries and optional base URL fallbacks.
 
     Always returns a `requests.Response` on success or `None` on failure so callers
-    can reliably access `.content`/`.text`.
+    can reliably access `.content`/`.text`. Requests go through `client` or the
+    process-wide default client so connections are reused between calls.
+
+    When the client has a cache, a fresh copy of `url` is returned without a
+    request and a stale one is revalidated with a conditional GET.
+
+    Failures are handled by `policy` (default: the client's `RetryPolicy`).
+    A permanent error such as 404 drops that mirror for this URL and gives up
+    once no mirror is left; other errors are retried up to `max_retries` times
+    with exponential backoff (at least `sleep_time` seconds), honouring
+    Retry-After, until the policy's time budget for the URL is spent.
     """
 
-    session = requests.Session()
-    session.headers.update(
-        {
-            "User-Agent": user_agent,
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Connection": "keep-alive",
-            "Referer": "https://www.google.com/",
-        }
+    client = client or get_default_client()
+    cache = client.cache
+
+    cached, fresh = cache.lookup(url) if cache else (None, False)
+    if fresh:
+        client.metrics.count(urlparse(cached["url"]).netloc, "cache_hits")
+        return cache.response(cached)
+
+    response = _fetch(
+        url,
+        user_agent,
+        debug_logger,
+        max_retries,
+        sleep_time,
+        base_urls,
+        client,
+        policy,
+        headers=cache.conditional_headers(cached) if cache else None,
     )
+    if response is None or cache is None:
+        return response
+    if response.status_code == 304 and cached:
+        client.metrics.count(urlparse(response.url).netloc, "cache_revalidated")
+        cache.refresh(url, response)
+        return cache.response(cached)
+    cache.store(url, response)
+    return response
+
+
+def _fetch(
+    url,
+    user_agent,
+    debug_logger,
+    max_retries,
+    sleep_time,
+    base_urls,
+    client,
+    policy,
+    headers=None,
+    stream=False,
+):
+    """Retry loop shared by `retry_request` and `open_stream`."""
+
+    policy = policy or client.retry_policy
+    mirror_health = client.mirror_health
+    headers = headers or {}
+
+    # Mirrors that answered with a permanent error for this URL
+    dead_mirrors = set()
 
     def candidate_urls():
-        if base_urls:
-            return [urljoin(base_url, url) for base_url in base_urls]
-        return [url]
+        # Re-ranked on every attempt so a mirror whose circuit just opened is
+        # skipped and the fastest healthy mirror is always tried first. Absolute
+        # URLs resolve to the same address on every mirror, so try them once.
+        if base_urls and not urlparse(url).scheme:
+            return [
+                (base_url, urljoin(base_url, url))
+                for base_url in mirror_health.order(base_urls)
+                if base_url not in dead_mirrors
+            ]
+        if None in dead_mirrors:
+            return []
+        return [(None, url)]
+
+    def mirror_failed(base_url):
+        if base_url and mirror_health.record_failure(base_url):
+            message = (
+                f"Mirror {base_url} failed {mirror_health.failure_threshold} times in a row. "
+                f"Skipping it for {mirror_health.cooldown} seconds."
+            )
+            output(message, debug_logger, Level.WARNING)
 
     last_error = None
+    budget_exhausted = False
+    deadline = (
+        time.monotonic() + policy.time_budget if policy.time_budget else None
+    )
 
+    tries = 0
     for attempt in range(1, max_retries + 1):
-        for candidate in candidate_urls():
+        retry_after = None
+        candidates = candidate_urls()
+        if not candidates:
+            break
+        for base_url, candidate in candidates:
+            tries += 1
+            if tries > 1:
+                client.metrics.count(urlparse(candidate).netloc, "retries")
+            started = time.monotonic()
             try:
-                response = session.get(candidate, timeout=20)
+                response = client.get(
+                    candidate, user_agent=user_agent, headers=dict(headers), stream=stream
+                )
                 response.raise_for_status()
+                policy.record(Outcome.SUCCESS)
+                if base_url:
+                    mirror_health.record_success(base_url, time.monotonic() - started)
                 return response
             except HTTPError as e:
                 last_error = e
-                status_code = e.response.status_code if e.response else "unknown"
+                if stream:
+                    e.response.close()
+                outcome = policy.classify(e)
+                policy.record(outcome)
+                status_code = e.response.status_code if e.response is not None else "unknown"
+                if status_code in MIRROR_FAILURE_STATUSES or (
+                    isinstance(status_code, int) and status_code >= 500
+                ):
+                    mirror_failed(base_url)
+                if outcome is Outcome.PERMANENT:
+                    dead_mirrors.add(base_url)
+                    message = f"{candidate} returned {status_code}. Not retrying this URL there."
+                    output(message, debug_logger, Level.WARNING)
+                    continue
+                if outcome is Outcome.THROTTLED:
+                    hint = policy.retry_after(e.response)
+                    if hint is not None:
+                        retry_after = max(retry_after or 0.0, hint)
                 message = f"{candidate} returned {status_code}. Retrying ({attempt}/{max_retries})..."
                 output(message, debug_logger, Level.WARNING)
             except (ConnectionError, ReadTimeout, ChunkedEncodingError) as e:
                 last_error = e
+                policy.record(Outcome.NETWORK)
+                mirror_failed(base_url)
                 message = f"Failed to retrieve {candidate}: {e}. Retrying ({attempt}/{max_retries})..."
                 output(message, debug_logger, Level.WARNING)
-        time.sleep(sleep_time)
 
-    message = (
-        f"Reached the maximum number of retries ({max_retries}). Could not retrieve the page."
-    )
+        if attempt == max_retries or not candidate_urls():
+            break
+        wait = policy.backoff(attempt, retry_after, floor=sleep_time)
+        if deadline is not None and time.monotonic() + wait > deadline:
+            policy.record(Outcome.BUDGET_EXHAUSTED)
+            budget_exhausted = True
+            break
+        time.sleep(wait)
+
+    if budget_exhausted:
+        message = (
+            f"Retry time budget of {policy.time_budget}s exhausted. Could not retrieve the page."
+        )
+    elif candidate_urls():
+        policy.record(Outcome.GAVE_UP)
+        message = (
+            f"Reached the maximum number of retries ({max_retries}). Could not retrieve the page."
+        )
+    else:
+        message = f"Permanent error for {url}. Could not retrieve the page."
     if last_error:
         message += f" Last error: {last_error}"
     output(message, debug_logger, Level.ERROR)
     return None
+
+
+def content_type_allowed(response, content_types):
+    """Check the response media type against `content_types`.
+
+    Entries ending in "/" match a whole family (e.g. "image/"). Responses
+    without a Content-Type header are allowed since nothing can be told.
+    """
+
+    content_type = response.headers.get("Content-Type")
+    if not content_type:
+        return True
+    media_type = content_type.split(";")[0].strip().lower()
+    for allowed in content_types:
+        allowed = allowed.lower()
+        if media_type == allowed or (allowed.endswith("/") and media_type.startswith(allowed)):
+            return True
+    return False
+
+
+def open_stream(
+    url,
+    user_agent,
+    debug_logger,
+    max_retries=3,
+    sleep_time=5,
+    base_urls=None,
+    client=None,
+    policy=None,
+    content_types=None,
+):
+    """Open a streaming GET with the same retry and mirror handling as `retry_request`.
+
+    Returns the `requests.Response` with its body still unread, so callers can
+    inspect headers before deciding where (or whether) to write it, or `None`
+    on failure. Responses whose Content-Type is not in `content_types` are
+    closed and rejected. The cache is bypassed. Callers must either pass the
+    response to `write_stream` or close it.
+    """
+
+    client = client or get_default_client()
+    response = _fetch(
+        url,
+        user_agent,
+        debug_logger,
+        max_retries,
+        sleep_time,
+        base_urls,
+        client,
+        policy,
+        stream=True,
+    )
+    if response is None:
+        return None
+    if content_types and not content_type_allowed(response, content_types):
+        message = (
+            f"Rejected {response.url}: unexpected content type "
+            f"{response.headers.get('Content-Type')}."
+        )
+        output(message, debug_logger, Level.WARNING)
+        response.close()
+        return None
+    return response
+
+
+def write_stream(
+    response, sinks, debug_logger, max_bytes=None, chunk_size=65536, progress=None
+):
+    """Write a streaming response body to every sink in one pass.
+
+    `sinks` are file paths or writable binary file objects. Paths are written
+    to a `.part` file and only moved into place once the whole body arrived.
+    The transfer is aborted when it grows beyond `max_bytes`. `progress` is
+    called as `progress(bytes_written, total_bytes_or_None)` after each chunk.
+
+    Returns the number of bytes written, or `None` if the transfer failed; in
+    that case no partial files are left behind. The response is always closed.
+    """
+
+    total = response.headers.get("Content-Length")
+    total = int(total) if total and total.isdigit() else None
+    if max_bytes is not None and total is not None and total > max_bytes:
+        message = f"Skipping {response.url}: {total} bytes exceeds the {max_bytes} byte cap."
+        output(message, debug_logger, Level.WARNING)
+        response.close()
+        return None
+
+    files = []
+    written = 0
+    completed = False
+    started = time.perf_counter()
+    try:
+        for sink in sinks:
+            if isinstance(sink, (str, bytes)) or hasattr(sink, "__fspath__"):
+                part_path = f"{sink}.part"
+                files.append((open(part_path, "wb"), part_path, sink))
+            else:
+                files.append((sink, None, None))
+
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            written += len(chunk)
+            if max_bytes is not None and written > max_bytes:
+                message = f"Aborted {response.url}: body exceeds the {max_bytes} byte cap."
+                output(message, debug_logger, Level.WARNING)
+                return None
+            for file, _, _ in files:
+                file.write(chunk)
+            if progress:
+                progress(written, total)
+        completed = True
+    except (OSError, ConnectionError, ReadTimeout, ChunkedEncodingError) as e:
+        message = f"Failed to stream {response.url}: {e}"
+        output(message, debug_logger, Level.ERROR)
+        return None
+    finally:
+        response.close()
+        client = getattr(response, "http_client", None)
+        if client is not None:
+            host = urlparse(response.url).netloc
+            client.metrics.observe(host, "transfer", time.perf_counter() - started)
+            client.metrics.count(host, "bytes", written)
+        for file, part_path, path in files:
+            if part_path is None:
+                continue
+            file.close()
+            if completed:
+                os.replace(part_path, path)
+            elif os.path.exists(part_path):
+                os.remove(part_path)
+    return written
+
+
+def stream_request(
+    url,
+    sinks,
+    user_agent,
+    debug_logger,
+    max_retries=3,
+    sleep_time=5,
+    base_urls=None,
+    client=None,
+    policy=None,
+    content_types=None,
+    max_bytes=None,
+    progress=None,
+):
+    """Fetch `url` straight into `sinks` without buffering the whole body.
+
+    Combines `open_stream` and `write_stream`; returns the bytes written or
+    `None` on failure.
+    """
+
+    response = open_stream(
+        url,
+        user_agent,
+        debug_logger,
+        max_retries,
+        sleep_time,
+        base_urls,
+        client,
+        policy,
+        content_types,
+    )
+    if response is None:
+        return None
+    return write_stream(response, sinks, debug_logger, max_bytes, progress=progress)
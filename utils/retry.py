@@ -0,0 +1,105 @@
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import Enum
+
+from requests.exceptions import HTTPError
+
+
+class Outcome(Enum):
+    SUCCESS = "success"
+    PERMANENT = "permanent"
+    TRANSIENT = "transient"
+    THROTTLED = "throttled"
+    NETWORK = "network"
+    BUDGET_EXHAUSTED = "budget_exhausted"
+    GAVE_UP = "gave_up"
+
+
+class RetryPolicy:
+    """Decide whether and when a failed request is retried.
+
+    Errors are classified into outcome classes: permanent HTTP errors
+    (`permanent_statuses`, e.g. 404/410) fail fast, throttling responses
+    (`throttle_statuses`) wait for their Retry-After header, other HTTP errors
+    and network failures back off exponentially with jitter. `time_budget`
+    caps the total seconds spent on a single URL. Every outcome is counted in
+    `counters`.
+    """
+
+    def __init__(
+        self,
+        backoff_base=1.0,
+        backoff_factor=2.0,
+        backoff_max=60.0,
+        jitter=0.5,
+        time_budget=None,
+        permanent_statuses=(400, 401, 404, 405, 410, 451),
+        throttle_statuses=(429, 503),
+        max_retry_after=300.0,
+    ):
+        self.backoff_base = backoff_base
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.time_budget = time_budget
+        self.permanent_statuses = set(permanent_statuses)
+        self.throttle_statuses = set(throttle_statuses)
+        self.max_retry_after = max_retry_after
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def classify(self, error):
+        """Map an exception raised by a request to an `Outcome`."""
+        if isinstance(error, HTTPError):
+            status_code = error.response.status_code if error.response is not None else None
+            if status_code in self.permanent_statuses:
+                return Outcome.PERMANENT
+            if status_code in self.throttle_statuses:
+                return Outcome.THROTTLED
+            return Outcome.TRANSIENT
+        return Outcome.NETWORK
+
+    def retry_after(self, response):
+        """Seconds requested by a Retry-After header, or None."""
+        if response is None:
+            return None
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(seconds, 0.0), self.max_retry_after)
+
+    def backoff(self, attempt, retry_after=None, floor=0.0):
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        delay = min(
+            self.backoff_max, self.backoff_base * self.backoff_factor ** (attempt - 1)
+        )
+        delay = max(delay, floor)
+        delay -= random.uniform(0, delay * self.jitter)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def record(self, outcome):
+        with self._lock:
+            self.counters[outcome.value] += 1
+
+    def summary(self):
+        """One-line rendering of the outcome counters for the run log."""
+        with self._lock:
+            counters = dict(self.counters)
+        if not counters:
+            return "no requests"
+        return ", ".join(f"{name}={count}" for name, count in sorted(counters.items()))
@@ -0,0 +1,2 @@
+from .store import ItemStatus, StateStore, open_state
+from .incremental import IncrementalCrawl
@@ -0,0 +1,90 @@
+"""Import the downloaders' existing state into a `StateStore`.
+
+Only state a downloader reads back from the store is imported: the galleries
+`images.py` keeps in its gallery index become "images" items keyed by gallery
+URL, DONE when complete and FAILED (retried on the next run) otherwise.
+rarbg records its detail pages as it goes, and porn and the magnet writers
+keep using their link files, so there is nothing to import for them.
+
+Usage examples:
+- python -m media_downloader state import --database state.sqlite --galleries ./output/Images
+- python -m media_downloader state summary --database state.sqlite
+"""
+import sys
+import json
+import argparse
+
+from ..gallery import GalleryIndex
+from .store import ItemStatus, StateStore
+
+GALLERY_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tiff")
+BATCH_SIZE = 5000
+
+
+def import_galleries(store, download_folder, source="images", extensions=GALLERY_EXTENSIONS):
+    """Import the galleries below `download_folder`, keyed by gallery URL.
+
+    Galleries without a recorded source URL (folders from before the gallery
+    index) are skipped. Returns the number of items written.
+    """
+
+    index = GalleryIndex(download_folder, extensions)
+    complete = []
+    incomplete = []
+    for entry in index.galleries.values():
+        if not entry.get("source_url"):
+            continue
+        (complete if entry.get("complete") else incomplete).append((entry["source_url"], None))
+    imported = 0
+    for start in range(0, len(complete), BATCH_SIZE):
+        imported += store.mark_many(source, complete[start:start + BATCH_SIZE], ItemStatus.DONE)
+    # An incomplete gallery never overrides what a run already recorded
+    for start in range(0, len(incomplete), BATCH_SIZE):
+        imported += store.add_many(source, incomplete[start:start + BATCH_SIZE], ItemStatus.FAILED)
+    store.flush()
+    return imported
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="MediaDownloader state database")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import existing download state")
+    import_parser.add_argument("--database", default="state.sqlite", help="SQLite file")
+    import_parser.add_argument(
+        "--galleries",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="images.py download folder",
+    )
+
+    summary_parser = subparsers.add_parser("summary", help="Print item counts per source")
+    summary_parser.add_argument("--database", default="state.sqlite", help="SQLite file")
+    summary_parser.add_argument("--json", action="store_true", help="Print as JSON")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "state":
+        argv = argv[1:]
+    args = create_parser().parse_args(argv)
+    store = StateStore(args.database)
+
+    if args.action == "import":
+        for path in args.galleries:
+            print(f"{path}: {import_galleries(store, path)} galleries")
+    else:
+        summary = store.counts()
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        else:
+            for source, counts in sorted(summary.items()):
+                print(f"{source}: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
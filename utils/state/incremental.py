@@ -0,0 +1,82 @@
+import time
+
+
+class IncrementalCrawl:
+    """Decide when a paginated listing can stop because it only shows old items.
+
+    Listings are newest first, so once `stop_after` items in a row are known
+    from earlier runs the rest of the listing is known too. The caller reports
+    every item it sees with `observe`, and stops paginating when that returns
+    True.
+
+    A full sweep ignores the stop rule and walks the listing to its end. One
+    runs when incremental mode is off (`stop_after` 0), when the listing was
+    never swept completely, and every `full_sweep_interval` hours (0: never
+    again). Progress is kept as a checkpoint of `source` in the state store.
+    """
+
+    def __init__(self, state, source, listing, stop_after=0, full_sweep_interval=0):
+        self.state = state
+        self.source = source
+        self.listing = listing
+        self.stop_after = stop_after or 0
+        self.full_sweep_interval = full_sweep_interval or 0
+        self.consecutive_known = 0
+        self.known = 0
+        self.new = 0
+        self.stopped = False
+        self.ended = False
+        self.full_sweep = self._full_sweep_due()
+
+    @property
+    def name(self):
+        return f"listing:{self.listing}"
+
+    @property
+    def incremental(self):
+        return not self.full_sweep
+
+    def _full_sweep_due(self):
+        if not self.stop_after or self.state is None:
+            return True
+        checkpoint = self.state.checkpoint(self.source, self.name) or {}
+        last_full_sweep = checkpoint.get("last_full_sweep")
+        if last_full_sweep is None:
+            return True
+        return (
+            self.full_sweep_interval > 0
+            and time.time() - last_full_sweep >= self.full_sweep_interval * 3600
+        )
+
+    def observe(self, known):
+        """Count one listed item; True once pagination should stop."""
+        if known:
+            self.known += 1
+            self.consecutive_known += 1
+        else:
+            self.new += 1
+            self.consecutive_known = 0
+        if self.incremental and self.consecutive_known >= self.stop_after:
+            self.stopped = True
+        return self.stopped
+
+    def end(self):
+        """The listing ran out of pages."""
+        self.ended = True
+
+    def finish(self):
+        """Save the outcome of this run; a sweep only counts if it ended."""
+        if self.state is None:
+            return
+        now = time.time()
+        checkpoint = self.state.checkpoint(self.source, self.name) or {}
+        checkpoint.update(
+            {"last_run": now, "stopped_early": self.stopped, "new": self.new}
+        )
+        if self.full_sweep and self.ended:
+            checkpoint["last_full_sweep"] = now
+        self.state.save_checkpoint(self.source, self.name, checkpoint)
+
+    def describe(self):
+        mode = "full sweep" if self.full_sweep else f"incremental, stop after {self.stop_after} known"
+        return f"{self.listing}: {mode}"
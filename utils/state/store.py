@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from enum import Enum
+
+
+class ItemStatus(Enum):
+    SEEN = "seen"
+    QUEUED = "queued"
+    DOWNLOADING = "downloading"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    url TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    data TEXT,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source, key)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (source, status);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source, name)
+);
+"""
+
+
+class StateStore:
+    """Crawl state shared by all downloaders, in one SQLite database.
+
+    Holds, per `source` (e.g. "rarbg", "images"):
+
+    - items: everything seen, keyed by a dedup key (detail page URL, gallery
+      URL, ...) with status, attempt count, last error, free-form JSON
+      data and timestamps;
+    - checkpoints: small named JSON values recording crawl progress, written
+      through immediately.
+
+    The database runs in WAL mode so other processes (another downloader, the
+    web UI) can read while a crawl writes. Writes are grouped into one
+    transaction per `batch_size` statements or `commit_interval` seconds (a
+    timer commits the tail of a burst); call `flush` to force a commit.
+    """
+
+    def __init__(self, path, batch_size=500, commit_interval=2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+        self._lock = threading.RLock()
+        self._flush_timer = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        atexit.register(self.close)
+
+    # --- Transactions ---
+
+    def _write(self, sql, parameters=(), many=False):
+        with self._lock:
+            if many:
+                cursor = self._db.executemany(sql, parameters)
+            else:
+                cursor = self._db.execute(sql, parameters)
+            self.pending_writes += max(cursor.rowcount, 1)
+            if (
+                self.pending_writes >= self.batch_size
+                or time.monotonic() - self.last_commit >= self.commit_interval
+            ):
+                self.flush()
+            elif self._flush_timer is None:
+                # Commit the end of a burst too, even if no further write comes
+                self._flush_timer = threading.Timer(self.commit_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+            return cursor.rowcount
+
+    def _read(self, sql, parameters=()):
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def flush(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                if self._flush_timer is not threading.current_thread():
+                    self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._db is None:
+                return
+            self._db.commit()
+            self.pending_writes = 0
+            self.last_commit = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._db is None:
+                return
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    # --- Items ---
+
+    def seen(self, source, key):
+        return bool(
+            self._read(
+                "SELECT 1 FROM items WHERE source = ? AND key = ?", (source, key)
+            )
+        )
+
+    def add(self, source, key, url=None, status=ItemStatus.SEEN, data=None):
+        """Insert a new item; False (and no change) if `key` is already known."""
+        now = time.time()
+        return (
+            self._write(
+                "INSERT OR IGNORE INTO items (source, key, url, status, data, first_seen, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    source,
+                    key,
+                    url,
+                    status.value,
+                    json.dumps(data) if data is not None else None,
+                    now,
+                    now,
+                ),
+            )
+            > 0
+        )
+
+    def add_many(self, source, rows, status=ItemStatus.SEEN):
+        """Insert `(key, url)` pairs in one statement; returns rows inserted."""
+        now = time.time()
+        return self._write(
+            "INSERT OR IGNORE INTO items (source, key, url, status, first_seen, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(source, key, url, status.value, now, now) for key, url in rows],
+            many=True,
+        )
+
+    def mark_many(self, source, rows, status):
+        """Set the status of `(key, url)` pairs, creating missing items."""
+        now = time.time()
+        return self._write(
+            """INSERT INTO items (source, key, url, status, first_seen, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source, key) DO UPDATE SET
+                url = COALESCE(excluded.url, url),
+                status = excluded.status,
+                updated_at = excluded.updated_at""",
+            [(source, key, url, status.value, now, now) for key, url in rows],
+            many=True,
+        )
+
+    def mark(self, source, key, status, url=None, error=None, data=None):
+        """Set the status of an item, creating it if needed.
+
+        Moving an item to DOWNLOADING counts as one more attempt.
+        """
+
+        now = time.time()
+        attempt = 1 if status is ItemStatus.DOWNLOADING else 0
+        self._write(
+            """INSERT INTO items (source, key, url, status, attempts, error, data, first_seen, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source, key) DO UPDATE SET
+                url = COALESCE(excluded.url, url),
+                status = excluded.status,
+                attempts = attempts + excluded.attempts,
+                error = excluded.error,
+                data = COALESCE(excluded.data, data),
+                updated_at = excluded.updated_at""",
+            (
+                source,
+                key,
+                url,
+                status.value,
+                attempt,
+                error,
+                json.dumps(data) if data is not None else None,
+                now,
+                now,
+            ),
+        )
+
+    def status(self, source, key):
+        rows = self._read(
+            "SELECT status FROM items WHERE source = ? AND key = ?", (source, key)
+        )
+        return ItemStatus(rows[0][0]) if rows else None
+
+    def item(self, source, key):
+        rows = self._read(
+            "SELECT key, url, status, attempts, error, data, first_seen, updated_at "
+            "FROM items WHERE source = ? AND key = ?",
+            (source, key),
+        )
+        return self._item(rows[0]) if rows else None
+
+    def items(self, source, status=None, limit=None):
+        sql = (
+            "SELECT key, url, status, attempts, error, data, first_seen, updated_at "
+            "FROM items WHERE source = ?"
+        )
+        parameters = [source]
+        if status is not None:
+            sql += " AND status = ?"
+            parameters.append(status.value)
+        sql += " ORDER BY updated_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        return [self._item(row) for row in self._read(sql, parameters)]
+
+    @staticmethod
+    def _item(row):
+        return {
+            "key": row[0],
+            "url": row[1],
+            "status": ItemStatus(row[2]),
+            "attempts": row[3],
+            "error": row[4],
+            "data": json.loads(row[5]) if row[5] else None,
+            "first_seen": row[6],
+            "updated_at": row[7],
+        }
+
+    # --- Checkpoints ---
+
+    def checkpoint(self, source, name, default=None):
+        rows = self._read(
+            "SELECT value FROM checkpoints WHERE source = ? AND name = ?",
+            (source, name),
+        )
+        return json.loads(rows[0][0]) if rows else default
+
+    def checkpoints(self, source):
+        """All checkpoints of `source` as `{name: value}`."""
+        return {
+            name: json.loads(value)
+            for name, value in self._read(
+                "SELECT name, value FROM checkpoints WHERE source = ?", (source,)
+            )
+        }
+
+    def save_checkpoint(self, source, name, value):
+        """Store `value` under `name` and commit, so it survives a kill."""
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO checkpoints (source, name, value, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (source, name, json.dumps(value), time.time()),
+            )
+            self.flush()
+
+    def clear_checkpoints(self, source):
+        with self._lock:
+            self._write("DELETE FROM checkpoints WHERE source = ?", (source,))
+            self.flush()
+
+    # --- Reporting ---
+
+    def counts(self, source=None):
+        """`{source: {status: count}}` for one or all sources."""
+        sql = "SELECT source, status, COUNT(*) FROM items"
+        parameters = ()
+        if source is not None:
+            sql += " WHERE source = ?"
+            parameters = (source,)
+        counts = {}
+        for row_source, status, count in self._read(sql + " GROUP BY source, status", parameters):
+            counts.setdefault(row_source, {})[status] = count
+        return counts
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_state(path, **kwargs):
+    """Return the process-wide `StateStore` for `path`, opening it on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = StateStore(path, **kwargs)
+        return _stores[key]
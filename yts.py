@@ -1,15 +1,18 @@
 import os
 import re
-import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import unquote
-from bs4 import BeautifulSoup
 
 from .utils.parser import create_parser
 from .utils.config import read_configuration
-from .utils.request import retry_request
+from .utils.request import retry_request, create_client, open_stream, write_stream
 from .utils.output import initialize_logs, output, Level
+from .utils.extract import select, create_extractor
+from .utils.state import open_state
+from .utils.library import open_library, release_resolution, title_key
 
 # Global (config) values
 config_file_name = "yts.yml"
@@ -26,19 +29,50 @@ random_languages = False
 random_release_years = False
 random_genres = False
 skipped_threshold = 20
+max_torrent_bytes = 10 * 1024 * 1024
 max_duration = 720
 delay = 0
+state_database = None
+resume = True
+library_index_file = None
+combination_workers = 1
 user_agent = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:124.0) Gecko/20100101 Firefox/124.0"
 )
 
+# Anything else (typically an HTML error page) is not saved as a .torrent
+TORRENT_CONTENT_TYPES = (
+    "application/x-bittorrent",
+    "application/octet-stream",
+    "application/force-download",
+)
+
 # Global variables
 total_downloads = 0
-skipped_since_last_success = 0
 debug_logger = None
 download_logger = None
+http_client = None
+extractor = None
+state = None
 random = random
 
+STATE_SOURCE = "yts"
+LANGUAGE_MAPPING = {"ENGLISH": "en", "GERMAN": "de", "SPANISH": "es"}
+
+# Combinations are crawled by a worker pool; each worker counts the files it
+# skipped since its last download, for the per-combination skipped_threshold
+progress = threading.local()
+counter_lock = threading.Lock()
+title_locks = {}
+title_locks_lock = threading.Lock()
+
+
+def title_lock(language, filename):
+    """Lock serializing the keep/replace decision for one title."""
+    key = (language, title_key(filename))
+    with title_locks_lock:
+        return title_locks.setdefault(key, threading.Lock())
+
 
 def parse_website(
     base_urls,
@@ -47,35 +81,34 @@ def parse_website(
     alternative_download_directory,
     download_directory,
     page_number,
-    delay,
     user_agent,
 ):
     global debug_logger
     result = False
-    response = retry_request(url, user_agent, debug_logger, 5, 0, base_urls)
+    response = retry_request(url, user_agent, debug_logger, 5, 0, base_urls, http_client)
 
     if response is not None:
         message = f"Parsing page {page_number}: {url}"
         output(message, debug_logger, Level.INFO)
-        soup = BeautifulSoup(response.content, "html.parser")
-        links = soup.select("div.browse-movie-wrap > a:nth-child(1)")
+        links = select(
+            response.content, "div.browse-movie-wrap > a:nth-child(1)", extractor
+        )
         message = f"Found {len(links)} links on page {page_number}"
         output(message, debug_logger, Level.INFO)
         if len(links) != 0 and links is not None:
             for link in links:
                 link_url = link["href"]
                 response_followed = retry_request(
-                    link_url, user_agent, debug_logger, 5, 0, base_urls
+                    link_url, user_agent, debug_logger, 5, 0, base_urls, http_client
                 )
 
                 if response_followed is not None:
                     message = f"Parsing movie page: {link_url}"
                     output(message, debug_logger, Level.INFO)
-                    soup_followed = BeautifulSoup(
-                        response_followed.content, "html.parser"
-                    )
-                    download_links = soup_followed.select(
-                        'div#movie-info > p > a[href*="download"]'
+                    download_links = select(
+                        response_followed.content,
+                        'div#movie-info > p > a[href*="download"]',
+                        extractor,
                     )
 
                     if download_links:
@@ -118,7 +151,6 @@ def parse_website(
                 else:
                     message = "Failed to retrieve the movie page."
                     output(message, debug_logger, Level.WARNING)
-                time.sleep(delay)
         else:
             message = "No links found on page."
             output(message, debug_logger, Level.WARNING)
@@ -138,7 +170,19 @@ def parse_download(
 ):
     global debug_logger
     global download_logger
-    response = retry_request(url, user_agent, debug_logger, 5, 0, base_urls)
+
+    # Only the headers are read here; the body is streamed to disk once we know
+    # the file is wanted, so error pages or huge bodies never sit in memory.
+    response = open_stream(
+        url,
+        user_agent,
+        debug_logger,
+        5,
+        0,
+        base_urls,
+        http_client,
+        content_types=TORRENT_CONTENT_TYPES,
+    )
 
     if response is not None:
         content_disposition = response.headers.get("Content-Disposition", "").split(";")
@@ -154,19 +198,8 @@ def parse_download(
             output(message, debug_logger, Level.INFO)
             original_filename = os.path.basename(base_urls[0] + url)
 
-        resolution_pattern = r"\[(2160p|1080p|720p)\]"
-        quality_pattern = r"\b(BluRay|WEBRip)\b"
-        compression_pattern = r"\[(x265)\]"
-        match = re.search(resolution_pattern, original_filename)
-
-        if match:
-            resolution = match.group(1)  # Get the resolution
-
-            # Check for compression match
-            if re.search(compression_pattern, original_filename):
-                resolution += ".x265"  # Add .x265 if compression is found
-        else:
-            resolution = "None"
+        library = open_library(alternative_download_directory)
+        resolution = release_resolution(original_filename)
 
         message = f"File found: {original_filename}"
         output(message, debug_logger, Level.INFO)
@@ -174,85 +207,185 @@ def parse_download(
         # Ensure lowercase for language for consistency
         language_path = language.capitalize()
 
-        RESOLUTION_PRIORITY = {
-            "2160p.x265": 6,
-            "2160p": 5,
-            "1080p.x265": 4,
-            "1080p": 3,
-            "720p.x265": 2,
-            "720p": 1,
-            "None": 0,
-        }
-
-        # Search for existing torrent files with different resolutions/qualities and remove them if necessary
-        cleaned_filename = re.sub(r"\((\d{4})\).*", r"(\1)", original_filename)
-        for dirpath, _, filenames in os.walk(
-            os.path.join(alternative_download_directory, language_path)
-        ):
-            for filename in filenames:
-                if cleaned_filename in filename:
-                    match = re.search(resolution_pattern, filename)
-                    if match:
-                        old_resolution = match.group(1)
-                        # Check for compression match
-                        if re.search(compression_pattern, filename):
-                            old_resolution += ".x265"
-                        # Compare the priorities using the RESOLUTION_PRIORITY dictionary
-                        if (
-                            RESOLUTION_PRIORITY.get(old_resolution, 0)
-                            > RESOLUTION_PRIORITY.get(resolution, 0)
-                        ):
-                            return False
-                        elif (
-                            RESOLUTION_PRIORITY.get(old_resolution, 0)
-                            == RESOLUTION_PRIORITY.get(resolution, 0)
-                        ):
-                            match = re.search(quality_pattern, filename)
-                            if match:
-                                old_quality = match.group(1)
-                                if old_quality == "BluRay":
-                                    return False
-                        os.remove(os.path.join(dirpath, filename))
-
-        # Combine language and resolution paths
-        alternative_download_path = os.path.join(
-            alternative_download_directory, language_path, resolution
-        )
-        download_path = os.path.join(download_directory, language_path, resolution)
-
-        # Create directories if they don't exist
-        os.makedirs(alternative_download_path, exist_ok=True)
-        os.makedirs(download_path, exist_ok=True)
-
-        # Construct full file paths
-        store_path = os.path.join(alternative_download_path, original_filename)
-        download_path = os.path.join(download_path, original_filename)
-
-        global skipped_since_last_success
-        if os.path.exists(store_path):
-            skipped_since_last_success += 1
-            message = f"File: {original_filename} already exists on store path. \
-                {skipped_since_last_success} skipped since last success. Skipping..."
-            output(message, debug_logger, Level.SKIP)
-        else:
-            with open(download_path, "wb") as f:
-                f.write(response.content)
-
-            with open(store_path, "wb") as f:
-                f.write(response.content)
-
-            global total_downloads
-            total_downloads += 1
-            skipped_since_last_success = 0
-            message = f"Downloaded file: {original_filename}"
-            output(message, download_logger, Level.SUCCESS)
-        return True
+        # Another worker may be storing a release of the same title
+        with title_lock(language_path, original_filename):
+            return store_download(
+                response,
+                library,
+                language_path,
+                resolution,
+                original_filename,
+                alternative_download_directory,
+                download_directory,
+            )
     else:
         message = "Failed to retrieve the download."
         output(message, debug_logger, Level.ERROR)
         return False
 
 
+def store_download(
+    response,
+    library,
+    language_path,
+    resolution,
+    original_filename,
+    alternative_download_directory,
+    download_directory,
+):
+    """Store a torrent unless the library already has a better release of it."""
+    global debug_logger
+    global download_logger
+    global total_downloads
+
+    # Keep only the best resolution/quality of each title: skip this file if
+    # a better release is stored, otherwise remove the ones it supersedes
+    wanted, replaced = library.check(language_path, original_filename)
+    if not wanted:
+        response.close()
+        return False
+    for path in replaced:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        library.remove(path)
+
+    # Combine language and resolution paths
+    alternative_download_path = os.path.join(
+        alternative_download_directory, language_path, resolution
+    )
+    download_path = os.path.join(download_directory, language_path, resolution)
+
+    # Create directories if they don't exist
+    os.makedirs(alternative_download_path, exist_ok=True)
+    os.makedirs(download_path, exist_ok=True)
+
+    # Construct full file paths
+    store_path = os.path.join(alternative_download_path, original_filename)
+    download_path = os.path.join(download_path, original_filename)
+
+    if os.path.exists(store_path):
+        progress.skipped = getattr(progress, "skipped", 0) + 1
+        message = f"File: {original_filename} already exists on store path. \
+            {progress.skipped} skipped since last success. Skipping..."
+        output(message, debug_logger, Level.SKIP)
+        response.close()
+    else:
+        written = write_stream(
+            response, [download_path, store_path], debug_logger, max_torrent_bytes
+        )
+        if written is None:
+            message = f"Failed to save file: {original_filename}"
+            output(message, debug_logger, Level.ERROR)
+            return False
+
+        library.add(store_path)
+
+        with counter_lock:
+            total_downloads += 1
+        progress.skipped = 0
+        message = f"Downloaded file: {original_filename}"
+        output(message, download_logger, Level.SUCCESS)
+    return True
+
+
+def combination_key(resolution, language, release_year, genre):
+    return f"{resolution}/{language}/{release_year}/{genre}"
+
+
+def load_sweep():
+    """Number of the current pass over the combination grid.
+
+    Combinations checkpointed in an older sweep start again at page 1.
+    """
+
+    if state is None or not resume:
+        return 1
+    return state.checkpoint(STATE_SOURCE, "sweep", {"sweep": 1})["sweep"]
+
+
+def load_checkpoint(key, sweep):
+    """Last completed page and done flag of a combination in this sweep."""
+    if state is None or not resume:
+        return 0, False
+    checkpoint = state.checkpoint(STATE_SOURCE, f"combination:{key}")
+    if checkpoint is None or checkpoint.get("sweep") != sweep:
+        return 0, False
+    return checkpoint.get("page", 0), checkpoint.get("done", False)
+
+
+def save_checkpoint(key, sweep, page, done=False):
+    if state is not None:
+        state.save_checkpoint(
+            STATE_SOURCE,
+            f"combination:{key}",
+            {"sweep": sweep, "page": page, "done": done},
+        )
+
+
+def crawl_combination(resolution, language, release_year, genre, sweep, deadline, stop):
+    """Crawl the pages of one combination, from its checkpoint on.
+
+    Runs on a worker thread. Returns `(done, resumed)`; `done` is False when
+    the run's deadline (or another worker hitting it) interrupted the crawl.
+    """
+
+    if stop.is_set():
+        return False, False
+    key = combination_key(resolution, language, release_year, genre)
+    last_page, done = load_checkpoint(key, sweep)
+    if done:
+        return True, False
+    if last_page:
+        message = f"Resuming {key} after page {last_page}"
+        output(message, debug_logger, Level.INFO)
+
+    # Start after the last completed page of this combination
+    language_short = LANGUAGE_MAPPING.get(language, "en")
+    page_number = last_page + 1
+    progress.skipped = 0
+
+    while True:
+        # Calculate if script running time is exceeding max duration
+        if stop.is_set():
+            return False, bool(last_page)
+        if datetime.now() > deadline:
+            message = f"Execution time exceeded {max_duration} minutes"
+            output(message, debug_logger, Level.WARNING)
+            stop.set()
+            return False, bool(last_page)
+
+        # Generate url
+        url = f"browse-movies/0/{resolution}/{genre}/0/featured/{release_year}/{language_short}"
+        if page_number != 1:
+            url = url + f"?page={page_number}"
+
+        # Call the parse_website function
+        result = parse_website(
+            base_urls,
+            url,
+            language,
+            alternative_download_directory,
+            download_directory,
+            page_number,
+            user_agent,
+        )
+
+        # Increase page_number if result succeeded or go to next combination if result is False
+        if progress.skipped >= skipped_threshold and skipped_threshold != 0:
+            message = f"Reached the skipped threshhold of {skipped_threshold} for {key}."
+            output(message, debug_logger, Level.INFO)
+            save_checkpoint(key, sweep, page_number, done=True)
+            return True, bool(last_page)
+        if result is True:
+            save_checkpoint(key, sweep, page_number)
+            page_number += 1
+        else:
+            save_checkpoint(key, sweep, page_number, done=True)
+            return True, bool(last_page)
+
+
 def yts_downloader():
     # Start timer
     start_time = datetime.now()
@@ -264,7 +397,7 @@ def yts_downloader():
     global alternative_download_directory
     global logs_directory
     global prefix
-    global resolution
+    global resolutions
     global languages
     global release_years
     global genres
@@ -276,11 +409,19 @@ def yts_downloader():
     global delay
     global user_agent
     global skipped_threshold
+    global max_torrent_bytes
+    global state_database
+    global resume
+    global library_index_file
+    global combination_workers
 
     # Import global variables
     global debug_logger
     global download_logger
     global random
+    global http_client
+    global extractor
+    global state
 
     # Loading config
     config = read_configuration(config_file_name)
@@ -316,6 +457,20 @@ def yts_downloader():
         user_agent = config["user_agent"]
     if "skipped_threshold" in config:
         skipped_threshold = config["skipped_threshold"]
+    if "max_torrent_bytes" in config:
+        max_torrent_bytes = config["max_torrent_bytes"]
+    if "state_database" in config:
+        state_database = config["state_database"]
+    if "resume" in config:
+        resume = config["resume"]
+    if "library_index_file" in config:
+        library_index_file = config["library_index_file"]
+    if "combination_workers" in config:
+        combination_workers = config["combination_workers"]
+
+    # Shared HTTP client, unless one was injected before the run
+    if http_client is None:
+        http_client = create_client(config, user_agent, delay)
 
     # Loading parser
     if 1 == 2:
@@ -356,9 +511,18 @@ def yts_downloader():
     message = "Script started."
     output(message, debug_logger, Level.INFO)
 
+    if extractor is None:
+        extractor = create_extractor(config, debug_logger)
+    if state is None and state_database:
+        state = open_state(state_database)
+
+    # Index the existing library once instead of walking it for every torrent
+    library = open_library(alternative_download_directory, cache_path=library_index_file)
+    message = f"Library index: {len(library)} files"
+    output(message, debug_logger, Level.INFO)
+
     # Loading variables
     languages = [language.upper() for language in languages]
-    language_mapping = {"ENGLISH": "en", "GERMAN": "de", "SPANISH": "es"}
     converted_max_duration = timedelta(minutes=max_duration)
 
     # Make lists to random order
@@ -400,57 +564,49 @@ def yts_downloader():
     output(message, debug_logger, Level.INFO)
     message = f"Skipped threshold: {skipped_threshold}"
     output(message, debug_logger, Level.INFO)
+    message = f"State database: {state_database}, resume: {resume}"
+    output(message, debug_logger, Level.INFO)
+    message = f"Combination workers: {combination_workers}"
+    output(message, debug_logger, Level.INFO)
 
-    # Fetch pages
-    for resolution in resolutions:
-        for language in languages:
-            language_short = language_mapping.get(language, "en")
-            for release_year in release_years:
-                if release_year == "all":
-                    release_year = "0"
-                for genre in genres:
-                    # Set page_number to 1 for each language and resolution
-                    page_number = 1
-
-                    while True:
-                        # Calculate if script running time is exceeding max duration
-                        current_time = datetime.now()
-                        elapsed_time = current_time - start_time
-                        if elapsed_time > converted_max_duration:
-                            message = f"Execution time exceeded {max_duration} minutes"
-                            output(message, debug_logger, Level.WARNING)
-                            exit()
-
-                        # Generate url
-                        url = f"browse-movies/0/{resolution}/{genre}/0/featured/{release_year}/{language_short}"
-                        if page_number != 1:
-                            url = url + f"?page={page_number}"
-
-                        # Call the parse_website function
-                        result = parse_website(
-                            base_urls,
-                            url,
-                            language,
-                            alternative_download_directory,
-                            download_directory,
-                            page_number,
-                            delay,
-                            user_agent,
-                        )
+    sweep = load_sweep()
+    deadline = start_time + converted_max_duration
+    stop = threading.Event()
+    combinations = [
+        (resolution, language, "0" if release_year == "all" else release_year, genre)
+        for resolution in resolutions
+        for language in languages
+        for release_year in release_years
+        for genre in genres
+    ]
+
+    # Fetch pages; all workers share the HTTP client (and its rate limiter)
+    # and the library index
+    with ThreadPoolExecutor(max_workers=max(1, combination_workers)) as executor:
+        results = list(
+            executor.map(
+                lambda combination: crawl_combination(*combination, sweep, deadline, stop),
+                combinations,
+            )
+        )
+    completed = sum(1 for done, _ in results if done)
+    resumed = sum(1 for _, was_resumed in results if was_resumed)
+    timed_out = stop.is_set()
 
-                        # Increase page_number if result succeeded or go to next resolution if result is False
-                        global skipped_since_last_success
-                        if (
-                            skipped_since_last_success >= skipped_threshold
-                            and skipped_threshold != 0
-                        ):
-                            message = f"Reached the skipped threshhold of {skipped_threshold}."
-                            output(message, debug_logger, Level.INFO)
-                            break
-                        if result is True:
-                            page_number += 1
-                        else:
-                            break
+    total = len(combinations)
+    message = f"Sweep {sweep}: {completed}/{total} combinations done, {resumed} resumed"
+    output(message, debug_logger, Level.INFO)
+    if state is not None and resume and not timed_out and completed >= total:
+        # Watermark: every combination finished, the next run starts a new sweep
+        state.save_checkpoint(
+            STATE_SOURCE,
+            "sweep",
+            {"sweep": sweep + 1, "previous_completed_at": datetime.now().isoformat()},
+        )
+        message = f"Sweep {sweep} complete, next run starts sweep {sweep + 1}"
+        output(message, debug_logger, Level.INFO)
+
+    library.save()
 
     # Stop timer
     end_time = datetime.now()
@@ -459,6 +615,8 @@ def yts_downloader():
     time_difference = str(end_time - start_time)
     message = f"Script finished. Duration: {time_difference}, Downloads: {str(total_downloads)}"
     output(message, debug_logger, Level.INFO)
+    message = f"Request outcomes: {http_client.retry_policy.summary()}"
+    output(message, debug_logger, Level.INFO)
 
 
 if __name__ == "__main__":